@@ -1,211 +1,397 @@
 import sys
-import pyperclip
-from ipa import PUNCTUATION, remove_punctuation, german_to_ipa
-from gender.gender import get_gender_of_word
-from _remove_joining_chars import remove_joining_chars
-
-
-def process_sentence(german_text: str, color_by_gender: bool):
-    DER_SPAN = '<span class="der-noun">'
-    DIE_SPAN = '<span class="die-noun">'
-    DAS_SPAN = '<span class="das-noun">'
-    PLURAL_DER_SPAN = '<span class="plural-der-noun">'
-    PLURAL_DIE_SPAN = '<span class="plural-die-noun">'
-    PLURAL_DAS_SPAN = '<span class="plural-das-noun">'
-    PLURAL_ONLY_SPAN = '<span class="plural-only-noun>'
-    SINGULAR_INFINITIVE_SPAN = '<span class="verb-no-plural-noun">'
-    german_text = german_text.strip()
-    full_ipa = german_to_ipa(german_text)
-    words = german_text.split()
-    transcriptions = full_ipa.split()
-
-    word_results = []
-    ipa_results = []
-
-    if color_by_gender and len(words) == len(transcriptions):
-        SKIPPED_TERMS = [
-            "ich",
-            "du",
-            "er",
-            "wir",
-            "sie",
-            "ihr",
-            "ihm",
-            "ihn",
-            "ihnen",
-            "ihren",
-            "sein",
-            "seinen",
-            "seine",
-            "ihre",
-            "es",
-            "das",
-            "der",
-            "die",
-            "und",
-            "aber",
-            "noch",
-            "ein",
-            "eine",
-            "eines",
-            "einer",
-            "einen",
-            "einem",
-        ]
-        last_stripped_words = []
-        for i, (word, ipa) in enumerate(zip(words, transcriptions)):
-            word = word.strip()
-            no_punctuation = remove_punctuation(word).strip()
-            if (
-                word[0].isalpha()
-                and word[0].isupper()
-                and not no_punctuation.lower() in SKIPPED_TERMS
-            ):  # noun.
-                last_words = " ".join(last_stripped_words[-5:])
-                genders, confidence = get_gender_of_word(
-                    no_punctuation,
-                    last_words,
-                    can_be_inf_verb=True,
-                )
-                is_infinitive = len(genders) > 0 and genders[0] == "v+"
-                if len(genders) == 0 or (len(genders) == 1 and is_infinitive):
-                    changed_end_n = False
-                    if (
-                        len(no_punctuation) > 1
-                        and no_punctuation.endswith("n")
-                        and no_punctuation[-2] in "ehlr"
-                    ):
-                        new_genders, new_confidence = get_gender_of_word(
-                            no_punctuation[:-1],
-                            last_words,
-                            can_be_inf_verb=False,  # b/c shortened
-                        )
-                        if new_confidence >= 80 and new_confidence >= confidence:
-                            genders, confidence = new_genders, new_confidence
-                            changed_end_n = True
-
-                    elif no_punctuation.endswith("es"):
-                        new_genders, new_confidence = get_gender_of_word(
-                            no_punctuation[:-2],
-                            last_words,
-                            can_be_inf_verb=False,  # b/c shortened
-                        )
-                        if (
-                            new_confidence >= 80
-                            and new_confidence >= confidence
-                            and any(g[:2] in ["sm", "sn"] for g in new_genders)
-                        ):
-                            genders, confidence = (
-                                new_genders,
-                                new_confidence,
-                            )  # assumed genitiv.
-
-                    if no_punctuation.endswith("s") and len(genders) == 0:
-                        new_genders, new_confidence = get_gender_of_word(
-                            no_punctuation[:-1],
-                            last_words,
-                            can_be_inf_verb=(
-                                len(no_punctuation) > 1 and no_punctuation[-2] == "n"
-                            ),
-                        )
-                        if (
-                            new_confidence >= 80
-                            and new_confidence >= confidence
-                            and any(g[:2] in ["sm", "sn", "v+"] for g in new_genders)
-                        ):
-                            genders, confidence = (
-                                new_genders,
-                                new_confidence,
-                            )  # assumed genitiv.
-
-                    if confidence < 90 and no_punctuation.endswith("en"):
-                        new_genders, new_confidence = get_gender_of_word(
-                            no_punctuation[:-2],
-                            last_words,
-                            can_be_inf_verb=False,
-                        )
-                        if new_confidence >= 80 and new_confidence >= confidence:
-                            genders, confidence = new_genders, new_confidence
-                            changed_end_n = True
-
-                    if changed_end_n and is_infinitive and "v+" not in genders:
-                        genders.append("v+")
-
-                is_plural = len(genders) > 0 and genders[0].startswith("p")
-
-                if len(genders) == 0:
-                    span = None
-                elif not is_plural and confidence < 80:
-                    span = None
-                elif genders[0] == "v+":
-                    span = SINGULAR_INFINITIVE_SPAN
-                elif genders[0][1] == "m":
-                    span = PLURAL_DER_SPAN if is_plural else DER_SPAN
-                elif genders[0][1] == "f":
-                    span = PLURAL_DIE_SPAN if is_plural else DIE_SPAN
-                elif genders[0][1] == "n":
-                    span = PLURAL_DAS_SPAN if is_plural else DAS_SPAN
-                elif genders[0][1] == "o":
-                    span = PLURAL_ONLY_SPAN
-                else:
-                    span = None
+from pathlib import Path
+from _batch_tuner import DEFAULT_MAX_LATENCY, parse_auto
+from _checkpoint import (
+    DEFAULT_CHECKPOINT_EVERY,
+    CheckpointedRun,
+    Quarantine,
+    checkpoint_paths,
+)
+from _compressed_io import (
+    check_compression,
+    compression_of,
+    open_text,
+    parse_compression,
+    without_compression,
+)
+from _daemon import forward
+from _html_writer import HtmlDocumentWriter
+from _segment import DEFAULT_BATCH_SIZE, split_sentences
+from _result_store import DEFAULT_STORE_PATH, ResultStore
+from tagging import tag_genders
+
+# Anything that transcribes text (convert, _watch) is imported in main()
+# only when it's needed, so that --gender-only never loads eSpeak
+# (and pyperclip too, so forwarding to the daemon starts quickly).
+
+
+def get_lines_from_clipboard(batch_size: int = DEFAULT_BATCH_SIZE) -> list:
+    """
+    Returns the sentences of the clipboard's contents, one per line.
+    """
+    import pyperclip
+
+    return split_sentences(pyperclip.paste().strip(), max_tokens=batch_size)
+
+
+def pop_option(args: list, name: str, default=None):
+    """
+    Removes the option `name` and the value following it from `args`
+    and returns that value (or the `default` if the option wasn't given).
+    """
+    if name not in args:
+        return default
+
+    i = args.index(name)
+    if i + 1 >= len(args):
+        print(f"ERROR: {name} needs a value.")
+        sys.exit(1)
 
-                if span is None:
-                    word_results.append(word)
-                    ipa_results.append(ipa)
-                else:
-                    puncts = ""
-                    while any(word.endswith(c) for c in PUNCTUATION):
-                        puncts += word[-1]
-                        word = word[:-1]
-                    while any(ipa.endswith(c) for c in PUNCTUATION):
-                        ipa = ipa[:-1]
-                    word_results.append(f"{span}{word}</span>{puncts}")
-                    ipa_results.append(f"{span}{ipa}</span>{puncts}")
-            else:
-                word_results.append(word)
-                ipa_results.append(ipa)
+    value = args[i + 1]
+    del args[i : i + 2]
+    return value
+
+
+def iter_file_lines(file_path: str):
+    """
+    Yields the stripped lines of the (possibly compressed) text file
+    one at a time.
+    """
+    with open_text(file_path) as file:
+        for line in file:
+            yield line.strip()
+
+
+def get_output_path(file_path: str, extension: str, suffix: str = "-ipa") -> Path:
+    """
+    Returns the path results for the given input file are saved to
+    (mytext.txt -> mytext-ipa.txt, mytext.txt.gz -> mytext-ipa.txt).
+    """
+    path = without_compression(file_path)
+    return path.with_name(f"{path.stem}{suffix}{extension}")
+
+
+def write_html_document(results, output_path) -> None:
+    """
+    Streams the (word_line, ipa_line) results as they come
+    as a complete HTML document to `output_path`, or to stdout if it's None.
+    """
+    if output_path is None:
+        stream = sys.stdout
+    else:
+        stream = open(output_path, "w", encoding="utf-8", buffering=1 << 16)
+
+    try:
+        with HtmlDocumentWriter(stream) as writer:
+            for word_line, ipa_line in results:
+                writer.write_line(word_line, ipa_line)
+    finally:
+        if output_path is not None:
+            stream.close()
+
+
+def report_store(store) -> None:
+    """
+    Prints how many sentences were taken from the result store, if any.
+    """
+    if store is not None:
+        total = store.hits + store.misses
+        print(f"Reused {store.hits} of {total} sentences.", file=sys.stderr)
+        store.close()
+
+
+def start_checkpointed_run(
+    input_path, output_path, options: dict, byte_range, every: int, resume: bool
+) -> CheckpointedRun:
+    """
+    Returns the run converting `input_path` into `output_path`,
+    continued from its last checkpoint if `resume`.
+    """
+    run = CheckpointedRun(input_path, output_path, options, byte_range, every)
+    if resume:
+        try:
+            resumed = run.resume()
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+        if resumed:
+            print(f"Resuming after line {run.lines} of {input_path}.", file=sys.stderr)
+        else:
+            print(f"No checkpoint for {output_path}, starting over.", file=sys.stderr)
+    elif run.has_checkpoint():
+        print(
+            f"ERROR: {run.checkpoint_path} exists. Use --resume to continue "
+            "that run, or delete it to start over."
+        )
+        sys.exit(1)
+    return run
+
+
+def report_quarantine(quarantine) -> None:
+    """
+    Prints how many sentences were quarantined, if any.
+    """
+    if quarantine is not None and quarantine.count > 0:
+        print(
+            f"Quarantined {quarantine.count} sentences in {quarantine.path}.",
+            file=sys.stderr,
+        )
+
+
+def start_metrics(path, json_path) -> None:
+    """
+    Starts recording metrics and writing them to the files every
+    FLUSH_INTERVAL seconds, and once more when the program exits
+    (however it does).
+    """
+    import atexit
+
+    from _metrics import MetricsFlusher
+
+    flusher = MetricsFlusher(path, json_path)
+    atexit.register(flusher.close)
+
+
+def merge_shards(args: list) -> None:
+    """
+    Handles `merge <file_path>`: joins the output parts of every shard
+    of the file into the output a single run would have written.
+    """
+    from _shard import merge
+
+    html_document = "--html-doc" in args
+    suffix = "-genders" if "--gender-only" in args else "-ipa"
+    paths = [arg for arg in args if not arg.startswith("--")]
+    if len(paths) != 1:
+        print("Usage: python german2ipa merge <File_path> [--html-doc] [--gender-only]")
+        sys.exit(1)
 
-            if any(word.endswith(c) for c in PUNCTUATION):
-                last_stripped_words = []
-            else:
-                last_stripped_words.append(no_punctuation)
+    parts_path = get_output_path(paths[0], ".txt", suffix)
+    extension = ".html" if html_document else ".txt"
+    output_path = get_output_path(paths[0], extension, suffix)
+    try:
+        num_lines = merge(paths[0], parts_path, output_path, html_document)
+    except (ValueError, OSError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    print(f"Merged {num_lines} lines into {output_path}.", file=sys.stderr)
+
+
+RHYMES_USAGE = """\
+Usage: python german2ipa rhymes <command> [--index <path>]
+\tbuild [<File_path> ...] [--nouns] to index the words of text files
+\t\t(and the bundled nouns, which are indexed if no file is given).
+\tending <IPA> [--exact] for the words whose IPA ends like that.
+\tmatch <pattern> [--exact] for the words whose IPA matches, e.g. 'ʃt*ʊŋ'.
+\tword <German word> for the words that rhyme with it."""
 
-        words_str = " ".join(word_results)
-        ipa_str = " ".join(ipa_results)
-        words_str, _ = remove_joining_chars(words_str, "")
-        return (words_str, ipa_str)
 
-    """ Get rid of hyphens. """
+def rhymes(args: list) -> None:
+    """
+    Handles `rhymes ...`: builds or queries the pronunciation index.
+    """
+    import time
 
-    german_text, _ = remove_joining_chars(german_text, "")
+    from _rhymes import DEFAULT_INDEX_PATH, RhymeIndex
 
-    return (german_text, full_ipa)
+    index_path = pop_option(args, "--index", DEFAULT_INDEX_PATH)
+    flags = {arg for arg in args if arg.startswith("--")}
+    args = [arg for arg in args if not arg.startswith("--")]
+    if len(args) == 0 or (args[0] != "build" and len(args) != 2):
+        print(RHYMES_USAGE)
+        sys.exit(1)
+
+    command = args[0]
+    if command == "build":
+        from itertools import chain
+
+        from _rhymes import (
+            build_index,
+            noun_words,
+            transcribe_corpus,
+            transcribe_words,
+        )
+
+        pairs = transcribe_corpus(args[1:])
+        if len(args) == 1 or "--nouns" in flags:
+            pairs = chain(transcribe_words(noun_words()), pairs)
+        num_pairs = build_index(index_path, pairs)
+        print(f"Indexed {num_pairs} words in {index_path}.", file=sys.stderr)
+        return
+
+    try:
+        index = RhymeIndex(index_path)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e} Build the index with `rhymes build` first.")
+        sys.exit(1)
 
+    if command == "word":
+        from ipa import german_to_ipa
+        from _punctuation import PUNCTUATION
+
+        word_ipa = german_to_ipa(args[1]).strip(PUNCTUATION)
+
+    start = time.perf_counter()
+    if command == "ending":
+        results = index.ending(args[1], fuzzy="--exact" not in flags)
+    elif command == "match":
+        results = index.matching(args[1], fuzzy="--exact" not in flags)
+    elif command == "word":
+        results = [
+            (word, ipa) for word, ipa in index.rhymes(word_ipa) if word != args[1]
+        ]
+    else:
+        print(RHYMES_USAGE)
+        sys.exit(1)
+    elapsed = (time.perf_counter() - start) * 1000
 
-def get_lines_from_clipboard() -> list:
-    in_clipboard = pyperclip.paste().strip()
-    for char in ["\n", ". ", "! ", "? "]:
-        in_clipboard = in_clipboard.replace(char, f"{char}ſ")
+    for word, ipa in results:
+        print(f"{word}\t{ipa}")
+    print(f"{len(results)} words ({elapsed:.2f} ms).", file=sys.stderr)
 
-    lines = in_clipboard.split("ſ")
-    return lines
 
+def start_daemon() -> None:
+    """
+    Runs the daemon that later command lines are forwarded to, until Ctrl+C.
+    """
+    from _daemon import serve
 
-def main():
+    try:
+        serve(main)
+    except OSError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+
+def main(argv: list = None):
+    """
+    Runs the command line `argv` (by default the program's own),
+    which is forwarded to the daemon if one is running.
+    """
     save_to_file = False
-    if len(sys.argv) < 2:
+    compressed_job = False
+    if argv is None:
+        argv = sys.argv[1:]
+        if "--daemon" in argv:
+            start_daemon()
+            return
+        exit_code = forward(argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    if len(argv) < 1:
         print("Usage: python ipa.py <German_text> or <File_path>.")
         print("\t-v to use clipboard's contents")
         print("\t-x to write results to clipboard.")
+        print("\t--html to style nouns by their gender.")
+        print("\t--html-doc to stream a complete HTML document.")
+        print("\t--batch-size <n> for the max number of words per eSpeak call.")
+        print("\t--batch-size auto[:<min>-<max>] to tune it while a file is converted.")
+        print("\t--max-latency <s> for the most seconds per eSpeak call with auto.")
+        print("\t--incremental to reuse results of sentences that haven't changed.")
+        print("\t--store <path> for the file those results are kept in.")
+        print("\t--watch <path> to re-render a text file whenever it's saved.")
+        print("\t--gender-only to only style nouns by their gender (no IPA).")
+        print("\t--stats to print how busy each stage of a file's conversion was.")
+        print("\t--profile <full|no-stress|raw-normalised> for how refined the IPA is.")
+        print("\t--shard <i/N> to only convert the i-th of N parts of a file.")
+        print("\tmerge <File_path> to join the parts of every shard of a file.")
+        print("\trhymes ... to search words by how they end or sound (see rhymes).")
+        print("\t--resume to continue a file's conversion from its last checkpoint.")
+        print("\t--checkpoint-every <n> for the lines between checkpoints (0: none).")
+        print("\t--columnar to write a file's results as a memory-mappable file.")
+        print("\t--compress <gz|bz2|xz|zst|none> to compress a file's output.")
+        print("\t--metrics <path.prom> to write metrics for node_exporter's textfile.")
+        print("\t--metrics-json <path> to also write them as a JSON snapshot.")
+        print("\t--daemon to keep everything loaded for the calls after it.")
         sys.exit(1)
 
     else:
-        german_text = " ".join(sys.argv[1:])
+        args = list(argv)
+        if args[0] == "merge":
+            merge_shards(args[1:])
+            return
+        if args[0] == "rhymes":
+            rhymes(args[1:])
+            return
+
+        batch_size = pop_option(args, "--batch-size", str(DEFAULT_BATCH_SIZE))
+        max_latency = pop_option(args, "--max-latency", str(DEFAULT_MAX_LATENCY))
+        try:
+            max_latency = float(max_latency)
+        except ValueError:
+            print(
+                f"ERROR: --max-latency needs seconds, like 0.5 (got {max_latency!r})."
+            )
+            sys.exit(1)
+        try:
+            tuner = parse_auto(batch_size, max_latency)
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+        if tuner is not None:
+            batch_size = DEFAULT_BATCH_SIZE
+        elif batch_size.isdigit() and int(batch_size) > 0:
+            batch_size = int(batch_size)
+        else:
+            print(
+                "ERROR: --batch-size needs a number of words or auto[:<min>-<max>] "
+                f"(got {batch_size!r})."
+            )
+            sys.exit(1)
+        store_path = pop_option(args, "--store")
+        watch_path = pop_option(args, "--watch")
+        profile = pop_option(args, "--profile", "full")
+        shard = pop_option(args, "--shard")
+        checkpoint_every = pop_option(
+            args, "--checkpoint-every", str(DEFAULT_CHECKPOINT_EVERY)
+        )
+        if not checkpoint_every.isdigit():
+            print(
+                "ERROR: --checkpoint-every needs a number of lines, or 0 for none "
+                f"(got {checkpoint_every!r})."
+            )
+            sys.exit(1)
+        checkpoint_every = int(checkpoint_every)
+        compress = pop_option(args, "--compress")
+        metrics_path = pop_option(args, "--metrics")
+        metrics_json_path = pop_option(args, "--metrics-json")
+        if metrics_path is not None or metrics_json_path is not None:
+            start_metrics(metrics_path, metrics_json_path)
+        german_text = " ".join(args)
         to_clipboard = False
         from_clipboard = False
         color_by_gender = False
-
+        html_document = False
+        incremental = store_path is not None
+        gender_only = False
+        show_stats = False
+        resume = False
+        columnar = False
+        run = None
+        quarantine = None
+
+        if "--stats" in german_text:
+            german_text = german_text.replace("--stats", "")
+            show_stats = True
+        if "--resume" in german_text:
+            german_text = german_text.replace("--resume", "")
+            resume = True
+        if "--gender-only" in german_text:
+            german_text = german_text.replace("--gender-only", "")
+            gender_only = True
+        if "--incremental" in german_text:
+            german_text = german_text.replace("--incremental", "")
+            incremental = True
+
+        if "--columnar" in german_text:
+            german_text = german_text.replace("--columnar", "")
+            color_by_gender = True  # the gender of every word is a column.
+            columnar = True
+        if "--html-doc" in german_text:
+            german_text = german_text.replace("--html-doc", "")
+            color_by_gender = True
+            html_document = True
         if "--html" in german_text:
             german_text = german_text.replace("--html", "")
             color_by_gender = True
@@ -228,20 +414,227 @@ def main():
                 to_clipboard = True
 
         german_text = german_text.replace("  ", " ").strip()
+        if not gender_only:
+            from ipa import check_profile
+
+            try:
+                check_profile(profile)
+            except ValueError as e:
+                print(f"ERROR: {e}")
+                sys.exit(1)
+
+        if watch_path is not None:
+            from _watch import watch
+
+            extension = ".html" if html_document else ".txt"
+            suffix = "-genders" if gender_only else "-ipa"
+            output_path = get_output_path(watch_path, extension, suffix)
+            watch(
+                watch_path,
+                output_path,
+                color_by_gender,
+                html_document,
+                batch_size,
+                profile,
+                gender_only,
+            )
+            return
+
         if from_clipboard:
-            lines = get_lines_from_clipboard()
-        elif len(sys.argv[1:]) == 1 and ".txt" in german_text:  # is path.
-            with open(german_text, "r", encoding="utf-8") as file:
-                lines = [line.strip() for line in file]
-                save_to_file = True
+            lines = get_lines_from_clipboard(batch_size)
+        elif (
+            ".txt" in german_text or compression_of(german_text) is not None
+        ) and Path(german_text).is_file():  # is path.
+            save_to_file = True
+            suffix = "-genders" if gender_only else "-ipa"
+            byte_range = None
+            output_compression = compression_of(german_text)
+            try:
+                if compress is not None:
+                    output_compression = parse_compression(compress)
+                check_compression(compression_of(german_text))
+                check_compression(output_compression)
+            except (ValueError, ImportError) as e:
+                print(f"ERROR: {e}")
+                sys.exit(1)
+            compressed_job = (
+                compression_of(german_text) is not None
+                or output_compression is not None
+            )
+            if shard is not None and (
+                compression_of(german_text) is not None
+                or output_compression is not None
+            ):
+                # Shards are byte ranges of the input, and merge joins the parts.
+                print("ERROR: --shard can't be used with compressed files.")
+                sys.exit(1)
+            if shard is not None:
+                from _shard import parse_shard, part_paths, shard_range
+
+                try:
+                    shard = parse_shard(shard)
+                except ValueError as e:
+                    print(f"ERROR: {e}")
+                    sys.exit(1)
+                byte_range = shard_range(german_text, *shard)
+
+            if columnar and (
+                shard is not None
+                or html_document
+                or resume
+                or compress not in (None, "none")
+            ):
+                print(
+                    "ERROR: --columnar can't be used with --shard, --html-doc, "
+                    "--resume or --compress."
+                )
+                sys.exit(1)
+            if columnar:
+                output_path = get_output_path(german_text, ".cols", suffix)
+                quarantine = Quarantine(checkpoint_paths(output_path)[2])
+                lines = iter_file_lines(german_text)
+            elif to_clipboard and shard is None:
+                lines = iter_file_lines(german_text)
+            else:
+                # Written files are checkpointed, so they can be resumed.
+                if shard is not None:
+                    output_path = get_output_path(german_text, ".txt", suffix)
+                    output_path = part_paths(output_path, *shard)[0]
+                else:
+                    extension = ".html" if html_document else ".txt"
+                    extension += output_compression or ""
+                    output_path = get_output_path(german_text, extension, suffix)
+                options = {
+                    "html": color_by_gender,
+                    "html_doc": html_document and shard is None,
+                    "gender_only": gender_only,
+                    "profile": profile,
+                }
+                run = start_checkpointed_run(
+                    german_text,
+                    output_path,
+                    options,
+                    byte_range,
+                    checkpoint_every,
+                    resume,
+                )
+                lines = run.iter_lines()
+                quarantine = run.quarantine
         else:
             lines = [
                 german_text,
             ]
 
-    results = [
-        process_sentence(line, color_by_gender=color_by_gender) for line in lines
-    ]
+    store = None
+    stats = None
+    if gender_only:
+        results = ((tag_genders(line), None) for line in lines)
+    else:
+        if incremental:
+            options = "html" if color_by_gender else ""
+            if profile != "full":  # keeps the results stored before profiles.
+                options = f"{options} {profile}".strip()
+            store = ResultStore(store_path or DEFAULT_STORE_PATH, options=options)
+
+        if save_to_file:
+            # Files are converted in a pipeline, so eSpeak never waits
+            # for the post-processing of the lines before.
+            from _pipeline import PipelineStats, convert_lines_pipelined
+
+            stats = PipelineStats()
+            results = convert_lines_pipelined(
+                lines,
+                color_by_gender,
+                batch_size,
+                store=store,
+                stats=stats,
+                profile=profile,
+                on_error=None if quarantine is None else quarantine.add,
+                tuner=tuner,
+            )
+        else:
+            from convert import convert_lines
+
+            results = convert_lines(
+                lines,
+                color_by_gender,
+                batch_size,
+                store=store,
+                profile=profile,
+                tuner=tuner,
+            )
+
+    suffix = "-genders" if gender_only else "-ipa"
+    if columnar:
+        if not save_to_file:
+            print("ERROR: --columnar needs a text file.")
+            sys.exit(1)
+
+        from _columnar import ColumnarWriter
+
+        # Written as the lines come, so the results are never all in memory.
+        with ColumnarWriter(output_path) as writer:
+            writer.write_many(results)
+        quarantine.close()
+        report_store(store)
+        report_quarantine(quarantine)
+        if show_stats and stats is not None:
+            stats.report()
+        print(f"Wrote {writer.num_lines} lines to {output_path}.", file=sys.stderr)
+        return
+
+    if shard is not None:
+        if not save_to_file:
+            print("ERROR: --shard needs a text file.")
+            sys.exit(1)
+
+        from _shard import write_manifest
+
+        for _ in run.write(results, words_only=gender_only):
+            pass
+        output_path = get_output_path(german_text, ".txt", suffix)
+        manifest = write_manifest(
+            german_text, output_path, shard, byte_range, run.lines
+        )
+        report_store(store)
+        report_quarantine(quarantine)
+        if show_stats and stats is not None:
+            stats.report()
+        print(
+            f"Wrote shard {shard[0]}/{shard[1]} ({manifest['lines']} lines) "
+            f"to {manifest['part']}.",
+            file=sys.stderr,
+        )
+        return
+
+    if html_document or (run is not None and compressed_job):
+        # Written as the lines come, so the results are never all in memory
+        # (compressed files are too large to print as well).
+        if run is None:
+            write_html_document(results, None)
+        else:
+            for _ in run.write(
+                results, html_document=html_document, words_only=gender_only
+            ):
+                pass
+        report_store(store)
+        report_quarantine(quarantine)
+        if show_stats and stats is not None:
+            stats.report()
+        if compressed_job:
+            print(f"Wrote {run.lines} lines to {output_path}.", file=sys.stderr)
+        return
+
+    if run is not None:
+        results = run.write(results, words_only=gender_only)
+    results = list(results)
+    report_store(store)
+    report_quarantine(quarantine)
+    if show_stats and stats is not None:
+        stats.report()
+    if len(results) == 0:  # a resumed run that had nothing left.
+        return
+
     word_lines, ipa_lines = zip(*results)
     word_lines = list(word_lines)
     ipa_lines = list(ipa_lines)
@@ -250,27 +643,24 @@ def main():
         if len(lines) == 1:
             return lines[0]
 
-        html = "<ul>\n"
-        for i, line in enumerate(lines):
-            html += f"<li>{line}</li>\n"
-        html += "</ul>"
-
-        return html
+        items = "".join(f"<li>{line}</li>\n" for line in lines)
+        return f"<ul>\n{items}</ul>"
 
     word_str = lines_to_str(word_lines)
-    ipa_str = lines_to_str(ipa_lines)
+    ipa_str = "" if gender_only else lines_to_str(ipa_lines)
 
-    print(word_str, end="\n\n")
-    print(ipa_str)
+    if gender_only:
+        print(word_str)
+        copy_str = word_str
+    else:
+        print(word_str, end="\n\n")
+        print(ipa_str)
+        copy_str = word_str + "\n\n" + ipa_str
 
     if to_clipboard:
-        copy_str = word_str + "\n\n" + ipa_str
-        pyperclip.copy(copy_str)
+        import pyperclip
 
-    elif save_to_file:
-        with open("mytext-ipa.txt", "w", encoding="utf-8") as file:
-            for result in results:
-                file.write(result + "\n")
+        pyperclip.copy(copy_str)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,205 @@
+"""
+File: _batch_tuner.py
+
+Description: Tunes the number of tokens per eSpeak call while a run goes on
+             (--batch-size auto), since the best one depends on the text
+             and the machine: small batches pay phonemizer's overhead per call
+             too often, and large ones only add to each call's latency.
+
+    The sizes tried double from `min_tokens` up to `max_tokens`.
+    Every call's tokens and seconds are recorded for the size it was made at,
+    and once WINDOW calls have been made at the current size, their words/s
+    is compared with the sizes next to it: the tuner moves to a neighbour
+    that's faster by more than TOLERANCE, tries a neighbour it hasn't measured
+    yet, or stays. Measurements only cover the last WINDOW calls of a size,
+    and those of the neighbours are dropped every EXPLORE_EVERY windows of
+    staying, so the size follows the text if its sentences change.
+    A size at which a call took longer than `max_latency` seconds
+    is never used again, and neither is any size above it.
+
+"""
+
+import sys
+import threading
+from collections import deque
+
+from _segment import DEFAULT_BATCH_SIZE
+
+DEFAULT_MIN_TOKENS = 25
+DEFAULT_MAX_TOKENS = 1600
+DEFAULT_MAX_LATENCY = 1.0  # seconds per eSpeak call.
+WINDOW = 8  # calls measured before each decision.
+TOLERANCE = 0.05  # how much faster a neighbour has to be to move to it.
+EXPLORE_EVERY = 16  # windows of staying before the neighbours are measured again.
+
+
+class _SizeStats:
+    # The calls made at one size: all of them, and the last WINDOW.
+
+    def __init__(self):
+        self.calls = 0
+        self.tokens = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.window = deque(maxlen=WINDOW)
+
+    def record(self, num_tokens: int, seconds: float) -> None:
+        self.calls += 1
+        self.tokens += num_tokens
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.window.append((num_tokens, seconds))
+
+    def throughput(self):
+        """
+        Returns the words/s of the last WINDOW calls, or None
+        if there haven't been that many since it was last reset.
+        """
+        if len(self.window) < WINDOW:
+            return None
+        seconds = sum(seconds for _, seconds in self.window)
+        return sum(tokens for tokens, _ in self.window) / max(seconds, 1e-9)
+
+
+class BatchSizeTuner:
+    """
+    Picks the tokens per eSpeak call from what the calls before took.
+    Pass the tuner as `max_tokens` to `_segment.batch_segments`, which calls it
+    for the size of every batch, and `record` every one of those batches,
+    in the same order (the ones without anything to phonemize too).
+    It's safe to do both from different threads.
+    Raises ValueError if the bounds are out of order.
+    """
+
+    def __init__(
+        self,
+        min_tokens: int = DEFAULT_MIN_TOKENS,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        max_latency: float = DEFAULT_MAX_LATENCY,
+        start: int = DEFAULT_BATCH_SIZE,
+    ):
+        if not 0 < min_tokens <= max_tokens:
+            raise ValueError(
+                f"The batch size bounds must be 0 < min <= max "
+                f"(got {min_tokens}-{max_tokens})."
+            )
+        self.sizes = [min_tokens]
+        while self.sizes[-1] * 2 <= max_tokens:
+            self.sizes.append(self.sizes[-1] * 2)
+        self.max_latency = max_latency
+        self.stats = [_SizeStats() for _ in self.sizes]
+        self.limit = len(self.sizes) - 1  # the largest size that may be used.
+        start = min(max(start, min_tokens), max_tokens)
+        self.index = max(i for i, size in enumerate(self.sizes) if size <= start)
+        self._pending = deque()  # the size of every batch not recorded yet.
+        self._calls_here = 0
+        self._windows_stayed = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self.sizes[self.index]
+
+    def __call__(self) -> int:
+        """
+        Returns the size of the next batch.
+        """
+        with self._lock:
+            self._pending.append(self.index)
+            return self.size
+
+    def record(self, num_tokens: int, seconds: float) -> None:
+        """
+        Records that the oldest batch not recorded yet had `num_tokens`
+        tokens to phonemize, which took `seconds`, and moves on
+        to another size once there are enough calls at this one.
+        """
+        with self._lock:
+            index = self._pending.popleft() if self._pending else self.index
+            if num_tokens == 0:  # all of it was in the result store.
+                return
+            self.stats[index].record(num_tokens, seconds)
+            if seconds > self.max_latency and index > 0:
+                self.limit = min(self.limit, index - 1)
+                if self.index > self.limit:
+                    self._move(self.limit)
+            elif index == self.index:
+                self._calls_here += 1
+                if self._calls_here >= WINDOW:
+                    self._decide()
+
+    def _move(self, index: int) -> None:
+        self.index = index
+        self._calls_here = 0
+        self._windows_stayed = 0
+
+    def _decide(self) -> None:
+        here = self.stats[self.index].throughput()
+        neighbours = [
+            i for i in (self.index + 1, self.index - 1) if 0 <= i <= self.limit
+        ]
+        throughputs = [(self.stats[i].throughput(), i) for i in neighbours]
+        measured = [(throughput, i) for throughput, i in throughputs if throughput]
+        if len(measured) > 0 and max(measured)[0] > here * (1 + TOLERANCE):
+            self._move(max(measured)[1])
+            return
+        unmeasured = [i for throughput, i in throughputs if throughput is None]
+        if len(unmeasured) > 0:
+            self._move(unmeasured[0])
+            return
+
+        self._calls_here = 0
+        self._windows_stayed += 1
+        if self._windows_stayed >= EXPLORE_EVERY:
+            for i in neighbours:
+                self.stats[i].window.clear()
+            self._windows_stayed = 0
+
+    def report(self, file=None) -> None:
+        """
+        Prints the words/s of every size that was tried, and the chosen one.
+        """
+        if file is None:  # looked up now, in case it's been redirected.
+            file = sys.stderr
+        print(
+            f"Batch size tuner ({self.sizes[0]}-{self.sizes[-1]} tokens, "
+            f"at most {self.max_latency:g} s per call):",
+            file=file,
+        )
+        if all(stats.calls == 0 for stats in self.stats):
+            print("\tNo eSpeak calls were needed.", file=file)
+            return
+        print(
+            f"\t{'tokens':>8}{'calls':>8}{'words/s':>10}{'max s':>8}",
+            file=file,
+        )
+        for size, stats in zip(self.sizes, self.stats):
+            if stats.calls == 0:
+                continue
+            throughput = stats.tokens / max(stats.seconds, 1e-9)
+            chosen = "  <- chosen" if size == self.size else ""
+            print(
+                f"\t{size:>8}{stats.calls:>8}{throughput:>10.0f}"
+                f"{stats.max_seconds:>8.3f}{chosen}",
+                file=file,
+            )
+
+
+def parse_auto(value: str, max_latency: float = DEFAULT_MAX_LATENCY):
+    """
+    Returns a tuner for a --batch-size value of "auto" or "auto:<min>-<max>",
+    or None for any other value.
+    Raises ValueError if the bounds can't be read.
+    """
+    if not value.startswith("auto"):
+        return None
+    bounds = value[len("auto") :]
+    if len(bounds) == 0:
+        return BatchSizeTuner(max_latency=max_latency)
+    try:
+        min_tokens, max_tokens = map(int, bounds.lstrip(":").split("-"))
+    except ValueError:
+        raise ValueError(
+            f"--batch-size needs auto:<min>-<max>, like auto:25-1600 (got {value!r})."
+        ) from None
+    return BatchSizeTuner(min_tokens, max_tokens, max_latency)
@@ -0,0 +1,270 @@
+"""
+File: _checkpoint.py
+
+Description: Checkpoints the conversion of a text file, so that a run
+             that died can be continued where it left off with --resume.
+
+    The output is written to mytext-ipa.txt.partial, which is renamed to
+    mytext-ipa.txt once every line is done. Every `every` lines (and at least
+    every CHECKPOINT_SECONDS), the partial output is flushed to disk and
+    mytext-ipa.txt.checkpoint.json is replaced atomically with how far
+    the input and the output got. Resuming cuts the partial output back to
+    that point and carries on with the input line after it, so the finished
+    file is byte-identical to the one an uninterrupted run writes.
+    The result store (--incremental) commits every batch it's given,
+    so it's never behind a checkpoint.
+    A compressed output can't be cut back to a checkpoint, so it's
+    never checkpointed; a compressed input is read up to the checkpoint.
+
+    A sentence that raises is written to mytext-ipa.quarantine.txt
+    with its error instead of stopping the run, and its text is kept
+    in the output without IPA.
+
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from _compressed_io import (
+    compression_of,
+    open_binary,
+    open_text,
+    skip_to,
+    without_compression,
+)
+from _html_writer import HtmlDocumentWriter
+
+DEFAULT_CHECKPOINT_EVERY = 1000  # lines between checkpoints.
+CHECKPOINT_SECONDS = 30.0  # most seconds between checkpoints.
+
+
+def checkpoint_paths(output_path) -> tuple:
+    """
+    Returns the paths of the partial output, the checkpoint
+    and the quarantine file of a run writing to `output_path`.
+    """
+    output_path = Path(output_path)
+    return (
+        output_path.with_name(f"{output_path.name}.partial"),
+        output_path.with_name(f"{output_path.name}.checkpoint.json"),
+        output_path.with_name(
+            f"{without_compression(output_path).stem}.quarantine.txt"
+        ),
+    )
+
+
+def _write_json_atomically(path, data: dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+class Quarantine:
+    """
+    Writes the sentences that couldn't be processed, and why, to `path`
+    (pass `add` as `on_error`). The file is only created once there's
+    something in it, and it's appended to if `append`.
+    """
+
+    def __init__(self, path, append: bool = False):
+        self.path = path
+        self.append = append
+        self.count = 0
+        self._file = None
+        self._lock = threading.Lock()  # errors come from any stage.
+
+    def add(self, sentence: str, error: Exception) -> None:
+        message = " ".join(f"{type(error).__name__}: {error}".split())
+        with self._lock:
+            if self._file is None:
+                mode = "a" if self.append else "w"
+                self._file = open(self.path, mode, encoding="utf-8")
+            self._file.write(f"{sentence}\t{message}\n")
+            self._file.flush()
+            self.count += 1
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+class CheckpointedRun:
+    """
+    The conversion of the byte range [start, end) of `input_path`
+    (the whole file by default) into `output_path`, either of which
+    may be compressed (see _compressed_io.py).
+    `options` are whatever changes the output (a run can only be resumed
+    with the same ones). A checkpoint is written every `every` lines,
+    or never if it's 0 or the output is compressed.
+    """
+
+    def __init__(
+        self,
+        input_path,
+        output_path,
+        options: dict,
+        byte_range: tuple = None,
+        every: int = DEFAULT_CHECKPOINT_EVERY,
+    ):
+        self.input_path = input_path
+        self.output_path = Path(output_path)
+        self.partial_path, self.checkpoint_path, quarantine_path = checkpoint_paths(
+            output_path
+        )
+        self.quarantine = Quarantine(quarantine_path)
+        self.compression = compression_of(output_path)
+        if byte_range is None and compression_of(input_path) is not None:
+            byte_range = (0, None)  # to the end, however long it is unpacked.
+        self.start, self.end = byte_range or (0, os.path.getsize(input_path))
+        self.options = options
+        self.every = every if self.compression is None else 0
+        self.resumed = False
+        self.input_offset = self.start
+        self.output_offset = 0
+        self.lines = 0  # lines written, including those of the runs before.
+
+        self._pending = deque()  # input offset after each line not yet written.
+        self._since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+        self._file = None
+
+    def _identity(self) -> dict:
+        stat = os.stat(self.input_path)
+        return {
+            "input": str(Path(self.input_path).resolve()),
+            "input_size": stat.st_size,
+            "input_mtime_ns": stat.st_mtime_ns,
+            "start": self.start,
+            "end": self.end,
+            "options": self.options,
+        }
+
+    def has_checkpoint(self) -> bool:
+        return self.checkpoint_path.is_file()
+
+    def resume(self) -> bool:
+        """
+        Continues from the last checkpoint. Returns False if there's none.
+        Raises ValueError if it was written for another input or options,
+        or if the partial output no longer reaches it.
+        """
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as file:
+                checkpoint = json.load(file)
+        except FileNotFoundError:
+            return False
+
+        for key, value in self._identity().items():
+            if checkpoint.get(key) != value:
+                raise ValueError(
+                    f"{self.checkpoint_path} doesn't match this run's {key} "
+                    "(delete it to start over)."
+                )
+        output_offset = checkpoint["output_offset"]
+        if (
+            not self.partial_path.is_file()
+            or self.partial_path.stat().st_size < output_offset
+        ):
+            raise ValueError(f"{self.partial_path} is shorter than its checkpoint.")
+
+        self.input_offset = checkpoint["input_offset"]
+        self.output_offset = output_offset
+        self.lines = checkpoint["lines"]
+        self.resumed = True
+        self.quarantine.append = True
+        return True
+
+    def iter_lines(self):
+        """
+        Yields the stripped input lines that are left to convert.
+        """
+        with open_binary(self.input_path) as file:
+            skip_to(file, self.input_offset)
+            offset = self.input_offset
+            while self.end is None or offset < self.end:
+                line = file.readline()
+                if len(line) == 0:
+                    break
+                offset += len(line)
+                self._pending.append(offset)
+                yield line.decode("utf-8").strip()
+
+    def checkpoint(self) -> None:
+        """
+        Flushes the output to disk and records how far the run got.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.output_offset = os.fstat(self._file.fileno()).st_size
+        checkpoint = self._identity()
+        checkpoint.update(
+            input_offset=self.input_offset,
+            output_offset=self.output_offset,
+            lines=self.lines,
+        )
+        _write_json_atomically(self.checkpoint_path, checkpoint)
+        self._since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+
+    def _line_written(self) -> None:
+        self.input_offset = self._pending.popleft()
+        self.lines += 1
+        self._since_checkpoint += 1
+        if self.every > 0 and (
+            self._since_checkpoint >= self.every
+            or time.monotonic() - self._last_checkpoint >= CHECKPOINT_SECONDS
+        ):
+            self.checkpoint()
+
+    def write(self, results, html_document: bool = False, words_only: bool = False):
+        """
+        Writes the (word_line, ipa_line) results of the lines from
+        `iter_lines` to the output, passing each one on once it's written.
+        Once the last one is, the output is moved to `output_path`
+        and the checkpoint is removed.
+        If `words_only`, only the word lines are written (like --gender-only).
+        """
+        if self.resumed:
+            os.truncate(self.partial_path, self.output_offset)
+            self._file = open_text(self.partial_path, "a", compression=None)
+        else:
+            self._file = open_text(
+                self.partial_path, "w", compression=self.compression
+            )
+            if os.path.isfile(self.quarantine.path):  # left by an earlier run.
+                os.remove(self.quarantine.path)
+
+        try:
+            if html_document:
+                with HtmlDocumentWriter(
+                    self._file, write_header=not self.resumed
+                ) as writer:
+                    for word_line, ipa_line in results:
+                        writer.write_line(word_line, None if words_only else ipa_line)
+                        self._line_written()
+                        yield (word_line, ipa_line)
+            else:
+                for word_line, ipa_line in results:
+                    if words_only:
+                        self._file.write(f"{word_line}\n")
+                    else:
+                        self._file.write(f"{word_line}\t{ipa_line}\n")
+                    self._line_written()
+                    yield (word_line, ipa_line)
+
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+            self.quarantine.close()
+
+        os.replace(self.partial_path, self.output_path)
+        if self.checkpoint_path.is_file():
+            os.remove(self.checkpoint_path)
@@ -0,0 +1,314 @@
+"""
+File: _columnar.py
+
+Description: A compact, read-only file of converted lines stored column by column,
+             written while a corpus is converted and memory-mapped to read it.
+
+    Instead of a (word_line, ipa_line) tuple of HTML strings per line,
+    the words, their IPA and the gender class of every word are kept
+    in flat arrays, so opening a file of millions of lines takes no time
+    and only the pages that are actually read cost memory.
+
+    Layout (native byte order, recorded in the header):
+        header:     magic (8 bytes), byte order (1 byte), padding,
+                    u32 column count, u64 lines.
+        directory:  one entry per column: name (32 bytes), u64 offset, u64 size.
+        columns:    tokens        the words of every line, UTF-8, each followed
+                                  by a space (words never contain whitespace).
+                    token_offsets u64 (tokens + 1): where each word starts.
+                    genders       u8 per word: its index in GENDER_CLASSES.
+                    ipa           the IPA words of every line, like `tokens`.
+                    ipa_offsets   u64 (IPA words + 1): where each IPA word starts.
+                    line_tokens   u64 (lines + 1): the first word of each line.
+                    line_ipa      u64 (lines + 1): the first IPA word of each line.
+
+    A line usually has as many IPA words as words, but not always
+    (e.g. numbers), which is why both have their own line index.
+    The spaces let the words of a whole line be decoded in one go.
+    While writing, each column is appended to its own temporary file,
+    which are put together into the final file when it's closed.
+
+"""
+
+import html
+import mmap
+import os
+import re
+import shutil
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+MAGIC = b"G2ICOL01"
+_HEADER = struct.Struct("<8sc3xIQ")
+_ENTRY = struct.Struct("<32sQQ")
+_BYTE_ORDER = b"L" if sys.byteorder == "little" else b"B"
+
+COLUMNS = [
+    "tokens",
+    "token_offsets",
+    "genders",
+    "ipa",
+    "ipa_offsets",
+    "line_tokens",
+    "line_ipa",
+]
+
+# The classes of the spans in tagging.py; 0 is a word without one.
+GENDER_CLASSES = [
+    None,
+    "der-noun",
+    "die-noun",
+    "das-noun",
+    "plural-der-noun",
+    "plural-die-noun",
+    "plural-das-noun",
+    "plural-only-noun",
+    "verb-no-plural-noun",
+]
+_GENDER_CODES = {name: code for code, name in enumerate(GENDER_CLASSES)}
+
+_SPAN_START = '<span class="'
+_SPAN_START_JOINED = '<span\0class="'  # keeps the tag from being split on spaces.
+_TAGGED_WORD = re.compile(r'<span\0class="([a-z-]+)">(.*?)</span>(.*)', re.DOTALL)
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def split_tagged(line: str) -> tuple:
+    """
+    Returns the words of a word or IPA line with their spans removed
+    and their text unescaped, and the gender code of each of them.
+    """
+    words = []
+    codes = []
+    for word in line.replace(_SPAN_START, _SPAN_START_JOINED).split():
+        match = _TAGGED_WORD.fullmatch(word)
+        if match is None:
+            words.append(html.unescape(word))
+            codes.append(0)
+        else:
+            name, core, puncts = match.groups()
+            words.append(html.unescape(core + puncts))
+            codes.append(_GENDER_CODES.get(name, 0))
+    return (words, codes)
+
+
+class ColumnarWriter:
+    """
+    Writes (word_line, ipa_line) results, as `convert.convert_lines`
+    yields them, one at a time to a columnar file at `path`.
+    Nothing is at `path` until the writer is closed,
+    so readers never see a half-written file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.num_lines = 0
+        self._num_tokens = 0
+        self._num_ipa = 0
+        self._token_bytes = 0
+        self._ipa_bytes = 0
+        self._spool_paths = {
+            name: f"{path}.{name}.{os.getpid()}.tmp" for name in COLUMNS
+        }
+        self._spools = {
+            name: open(spool_path, "wb", buffering=1 << 16)
+            for name, spool_path in self._spool_paths.items()
+        }
+        for name in ["token_offsets", "ipa_offsets", "line_tokens", "line_ipa"]:
+            self._spools[name].write(array("Q", [0]).tobytes())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._remove_spools()
+
+    def write(self, word_line: str, ipa_line: str) -> None:
+        tokens, codes = split_tagged(word_line)
+        ipa_words, _ = split_tagged(ipa_line or "")
+
+        encoded = [f"{token} ".encode("utf-8") for token in tokens]
+        offsets = list(accumulate(map(len, encoded), initial=self._token_bytes))
+        self._spools["tokens"].write(b"".join(encoded))
+        self._spools["token_offsets"].write(array("Q", offsets[1:]).tobytes())
+        self._spools["genders"].write(bytes(codes))
+        self._token_bytes = offsets[-1]
+
+        encoded = [f"{ipa} ".encode("utf-8") for ipa in ipa_words]
+        offsets = list(accumulate(map(len, encoded), initial=self._ipa_bytes))
+        self._spools["ipa"].write(b"".join(encoded))
+        self._spools["ipa_offsets"].write(array("Q", offsets[1:]).tobytes())
+        self._ipa_bytes = offsets[-1]
+
+        self._num_tokens += len(tokens)
+        self._num_ipa += len(ipa_words)
+        self._spools["line_tokens"].write(array("Q", [self._num_tokens]).tobytes())
+        self._spools["line_ipa"].write(array("Q", [self._num_ipa]).tobytes())
+        self.num_lines += 1
+
+    def write_many(self, results) -> None:
+        for word_line, ipa_line in results:
+            self.write(word_line, ipa_line)
+
+    def _remove_spools(self) -> None:
+        for name, spool in self._spools.items():
+            spool.close()
+            if os.path.exists(self._spool_paths[name]):
+                os.remove(self._spool_paths[name])
+
+    def close(self) -> None:
+        """
+        Puts the columns together into the file at `path`.
+        """
+        for spool in self._spools.values():
+            spool.close()
+
+        offset = _HEADER.size + _ENTRY.size * len(COLUMNS)
+        entries = []
+        for name in COLUMNS:
+            size = os.path.getsize(self._spool_paths[name])
+            offset = _align(offset)
+            entries.append(_ENTRY.pack(name.encode("utf-8"), offset, size))
+            offset += size
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(_HEADER.pack(MAGIC, _BYTE_ORDER, len(COLUMNS), self.num_lines))
+            for entry in entries:
+                file.write(entry)
+            for name in COLUMNS:
+                file.write(bytes(_align(file.tell()) - file.tell()))
+                with open(self._spool_paths[name], "rb") as spool:
+                    shutil.copyfileobj(spool, file, 1 << 20)
+        os.replace(tmp_path, self.path)
+        self._remove_spools()
+
+
+class StringColumn:
+    """
+    A read-only sequence of the strings of one column,
+    each decoded only when it's accessed.
+    """
+
+    def __init__(self, strings: memoryview, offsets: memoryview):
+        self._strings = strings
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return str(self._strings[self._offsets[i] : self._offsets[i + 1] - 1], "utf-8")
+
+    def joined(self, indices: range) -> str:
+        """
+        Returns the strings of a (step 1) range of indices joined by spaces.
+        """
+        if len(indices) == 0:
+            return ""
+        start = self._offsets[indices.start]
+        end = self._offsets[indices.stop] - 1
+        return str(self._strings[start:end], "utf-8")
+
+    def slice(self, indices: range) -> list:
+        """
+        Returns the strings of a (step 1) range of indices.
+        """
+        return self.joined(indices).split(" ") if len(indices) > 0 else []
+
+
+class ColumnarResults:
+    """
+    A memory-mapped columnar file. `tokens` and `ipa` are StringColumns
+    indexed by word, `genders` the gender code of every word,
+    and `len()` is the number of lines.
+    """
+
+    def __init__(self, buffer: memoryview, num_lines: int, columns: dict):
+        self._buffer = buffer
+        self._num_lines = num_lines
+        self.tokens = StringColumn(columns["tokens"], columns["token_offsets"])
+        self.ipa = StringColumn(columns["ipa"], columns["ipa_offsets"])
+        self.genders = columns["genders"]
+        self._line_tokens = columns["line_tokens"]
+        self._line_ipa = columns["line_ipa"]
+
+    def __len__(self) -> int:
+        return self._num_lines
+
+    def gender(self, token_index: int):
+        """
+        Returns the gender class of a word (e.g. "der-noun"), or None.
+        """
+        return GENDER_CLASSES[self.genders[token_index]]
+
+    def token_range(self, line_index: int) -> range:
+        return range(self._line_tokens[line_index], self._line_tokens[line_index + 1])
+
+    def ipa_range(self, line_index: int) -> range:
+        return range(self._line_ipa[line_index], self._line_ipa[line_index + 1])
+
+    def line_of_token(self, token_index: int) -> int:
+        """
+        Returns the index of the line the word belongs to.
+        """
+        return bisect_right(self._line_tokens, token_index) - 1
+
+    def line(self, line_index: int) -> tuple:
+        """
+        Returns the (words, IPA words, gender classes) of a line.
+        """
+        token_range = self.token_range(line_index)
+        codes = bytes(self.genders[token_range.start : token_range.stop])
+        return (
+            self.tokens.slice(token_range),
+            self.ipa.slice(self.ipa_range(line_index)),
+            [GENDER_CLASSES[code] for code in codes],
+        )
+
+    def __getitem__(self, line_index: int) -> tuple:
+        """
+        Returns the (word_line, ipa_line) of a line, without any spans.
+        """
+        return (
+            self.tokens.joined(self.token_range(line_index)),
+            self.ipa.joined(self.ipa_range(line_index)),
+        )
+
+    def __iter__(self):
+        for i in range(self._num_lines):
+            yield self[i]
+
+
+def open_results(path) -> ColumnarResults:
+    """
+    Memory-maps the columnar file at `path`.
+    Raises ValueError if it isn't a columnar file for this machine.
+    """
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    buffer = memoryview(mapped)
+    magic, byte_order, column_count, num_lines = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or byte_order != _BYTE_ORDER:
+        raise ValueError(f"{path} is not a columnar file for this machine.")
+
+    columns = {}
+    for i in range(column_count):
+        name, offset, size = _ENTRY.unpack_from(buffer, _HEADER.size + i * _ENTRY.size)
+        name = name.rstrip(b"\0").decode("utf-8")
+        column = buffer[offset : offset + size]
+        if name.endswith("offsets") or name.startswith("line_"):
+            column = column.cast("Q")
+        columns[name] = column
+
+    return ColumnarResults(buffer, num_lines, columns)
@@ -0,0 +1,176 @@
+"""
+File: _compressed_io.py
+
+Description: Reads and writes text files compressed with gzip, bzip2, xz
+             or Zstandard as streams, so a corpus never has to be
+             decompressed to disk first.
+
+    The compression of a file is told by its extension (mytext.txt.gz).
+    Reads and writes go through IO_BUFFER_SIZE buffers on both sides of the
+    (de)compressor, so a multi-GB file is read and written in large chunks.
+    Zstandard needs the zstandard package (pip install zstandard),
+    which is only imported when a .zst file is opened.
+
+"""
+
+import io
+from pathlib import Path
+
+IO_BUFFER_SIZE = 1 << 20
+
+# Extension -> name, as --compress takes it.
+COMPRESSIONS = {".gz": "gz", ".bz2": "bz2", ".xz": "xz", ".zst": "zst"}
+
+
+def compression_of(path):
+    """
+    Returns the extension of a compressed file (e.g. ".gz"), or None.
+    """
+    suffix = Path(path).suffix.lower()
+    return suffix if suffix in COMPRESSIONS else None
+
+
+def parse_compression(value: str):
+    """
+    Returns the extension for a --compress value (gz, bz2, xz, zst or none),
+    or None for "none". Raises ValueError if it isn't one.
+    """
+    if value == "none":
+        return None
+    for extension, name in COMPRESSIONS.items():
+        if value.lower().lstrip(".") == name:
+            return extension
+    names = ", ".join(list(COMPRESSIONS.values()) + ["none"])
+    raise ValueError(f"--compress needs one of {names} (got {value!r}).")
+
+
+def without_compression(path) -> Path:
+    """
+    Returns the path without its compression extension
+    (mytext.txt.gz -> mytext.txt).
+    """
+    path = Path(path)
+    return path.with_suffix("") if compression_of(path) is not None else path
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "Zstandard files need the zstandard package (pip install zstandard)."
+        ) from None
+    return zstandard
+
+
+def check_compression(compression) -> None:
+    """
+    Raises ImportError if files of this compression (an extension
+    of COMPRESSIONS or None) can't be opened here.
+    """
+    if compression == ".zst":
+        _zstandard()
+
+
+def _compressor(file, mode: str, compression: str):
+    # Levels as the command line tools use them by default.
+    if compression == ".gz":
+        import gzip
+
+        return gzip.GzipFile(fileobj=file, mode=mode, compresslevel=6)
+    if compression == ".bz2":
+        import bz2
+
+        return bz2.BZ2File(file, mode)
+    if compression == ".xz":
+        import lzma
+
+        return lzma.LZMAFile(file, mode)
+
+    zstandard = _zstandard()
+    if mode == "rb":
+        return zstandard.ZstdDecompressor().stream_reader(
+            file, read_across_frames=True, closefd=False
+        )
+    return zstandard.ZstdCompressor(level=3).stream_writer(
+        file, closefd=False, write_return_read=True
+    )
+
+
+class _BufferedReader(io.BufferedReader):
+    # Also closes the compressed file the decompressor reads from.
+
+    def __init__(self, stream, file):
+        super().__init__(stream, IO_BUFFER_SIZE)
+        self._file = file
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._file.close()
+
+
+class _BufferedWriter(io.BufferedWriter):
+    # Also closes the compressed file the compressor writes to.
+
+    def __init__(self, stream, file):
+        super().__init__(stream, IO_BUFFER_SIZE)
+        self._file = file
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._file.close()
+
+
+def open_binary(path, mode: str = "rb", compression="auto"):
+    """
+    Opens a file for reading ("rb") or writing ("wb"), decompressing
+    or compressing it on the fly. `compression` is an extension of
+    COMPRESSIONS or None, told by the path's extension if it's "auto".
+    Raises ImportError for a .zst file if zstandard isn't installed.
+    """
+    if compression == "auto":
+        compression = compression_of(path)
+    check_compression(compression)  # before the file is opened (or created).
+    file = open(path, mode, buffering=IO_BUFFER_SIZE)
+    if compression is None:
+        return file
+
+    try:
+        stream = _compressor(file, mode, compression)
+    except BaseException:
+        file.close()
+        raise
+    if mode == "rb":
+        return _BufferedReader(stream, file)
+    return _BufferedWriter(stream, file)
+
+
+def skip_to(file, offset: int) -> None:
+    """
+    Moves a file opened for reading by `open_binary` to `offset`.
+    Compressed files are read (and decompressed) up to it.
+    """
+    if file.seekable():
+        file.seek(offset)
+        return
+    while file.tell() < offset:
+        if len(file.read(min(IO_BUFFER_SIZE, offset - file.tell()))) == 0:
+            break
+
+
+def open_text(path, mode: str = "r", compression="auto"):
+    """
+    Opens a UTF-8 text file for reading ("r") or writing ("w"),
+    compressed as `open_binary` says (plain files can be appended to, "a").
+    """
+    if compression == "auto":
+        compression = compression_of(path)
+    if compression is None:
+        return open(path, mode, encoding="utf-8", buffering=IO_BUFFER_SIZE)
+    return io.TextIOWrapper(
+        open_binary(path, f"{mode}b", compression), encoding="utf-8"
+    )
@@ -0,0 +1,245 @@
+"""
+File: _daemon.py
+
+Description: Keeps german2ipa loaded in a resident process (--daemon) that
+             runs the command line of every client connecting to its Unix
+             domain socket, so a call doesn't have to import the modules,
+             start eSpeak and read the noun lists all over again.
+
+    A client sends one JSON line, {"argv": [...], "cwd": "...", "env": {...}},
+    where "env" holds the client's OUTPUT_ENV variables. If they differ
+    from the daemon's, it answers {"local": true} and the client runs
+    the command line itself, since the daemon's output could differ.
+    Otherwise it runs the command line in that directory and sends back
+    everything it prints as JSON lines, {"stdout": "..."} or {"stderr": "..."}
+    in the order it was printed, and finally {"exit": <exit code>}.
+    Command lines are run one at a time, since their output is captured
+    by replacing sys.stdout and sys.stderr.
+
+    The command line forwards itself to the daemon if one is listening,
+    and runs in its own process otherwise.
+
+"""
+
+import io
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+
+DEFAULT_SOCKET_PATH = Path.home() / ".cache" / "german2ipa" / "daemon.sock"
+
+# Options that only make sense in the caller's own process: the daemon
+# itself, watching a file until Ctrl+C, metrics flushed when the process
+# exits, and the caller's clipboard.
+LOCAL_OPTIONS = [
+    "--daemon",
+    "--watch",
+    "--metrics",
+    "--metrics-json",
+    "-v",
+    "-x",
+    "-vx",
+    "-xv",
+]
+
+
+# Environment variables that change the output: the shared noun lexicon
+# (gender/get_genders.py), and which eSpeak is used how (_espeak_backend.py).
+OUTPUT_ENV = [
+    "GERMAN2IPA_LEXICON",
+    "GERMAN2IPA_BACKEND",
+    "GERMAN2IPA_ESPEAK_LIBRARY",
+    "PHONEMIZER_ESPEAK_LIBRARY",
+    "ESPEAK_DATA_PATH",
+]
+
+
+def output_env() -> dict:
+    """
+    Returns the values of the OUTPUT_ENV variables (None if one isn't set).
+    """
+    return {name: os.environ.get(name) or None for name in OUTPUT_ENV}
+
+
+def socket_path() -> Path:
+    """
+    Returns the path of the daemon's socket:
+    $GERMAN2IPA_SOCKET if it's set, DEFAULT_SOCKET_PATH otherwise.
+    """
+    return Path(os.environ.get("GERMAN2IPA_SOCKET") or DEFAULT_SOCKET_PATH)
+
+
+def _connect(path):
+    """
+    Returns a socket connected to the daemon at `path`,
+    or None if no daemon is listening there.
+    """
+    if not hasattr(socket, "AF_UNIX"):  # e.g. older Pythons on Windows.
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(str(path))
+    except OSError:  # no socket, or one left behind by a daemon that died.
+        client.close()
+        return None
+    return client
+
+
+def forward(argv: list, path=None):
+    """
+    Runs the command line in the daemon, printing what it prints,
+    and returns its exit code. Returns None without running it if
+    no daemon is listening, or if it has to run in this process
+    (because of its options or its OUTPUT_ENV variables).
+    """
+    if any(arg in LOCAL_OPTIONS for arg in argv):
+        return None
+    client = _connect(path or socket_path())
+    if client is None:
+        return None
+
+    with client, client.makefile("rw", encoding="utf-8", newline="\n") as file:
+        request = {"argv": argv, "cwd": os.getcwd(), "env": output_env()}
+        file.write(json.dumps(request) + "\n")
+        file.flush()
+        for line in file:
+            message = json.loads(line)
+            if "local" in message:
+                return None
+            if "exit" in message:
+                return message["exit"]
+            stream = sys.stdout if "stdout" in message else sys.stderr
+            stream.write(message.get("stdout", message.get("stderr")))
+            stream.flush()
+
+    print("ERROR: The daemon stopped before the command finished.", file=sys.stderr)
+    return 1
+
+
+class _OutputStream(io.TextIOBase):
+    """
+    A text stream that sends what's written to it to the client as
+    {name: text} messages (see `_handle`).
+    """
+
+    def __init__(self, send, name: str):
+        self._send = send
+        self._name = name
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if len(text) > 0:
+            self._send({self._name: text}, flush=self._name == "stderr")
+        return len(text)
+
+
+def _exit_code(error: SystemExit) -> int:
+    # What the interpreter would exit with for this SystemExit.
+    if error.code is None:
+        return 0
+    if isinstance(error.code, int):
+        return error.code
+    print(error.code, file=sys.stderr)
+    return 1
+
+
+def _handle(connection, run) -> None:
+    """
+    Runs the command line a client sent with `run(argv)`,
+    sending its output and exit code back to it,
+    or tells it to run the command line itself if its OUTPUT_ENV differs.
+    """
+    with connection, connection.makefile(
+        "rw", encoding="utf-8", newline="\n"
+    ) as file:
+        line = file.readline()
+        if len(line) == 0:  # only checked whether a daemon is listening.
+            return
+        request = json.loads(line)
+        if request.get("env") != output_env():
+            file.write(json.dumps({"local": True}) + "\n")
+            return
+        lock = threading.Lock()  # the pipeline's threads print too.
+
+        def send(message: dict, flush: bool = False) -> None:
+            with lock:
+                file.write(json.dumps(message) + "\n")
+                if flush:
+                    file.flush()
+
+        stdout = _OutputStream(send, "stdout")
+        stderr = _OutputStream(send, "stderr")
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                os.chdir(request["cwd"])
+                run(request["argv"])
+                exit_code = 0
+            except SystemExit as e:
+                exit_code = _exit_code(e)
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+        send({"exit": exit_code}, flush=True)
+
+
+def warm_up() -> None:
+    """
+    Loads everything a command line may need:
+    eSpeak, the IPA rules, the noun lists and the pipeline.
+    """
+    import _pipeline  # noqa: F401
+    from convert import convert_lines
+
+    list(convert_lines(["Der Hund schläft."], color_by_gender=True))
+
+
+def serve(run, path=None) -> None:
+    """
+    Listens at the socket (see `socket_path`) and runs the command line
+    of every client that connects with `run(argv)`, until interrupted
+    (by Ctrl+C or SIGTERM).
+    Raises OSError if another daemon is already listening there.
+    """
+    path = Path(path or socket_path())
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError("The daemon needs Unix domain sockets.")
+    client = _connect(path)
+    if client is not None:
+        client.close()
+        raise OSError(f"A daemon is already listening at {path}.")
+
+    print("Loading eSpeak and the noun lists...", file=sys.stderr)
+    warm_up()
+    os.makedirs(path.parent, exist_ok=True)
+    if path.exists():  # left behind by a daemon that died.
+        path.unlink()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)  # only this user may connect.
+    try:
+        server.bind(str(path))
+    finally:
+        os.umask(umask)
+    server.listen()
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"Listening at {path} (Ctrl+C to stop).", file=sys.stderr)
+
+    try:
+        while True:
+            connection, _ = server.accept()
+            try:
+                _handle(connection, run)
+            except (OSError, ValueError) as e:  # e.g. the client went away.
+                print(f"ERROR: {e}", file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        path.unlink(missing_ok=True)
@@ -0,0 +1,138 @@
+"""
+File: _espeak_backend.py
+
+Description: A thin ctypes binding to libespeak-ng's phoneme API,
+             used instead of phonemizer's EspeakBackend when the library is found.
+
+    phonemizer splits every text on its punctuation, phonemizes the pieces
+    with phoneme separators, handles language switches and then puts the
+    punctuation back, all of which `ipa.py` strips again afterwards.
+    Here the text is split on the same punctuation marks phonemizer uses
+    (so eSpeak stresses every piece exactly as before) and each piece goes
+    straight to espeak_TextToPhonemes in IPA mode, stress marks included.
+    The punctuation is put back as it was, so every word of the text
+    still lines up with one word of the IPA.
+
+    Set GERMAN2IPA_BACKEND=phonemizer to always use phonemizer.
+
+"""
+
+import ctypes
+import ctypes.util
+import os
+import re
+
+LIBRARY_ENV = "GERMAN2IPA_ESPEAK_LIBRARY"
+BACKEND_ENV = "GERMAN2IPA_BACKEND"
+
+AUDIO_OUTPUT_SYNCHRONOUS = 0x02
+CHARS_UTF8 = 1
+PHONEMES_IPA = 0x02
+
+# phonemizer's default punctuation marks.
+_PUNCTUATION_RUN = re.compile(r'([;:,.!?¡¿—…"«»“”(){}\[\]]+)')
+
+
+def _find_library():
+    """
+    Returns the path (or name) of libespeak-ng, or None if it can't be found.
+    The same environment variable as phonemizer's is honoured.
+    """
+    for env in [LIBRARY_ENV, "PHONEMIZER_ESPEAK_LIBRARY"]:
+        if os.environ.get(env):
+            return os.environ[env]
+
+    if os.name == "nt":
+        dll_path = r"C:\Program Files\eSpeak NG\libespeak-ng.dll"
+        return dll_path if os.path.isfile(dll_path) else None
+
+    return ctypes.util.find_library("espeak-ng")
+
+
+class EspeakLibrary:
+    """
+    libespeak-ng loaded and initialised with the given voice.
+    Raises OSError if the library can't be loaded or initialised.
+    """
+
+    def __init__(self, path, voice: str = "de"):
+        self._library = ctypes.cdll.LoadLibrary(path)
+
+        self._library.espeak_Initialize.restype = ctypes.c_int
+        self._library.espeak_Initialize.argtypes = [
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_int,
+        ]
+        self._library.espeak_SetVoiceByName.restype = ctypes.c_int
+        self._library.espeak_SetVoiceByName.argtypes = [ctypes.c_char_p]
+        self._text_to_phonemes = self._library.espeak_TextToPhonemes
+        self._text_to_phonemes.restype = ctypes.c_char_p
+        self._text_to_phonemes.argtypes = [
+            ctypes.POINTER(ctypes.c_char_p),
+            ctypes.c_int,
+            ctypes.c_int,
+        ]
+
+        data_path = os.environ.get("ESPEAK_DATA_PATH")
+        data_path = data_path.encode("utf-8") if data_path else None
+        sample_rate = self._library.espeak_Initialize(
+            AUDIO_OUTPUT_SYNCHRONOUS, 0, data_path, 0
+        )
+        if sample_rate <= 0:
+            raise OSError(f"failed to initialize {path}")
+        if self._library.espeak_SetVoiceByName(voice.encode("utf-8")) != 0:
+            raise OSError(f"eSpeak has no voice named {voice!r}")
+
+    def _phonemize_piece(self, text: str) -> str:
+        text_ptr = ctypes.pointer(ctypes.c_char_p(text.encode("utf-8")))
+        clauses = []
+        while text_ptr.contents.value is not None:
+            phonemes = self._text_to_phonemes(text_ptr, CHARS_UTF8, PHONEMES_IPA)
+            if phonemes:
+                clauses.append(phonemes.decode("utf-8"))
+        return " ".join(" ".join(clauses).split())
+
+    def phonemize_one(self, text: str) -> str:
+        """
+        Returns the IPA (with stress marks) of the whole text,
+        with a space between words wherever the text has whitespace.
+        """
+        ipa = ""
+        space_pending = False
+        for i, piece in enumerate(_PUNCTUATION_RUN.split(text)):
+            if len(piece.strip()) == 0:
+                space_pending = space_pending or len(piece) > 0
+                continue
+            if len(ipa) > 0 and (space_pending or piece[0].isspace()):
+                ipa += " "
+            # Odd pieces are the punctuation the text was split on.
+            ipa += piece if i % 2 == 1 else self._phonemize_piece(piece)
+            space_pending = piece[-1].isspace()
+        return ipa
+
+    def phonemize(self, texts: list, strip: bool = True) -> list:
+        """
+        Returns the IPA of each text, like phonemizer's `phonemize`
+        (the output never has trailing separators, so `strip` is ignored).
+        """
+        return [self.phonemize_one(text) for text in texts]
+
+
+def load_library(voice: str = "de"):
+    """
+    Returns the loaded EspeakLibrary,
+    or None if it isn't available or phonemizer was asked for.
+    """
+    if os.environ.get(BACKEND_ENV, "").lower() == "phonemizer":
+        return None
+
+    path = _find_library()
+    if path is None:
+        return None
+
+    try:
+        return EspeakLibrary(path, voice)
+    except (OSError, AttributeError):
+        return None
@@ -0,0 +1,119 @@
+"""
+File: _html_writer.py
+
+Description: Streams a complete HTML document of processed lines,
+             writing each line as soon as it has been processed
+             so that memory use stays constant no matter the input size.
+
+"""
+
+import html
+
+GENDER_CSS = """\
+.der-noun, .plural-der-noun {
+  color: rgb(0, 250, 0);
+}
+
+.die-noun, .plural-die-noun {
+  color: rgb(255, 100, 0);
+}
+
+.das-noun, .plural-das-noun {
+  color: rgb(0, 75, 250);
+}
+
+.verb-no-plural-noun {
+  color: rgb(150, 155, 250);
+}
+
+.plural-only-noun {
+  color: rgb(200, 200, 0);
+}
+
+.plural-der-noun, .plural-die-noun, .plural-das-noun, .plural-only-noun {
+  font-style: italic;
+}
+
+.ipa {
+  font-family: Consolas, monospace;
+}
+"""
+
+DOCUMENT_HEADER = """\
+<!DOCTYPE html>
+<html lang="de">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+{css}</style>
+</head>
+<body>
+<ul>
+"""
+
+DOCUMENT_FOOTER = """\
+</ul>
+</body>
+</html>
+"""
+
+
+class HtmlDocumentWriter:
+    """
+    Writes an HTML document to the given text `stream`:
+    the header (with the gender CSS classes) when opened
+    (unless `write_header` is False, e.g. when appending to a document),
+    one <li> per call to `write_line`, and the footer when closed
+    (but not when an exception leaves the `with` block, so a document
+    that was cut short doesn't look complete and can be appended to).
+
+    The stream is flushed after the first line (so output shows up right away)
+    and then every `flush_every` lines; in between, writes are buffered.
+    """
+
+    def __init__(
+        self,
+        stream,
+        title: str = "german2ipa",
+        flush_every: int = 64,
+        write_header: bool = True,
+    ):
+        self.stream = stream
+        self.title = title
+        self.flush_every = flush_every
+        self.write_header = write_header
+        self.num_lines = 0
+
+    def __enter__(self):
+        if self.write_header:
+            self.stream.write(
+                DOCUMENT_HEADER.format(title=html.escape(self.title), css=GENDER_CSS)
+            )
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def write_line(self, word_line: str, ipa_line: str = None) -> None:
+        """
+        Writes one line of the document. If `ipa_line` is None,
+        only the German is written (e.g. when only genders were tagged).
+        The lines are written as they are, so they have to be HTML already,
+        like the lines of `convert.process_sentence` with `color_by_gender`.
+        """
+        if ipa_line is None:
+            self.stream.write(f'<li><p class="german">{word_line}</p></li>\n')
+        else:
+            self.stream.write(
+                f'<li><p class="german">{word_line}</p>'
+                f'<p class="ipa">{ipa_line}</p></li>\n'
+            )
+        self.num_lines += 1
+        if self.num_lines == 1 or self.num_lines % self.flush_every == 0:
+            self.stream.flush()
+
+    def close(self) -> None:
+        self.stream.write(DOCUMENT_FOOTER)
+        self.stream.flush()
@@ -0,0 +1,232 @@
+"""
+File: _metrics.py
+
+Description: Counters and histograms of what a run did, written to a file
+             in the Prometheus text format (for node_exporter's textfile
+             collector) and optionally as a JSON snapshot.
+
+    Nothing is recorded unless `enabled` is set: every place that records
+    a metric checks that flag first, so a run without --metrics only pays
+    for one attribute lookup there.
+
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+
+enabled = False
+
+FLUSH_INTERVAL = 15.0  # seconds between writes of the metrics files.
+
+# Seconds, from a single short sentence up to a large batch.
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+
+def _label_str(labels: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """
+    A count that only goes up, kept separately for every set of labels.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list:
+        with self._lock:
+            return sorted(self._values.items())
+
+    def text_lines(self) -> list:
+        return [
+            f"{self.name}{_label_str(key)} {value}" for key, value in self.samples()
+        ]
+
+    def snapshot(self) -> list:
+        return [{"labels": dict(key), "value": value} for key, value in self.samples()]
+
+
+class Histogram:
+    """
+    Observed values counted into cumulative buckets (plus their sum),
+    kept separately for every set of labels.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 2)
+            values[i] += 1
+            values[-1] += value
+
+    def samples(self) -> list:
+        with self._lock:
+            return sorted((key, list(values)) for key, values in self._values.items())
+
+    def text_lines(self) -> list:
+        lines = []
+        for key, values in self.samples():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_label_str(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(key)} {values[-1]}")
+            lines.append(f"{self.name}_count{_label_str(key)} {cumulative}")
+        return lines
+
+    def snapshot(self) -> list:
+        return [
+            {
+                "labels": dict(key),
+                "buckets": dict(zip(map(str, self.buckets + ("+Inf",)), values)),
+                "sum": values[-1],
+                "count": sum(values[:-1]),
+            }
+            for key, values in self.samples()
+        ]
+
+
+LINES = Counter("german2ipa_lines_total", "Lines converted.")
+WORDS = Counter("german2ipa_words_total", "Words sent to eSpeak.")
+ESPEAK_CALLS = Counter("german2ipa_espeak_calls_total", "Calls to the eSpeak backend.")
+ALIGNMENT_FAILURES = Counter(
+    "german2ipa_alignment_failures_total",
+    "Sentences whose IPA couldn't be lined up with their words or word parts.",
+)
+QUARANTINED = Counter(
+    "german2ipa_quarantined_total", "Sentences that raised and got no IPA."
+)
+STORE_LOOKUPS = Counter(
+    "german2ipa_store_lookups_total", "Result store lookups, by hit or miss."
+)
+NOUN_LOOKUPS = Counter(
+    "german2ipa_noun_lookups_total", "Gender lookups of nouns, by found or not."
+)
+ESPEAK_SECONDS = Histogram(
+    "german2ipa_espeak_call_seconds", "Seconds spent in one eSpeak backend call."
+)
+STAGE_SECONDS = Histogram(
+    "german2ipa_stage_seconds", "Seconds one stage spent on one batch."
+)
+
+METRICS = [
+    LINES,
+    WORDS,
+    ESPEAK_CALLS,
+    ALIGNMENT_FAILURES,
+    QUARANTINED,
+    STORE_LOOKUPS,
+    NOUN_LOOKUPS,
+    ESPEAK_SECONDS,
+    STAGE_SECONDS,
+]
+
+
+def render_text() -> str:
+    """
+    Returns every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.text_lines())
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> dict:
+    return {
+        "time": time.time(),
+        "metrics": {
+            metric.name: {"type": metric.type, "samples": metric.snapshot()}
+            for metric in METRICS
+        },
+    }
+
+
+def _write_atomically(path, text: str) -> None:
+    # The textfile collector may read at any time, so it never sees half a file.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+
+
+def write(path=None, json_path=None) -> None:
+    """
+    Writes the metrics to the Prometheus textfile and/or the JSON file.
+    """
+    if path is not None:
+        _write_atomically(path, render_text())
+    if json_path is not None:
+        _write_atomically(json_path, json.dumps(snapshot(), indent=2))
+
+
+class MetricsFlusher:
+    """
+    Enables the metrics and writes them every `interval` seconds
+    from a background thread, and once more when closed.
+    """
+
+    def __init__(self, path=None, json_path=None, interval: float = FLUSH_INTERVAL):
+        global enabled
+        enabled = True
+        self.path = path
+        self.json_path = json_path
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, interval: float) -> None:
+        while not self._stopping.wait(interval):
+            write(self.path, self.json_path)
+
+    def close(self) -> None:
+        self._stopping.set()
+        self._thread.join()
+        write(self.path, self.json_path)
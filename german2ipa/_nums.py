@@ -1,96 +1,274 @@
-def num_to_german(number: int):
-    if number == 0:
-        return "null"
-
-    number = min(999999, number)
-
-    LOW_NUMS = {
-        1: "eins",
-        2: "zwei",
-        3: "drei",
-        4: "vier",
-        5: "fünf",
-        6: "sechs",
-        7: "sieben",
-        8: "acht",
-        9: "neun",
-        10: "zehn",
-        11: "elf",
-        12: "zwölf",
-        13: "dreizehn",
-        14: "vierzehn",
-        15: "fünfzehn",
-        16: "sechzehn",
-        17: "siebzehn",
-        18: "achtzehn",
-        19: "neunzehn",
-    }
-    TENS = {
-        2: "zwanzig",
-        3: "dreißig",
-        4: "vierzig",
-        5: "fünfzig",
-        6: "sechzig",
-        7: "siebzig",
-        8: "achtzig",
-        9: "neunzig",
-    }
+import re
+from functools import lru_cache
 
+LOW_NUMS = (
+    "null",
+    "eins",
+    "zwei",
+    "drei",
+    "vier",
+    "fünf",
+    "sechs",
+    "sieben",
+    "acht",
+    "neun",
+    "zehn",
+    "elf",
+    "zwölf",
+    "dreizehn",
+    "vierzehn",
+    "fünfzehn",
+    "sechzehn",
+    "siebzehn",
+    "achtzehn",
+    "neunzehn",
+)
+TENS = (
+    "",
+    "",
+    "zwanzig",
+    "dreißig",
+    "vierzig",
+    "fünfzig",
+    "sechzig",
+    "siebzig",
+    "achtzig",
+    "neunzig",
+)
+
+# Ordinals below 20 that don't just add "t" to the cardinal.
+LOW_ORDINALS = {
+    1: "erst",
+    3: "dritt",
+    7: "siebt",
+    8: "acht",
+}
+
+# (value, singular, plural) for the ranges above the precomputed table.
+LARGE_UNITS = (
+    (10**12, "einebillion", "billionen"),
+    (10**9, "einemilliarde", "milliarden"),
+    (10**6, "einemillion", "millionen"),
+)
+MAX_SPELLED_NUMBER = 10**15 - 1
+
+# How the word of an exact number of millions, ... ends in its ordinal
+# (zweimillionen -> zweimillionste, einemilliarde -> einmilliardste).
+LARGE_ORDINAL_STEMS = {
+    "billionen": "billion",
+    "milliarden": "milliard",
+    "millionen": "million",
+    "einebillion": "einbillion",
+    "einemilliarde": "einmilliard",
+    "einemillion": "einmillion",
+}
+
+# Words after which a number with a period is still an ordinal,
+# although they're capitalised (am 3. Mai).
+MONTHS = {
+    "januar",
+    "jänner",
+    "februar",
+    "märz",
+    "april",
+    "mai",
+    "juni",
+    "juli",
+    "august",
+    "september",
+    "oktober",
+    "november",
+    "dezember",
+}
+
+
+def _build_word(number: int) -> str:
     result = ""
-    thousands_digit = number // 1000
+    thousands_digit, number = divmod(number, 1000)
     if thousands_digit > 0:
-        if thousands_digit > 19:
-            prefix = num_to_german(thousands_digit)
-        else:
-            if thousands_digit == 1:
-                prefix = "ein"
-            else:
-                prefix = LOW_NUMS[thousands_digit]
-
+        prefix = "ein" if thousands_digit == 1 else LOW_NUMS[thousands_digit]
         result += f"{prefix}tausend"
-        number -= thousands_digit * 1000
 
-    hundreds_digit = number // 100
+    hundreds_digit, number = divmod(number, 100)
     if hundreds_digit > 0:
-        if hundreds_digit == 1:
-            prefix = "ein"
-        else:
-            prefix = LOW_NUMS[hundreds_digit]
-
+        prefix = "ein" if hundreds_digit == 1 else LOW_NUMS[hundreds_digit]
         result += f"{prefix}hundert"
-        number -= hundreds_digit * 100
-
-    tens_digit = number // 10
-    ones_digit = number % 10
 
+    tens_digit, ones_digit = divmod(number, 10)
     if tens_digit <= 1:
-        result += LOW_NUMS[number]
+        if number > 0 or len(result) == 0:
+            result += LOW_NUMS[number]
+    elif ones_digit > 0:
+        prefix = "ein" if ones_digit == 1 else LOW_NUMS[ones_digit]
+        result += f"{prefix}und{TENS[tens_digit]}"
     else:
-        suffix = TENS[tens_digit]
-        if ones_digit > 0:
-            if ones_digit == 1:
-                prefix = "ein"
-            else:
-                prefix = LOW_NUMS[ones_digit]
-            result += f"{prefix}und{suffix}"
-        else:
-            result += suffix
+        result += TENS[tens_digit]
+
+    return result
+
+
+# Precomputed words for 0-9999; larger numbers are composed from these.
+WORDS = tuple(_build_word(n) for n in range(10000))
+
+
+def _as_prefix(word: str) -> str:
+    """
+    Returns the form of a number's word used before "tausend", "millionen", ...
+    (einhunderteins -> einhundertein).
+    """
+    return word[:-1] if word.endswith("eins") else word
+
+
+@lru_cache(maxsize=4096)
+def num_to_german(number: int) -> str:
+    """
+    Returns the German word for the given non-negative integer.
+    Numbers are written as a single token (e.g. "zweimillionenfünfhundert")
+    so that the word count of a sentence is not changed.
+    Numbers too large to be spelled are read digit by digit.
+    """
+    if number < 10000:
+        return WORDS[number]
+    if number > MAX_SPELLED_NUMBER:
+        return "".join(WORDS[int(d)] for d in str(number))
+
+    result = ""
+    for value, singular, plural in LARGE_UNITS:
+        count, number = divmod(number, value)
+        if count == 1:
+            result += singular
+        elif count > 1:
+            result += _as_prefix(num_to_german(count)) + plural
+
+    thousands, number = divmod(number, 1000)
+    if thousands > 0:
+        result += _as_prefix(WORDS[thousands]) + "tausend"
+    if number > 0:
+        result += WORDS[number]
 
     return result
 
 
+def num_to_german_ordinal(number: int, ending: str = "e") -> str:
+    """
+    Returns the German ordinal for the given number
+    with the given adjective `ending` (3 -> dritte, dritten, ...).
+    """
+    low = number % 100
+    if 0 < low < 20:
+        stem = LOW_ORDINALS.get(low, WORDS[low] + "t")
+        if number >= 100:
+            stem = num_to_german(number - low) + stem
+    else:
+        word = num_to_german(number)
+        for unit, unit_stem in LARGE_ORDINAL_STEMS.items():
+            if word.endswith(unit):
+                word = word[: -len(unit)] + unit_stem
+                break
+        stem = _as_prefix(word) + "st"
+
+    return stem + ending
+
+
+# Articles after which an ordinal takes "-e" rather than "-en".
+_ORDINAL_E_ARTICLES = {"der", "die", "das", "jede", "jeder", "jedes"}
+
+_OPENING_CHARS = "\"'„“»«(["
+_TRAILING_CHARS = ".,;:!?…\"'“”»«)]"
+
+# Words after which a number with a period is an ordinal
+# whatever follows it (im 21. Jahrhundert, der 2. Platz).
+ORDINAL_ARTICLES = _ORDINAL_E_ARTICLES | {
+    "dem",
+    "den",
+    "des",
+    "jedem",
+    "jeden",
+    "ein",
+    "eine",
+    "einem",
+    "einen",
+    "einer",
+    "eines",
+    "am",
+    "im",
+    "zum",
+    "zur",
+    "vom",
+    "beim",
+    "ins",
+    "ans",
+}
+
+# An integer (optionally with "." thousands separators),
+# optionally followed by a decimal comma or an ordinal dot.
+# An ordinal dot has to be followed by another word (am 3. Mai),
+# see `is_ordinal_before`.
+_NUMBER = re.compile(
+    r"""
+    (?P<int>\d{1,3}(?:\.\d{3})+(?!\d)|\d+)
+    (?:
+        ,(?P<frac>\d+)
+      | (?P<ordinal>\.)(?=\s+(?P<next>\S+))
+    )?
+    """,
+    re.VERBOSE,
+)
+
+
+def is_ordinal_before(next_word: str, prev_word: str = "") -> bool:
+    """
+    Returns True if a number followed by a period is an ordinal
+    when `next_word` comes after it and `prev_word` before it:
+    after an article (im 21. Jahrhundert), or before a word that can't
+    start a sentence (3. großer Tag) or a month (am 3. Mai).
+    Otherwise the period may end the sentence (Ich bin 30. Dann ...).
+    """
+    if prev_word.lstrip(_OPENING_CHARS).lower() in ORDINAL_ARTICLES:
+        return True
+    word = next_word.lstrip(_OPENING_CHARS)
+    if len(word) == 0:
+        return False
+    return word[0].islower() or word.rstrip(_TRAILING_CHARS).lower() in MONTHS
+
+
+@lru_cache(maxsize=4096)
+def _number_to_words(int_str: str, frac_str: str, ordinal_ending: str) -> str:
+    number = int(int_str.replace(".", ""))
+    if ordinal_ending:
+        return num_to_german_ordinal(number, ordinal_ending)
+
+    result = num_to_german(number)
+    if frac_str:
+        result += "komma" + "".join(WORDS[int(d)] for d in frac_str)
+
+    return result
+
+
+def _replace_number(match) -> str:
+    ordinal_ending = ""
+    start = match.start()
+    if match.group("ordinal"):
+        prev_word = ""
+        if start > 0:
+            prev_start = match.string.rfind(" ", 0, start - 1) + 1
+            prev_word = match.string[prev_start : start - 1]
+            prev_word = prev_word.lstrip(_OPENING_CHARS).lower()
+        if (start > 0 and not match.string[start - 1].isspace()) or (
+            not is_ordinal_before(match.group("next"), prev_word)
+        ):  # inside a token, or the end of a sentence.
+            return _number_to_words(match.group("int"), "", "") + "."
+        ordinal_ending = "e" if prev_word in _ORDINAL_E_ARTICLES else "en"
+
+    return _number_to_words(
+        match.group("int"), match.group("frac") or "", ordinal_ending
+    )
+
+
 def replace_nums_with_german(german: str) -> str:
-    words = german.strip().split(" ")
-    for word_i, word in enumerate(words):
-        if word[0].isdigit():
-            last_digit_i = len(word) - 1
-            for i in range(len(word) - 1, -1, -1):
-                if word[i].isdigit():
-                    last_digit_i = i
-                    break
-            num_str = word[0 : last_digit_i + 1]
-            german = num_to_german(int(num_str))
-            words[word_i] = german + word[last_digit_i + 1 :]
-    german = " ".join(words)
-
-    return german
+    """
+    Returns the text with every number in it written out as German words
+    in a single pass, including numbers inside tokens (3er -> dreier),
+    decimals (3,5 -> dreikommafünf) and ordinals (am 3. Mai -> am dritten Mai).
+    """
+    return _NUMBER.sub(_replace_number, german.strip())
@@ -0,0 +1,288 @@
+"""
+File: _pipeline.py
+
+Description: Converts lines in a pipeline of threads connected by bounded
+             queues, so that eSpeak phonemizes one batch while the batches
+             before it are post-processed and tagged by gender.
+
+    segment:      splits the lines into batches and prepares their text.
+    espeak:       phonemizes each batch (libespeak-ng releases the GIL).
+    postprocess:  improves the IPA and styles the nouns by gender.
+
+    The caller's thread joins the finished segments back into lines.
+    Every stage handles its batches in order, so the output order is kept.
+
+"""
+
+import queue
+import sys
+import threading
+import time
+from functools import partial
+
+import _metrics
+from convert import (
+    _iter_segments,
+    _join_lines,
+    _text_to_process,
+    process_sentence,
+    quarantine,
+)
+from ipa import DEFAULT_PROFILE, _improve_ipa, _phonemize, _prepare_german
+from _segment import DEFAULT_BATCH_SIZE, batch_segments, count_tokens
+
+DEFAULT_QUEUE_SIZE = 4  # batches waiting in front of each stage.
+
+_DONE = object()  # put into a queue after the last batch.
+
+
+class StageStats:
+    """
+    Counts what one stage did: batches handled, seconds spent working,
+    and how many batches were waiting in its output queue after each put.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.batches = 0
+        self.busy = 0.0
+        self.depth_total = 0
+        self.depth_max = 0
+
+    def record(self, busy: float, depth: int) -> None:
+        self.batches += 1
+        self.busy += busy
+        self.depth_total += depth
+        self.depth_max = max(self.depth_max, depth)
+
+    def mean_depth(self) -> float:
+        return self.depth_total / self.batches if self.batches > 0 else 0.0
+
+
+class PipelineStats:
+    """
+    The stats of every stage of one run. A stage whose output queue
+    stays empty while its input queue stays full is the bottleneck.
+    """
+
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.stages = [
+            StageStats(name) for name in ["segment", "espeak", "postprocess"]
+        ]
+        self.elapsed = 0.0
+        self.tuner = None  # the BatchSizeTuner of --batch-size auto, if any.
+
+    def report(self, file=None) -> None:
+        if file is None:  # looked up now, in case it's been redirected.
+            file = sys.stderr
+        print(f"Pipeline stats ({self.elapsed:.2f} s):", file=file)
+        print(
+            f"\t{'stage':<12}{'batches':>8}{'busy s':>9}{'busy %':>8}"
+            f"{'out queue':>11}{'max':>5}",
+            file=file,
+        )
+        for stage in self.stages:
+            busy_percent = 100 * stage.busy / self.elapsed if self.elapsed else 0
+            print(
+                f"\t{stage.name:<12}{stage.batches:>8}{stage.busy:>9.2f}"
+                f"{busy_percent:>7.0f}%{stage.mean_depth():>11.1f}"
+                f"{stage.depth_max:>3}/{self.queue_size}",
+                file=file,
+            )
+        if self.tuner is not None:
+            self.tuner.report(file)
+
+
+# Each stage quarantines the items it fails on (see `convert.quarantine`)
+# and only passes the rest on to the next stage.
+
+
+def _segment_stage(batch: list, on_error=None, color_by_gender: bool = False):
+    """
+    Returns (batch, to_process, prepared), where `prepared` is the text
+    of each of the batch's unprocessed items made ready for eSpeak.
+    """
+    to_process = []
+    prepared = []
+    for item in batch:
+        if item[2] is None:
+            try:
+                prepared.append(_prepare_german(item[0]))
+                to_process.append(item)
+            except Exception as e:
+                quarantine(item, e, on_error, color_by_gender)
+    return (batch, to_process, prepared)
+
+
+def _espeak_stage(
+    work: tuple, on_error=None, tuner=None, color_by_gender: bool = False
+):
+    batch, to_process, prepared = work
+    start = time.perf_counter()
+    try:
+        ipas = _phonemize([german for german, _ in prepared])
+    except Exception:
+        if on_error is None:
+            raise
+        kept = []
+        ipas = []
+        for item, (german, hyphen_word_indices) in zip(to_process, prepared):
+            try:
+                ipas.append(_phonemize([german])[0])
+                kept.append((item, (german, hyphen_word_indices)))
+            except Exception as e:
+                quarantine(item, e, on_error, color_by_gender)
+        to_process = [item for item, _ in kept]
+        prepared = [prepared_text for _, prepared_text in kept]
+    if tuner is not None:
+        num_tokens = sum(count_tokens(german) for german, _ in prepared)
+        tuner.record(num_tokens, time.perf_counter() - start)
+    return (batch, to_process, prepared, ipas)
+
+
+def _postprocess_stage(
+    work: tuple, color_by_gender: bool, store, profile: str, on_error=None
+):
+    batch, to_process, prepared, ipas = work
+    stored = []
+    for item, (german, hyphen_word_indices), ipa in zip(to_process, prepared, ipas):
+        try:
+            full_ipa = _improve_ipa(german, ipa, hyphen_word_indices, profile)
+            item[2] = process_sentence(item[0], color_by_gender, full_ipa=full_ipa)
+            stored.append((item[0], item[2]))
+        except Exception as e:
+            quarantine(item, e, on_error, color_by_gender)
+    if store is not None and len(stored) > 0:
+        store.put_many(stored)
+    return batch
+
+
+def convert_lines_pipelined(
+    lines,
+    color_by_gender: bool,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    store=None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    stats: PipelineStats = None,
+    profile: str = DEFAULT_PROFILE,
+    on_error=None,
+    tuner=None,
+):
+    """
+    Yields the same (word_line, ipa_line) tuples as `convert.convert_lines`,
+    with its stages running in their own threads.
+    An exception in any stage is raised here, in the caller's thread.
+    If `stats` are given, they're filled in as the pipeline runs.
+    If `on_error` is given, sentences that raise are quarantined
+    like `convert.convert_lines` does, from the stage they failed in.
+    If a BatchSizeTuner is given, it picks the tokens of every batch
+    from how long the eSpeak calls before took (sentences are still split
+    into clauses at `batch_size` tokens).
+    """
+    if stats is None:
+        stats = PipelineStats(queue_size)
+    stats.tuner = tuner
+    stopping = threading.Event()  # set once the caller stops reading.
+    queues = [queue.Queue(maxsize=queue_size) for _ in stats.stages]
+
+    def put(out_queue, item) -> None:
+        while not stopping.is_set():
+            try:
+                out_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def drain(in_queue):
+        while not stopping.is_set():
+            try:
+                work = in_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if work is _DONE:
+                return
+            yield work
+
+    def run(stage_stats, work_items, out_queue, handle, reads_input) -> None:
+        try:
+            work_items = iter(work_items)
+            while True:
+                # The first stage reads, splits and batches the lines
+                # while it pulls its next batch, so that's part of its work;
+                # the others only wait for theirs.
+                start = time.perf_counter()
+                work = next(work_items, _DONE)
+                if work is _DONE:
+                    break
+                if stopping.is_set():
+                    return
+                if not reads_input:
+                    start = time.perf_counter()
+                # Exceptions of earlier stages are passed on to the caller.
+                result = work if isinstance(work, BaseException) else handle(work)
+                busy = time.perf_counter() - start
+                stage_stats.record(busy, out_queue.qsize())
+                if _metrics.enabled:
+                    _metrics.STAGE_SECONDS.observe(busy, stage=stage_stats.name)
+                put(out_queue, result)
+        except BaseException as e:
+            put(out_queue, e)
+        put(out_queue, _DONE)
+
+    items = _iter_segments(lines, batch_size, store)
+    batches = batch_segments(items, tuner or batch_size, get_text=_text_to_process)
+    stage_args = [
+        (
+            batches,
+            partial(
+                _segment_stage, on_error=on_error, color_by_gender=color_by_gender
+            ),
+        ),
+        (
+            drain(queues[0]),
+            partial(
+                _espeak_stage,
+                on_error=on_error,
+                tuner=tuner,
+                color_by_gender=color_by_gender,
+            ),
+        ),
+        (
+            drain(queues[1]),
+            partial(
+                _postprocess_stage,
+                color_by_gender=color_by_gender,
+                store=store,
+                profile=profile,
+                on_error=on_error,
+            ),
+        ),
+    ]
+    threads = [
+        threading.Thread(
+            target=run,
+            args=(stage_stats, work_items, out_queue, handle, i == 0),
+            daemon=True,
+        )
+        for i, (stage_stats, (work_items, handle), out_queue) in enumerate(
+            zip(stats.stages, stage_args, queues)
+        )
+    ]
+
+    def finished_batches():
+        for batch in drain(queues[-1]):
+            if isinstance(batch, BaseException):
+                raise batch
+            yield batch
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        yield from _join_lines(finished_batches())
+    finally:
+        stopping.set()
+        for thread in threads:
+            thread.join()
+        stats.elapsed = time.perf_counter() - start
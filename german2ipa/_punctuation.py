@@ -0,0 +1,7 @@
+PUNCTUATION = ".,,:?;!\"'-[]‘„“«»…"
+
+
+def remove_punctuation(s: str) -> str:
+    for c in PUNCTUATION:
+        s = s.replace(c, "")
+    return s
@@ -0,0 +1,84 @@
+"""
+File: _result_store.py
+
+Description: A local on-disk store of processed sentences,
+             so that re-running on an edited document
+             only has to process the sentences that changed.
+
+    Results are keyed by a hash of the sentence and the options
+    it was processed with, so a store can be shared between documents.
+
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import _metrics
+
+# Bump this whenever the output for the same input can change,
+# so stale results are never spliced into new output.
+STORE_VERSION = "8"
+
+DEFAULT_STORE_PATH = Path.home() / ".cache" / "german2ipa" / "results.sqlite3"
+
+
+class ResultStore:
+    """
+    Maps (sentence, options) -> (word_line, ipa_line).
+    `options` is a string describing every option that affects the output,
+    e.g. "html" if nouns are styled by gender.
+    A store can be shared by several threads (e.g. the stages of a pipeline).
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, options: str = ""):
+        os.makedirs(Path(path).parent, exist_ok=True)
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(key BLOB PRIMARY KEY, word_line TEXT, ipa_line TEXT)"
+        )
+        self.prefix = f"{STORE_VERSION}\n{options}\n".encode("utf-8")
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, sentence: str) -> bytes:
+        return hashlib.sha1(self.prefix + sentence.encode("utf-8")).digest()
+
+    def get(self, sentence: str):
+        """
+        Returns the stored (word_line, ipa_line) for the sentence, or None.
+        """
+        key = self._key(sentence)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT word_line, ipa_line FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if _metrics.enabled:
+            _metrics.STORE_LOOKUPS.inc(result="miss" if row is None else "hit")
+        return row
+
+    def put_many(self, results: list) -> None:
+        """
+        Stores a list of (sentence, (word_line, ipa_line)) and commits.
+        """
+        rows = [
+            (self._key(sentence), word_line, ipa_line)
+            for sentence, (word_line, ipa_line) in results
+        ]
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)", rows
+            )
+            self.connection.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
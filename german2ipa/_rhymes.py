@@ -0,0 +1,254 @@
+"""
+File: _rhymes.py
+
+Description: A pronunciation index for rhyme and sound-pattern searches,
+             stored in a memory-mapped lexicon file (see gender/_lexicon.py).
+
+    Every (word, IPA) pair is stored in four sorted tables, keyed by
+        ipa             the IPA as `german_to_ipa` writes it,
+        ipa_ending      the same IPA reversed,
+        sound           the IPA without stress, length and tie marks,
+        sound_ending    the sound reversed,
+    as "key<tab>word<tab>ipa<newline>" strings, and a "version" table holds
+    the STORE_VERSION it was built with, since its IPA goes stale just like
+    stored results do. A sorted table finds every key
+    starting with a prefix by binary search, so the words ending in a sound
+    are a prefix search of the reversed keys, and a pattern with a fixed start
+    or end only has to be matched against the keys in that range,
+    which is decoded in one go and searched with a single regex.
+
+    Querying only opens the index, so it never loads eSpeak.
+
+"""
+
+import os
+import re
+from pathlib import Path
+
+from _compressed_io import open_text
+from _punctuation import PUNCTUATION
+from _result_store import STORE_VERSION
+from gender._lexicon import open_lexicon, write_lexicon
+
+DEFAULT_INDEX_PATH = Path.home() / ".cache" / "german2ipa" / "rhymes.lex"
+
+TABLES = ["ipa", "ipa_ending", "sound", "sound_ending"]
+
+# Left out of the sound: primary/secondary stress, long/half-long,
+# the non-syllabic mark (aɪ̯ -> aɪ) and tie bars.
+_SOUND_MARKS = str.maketrans("", "", "ˈˌːˑ\u032f\u035c\u0361")
+_VOWELS = "Yaɛeɪiɔoœøʊuʏyəɐ"  # ipa.VOWELS and the vocalised r.
+_PATTERN_TOKEN = re.compile(r"\[!?\]?[^\]]*\]|.", re.DOTALL)
+
+
+def sound_of(ipa: str) -> str:
+    """
+    Returns the IPA without stress, length and tie marks.
+    """
+    return ipa.translate(_SOUND_MARKS)
+
+
+def rhyme_part(ipa: str) -> str:
+    """
+    Returns the part of a word's IPA that a rhyme has to match:
+    from the vowel of its (last) primary stress, or its first vowel
+    if it has no stress mark, to the end.
+    """
+    stressed = ipa[ipa.rfind("ˈ") + 1 :]
+    for i, c in enumerate(stressed):
+        if c in _VOWELS:
+            return stressed[i:]
+    return stressed
+
+
+def _entries(word: str, ipa: str) -> dict:
+    sound = sound_of(ipa)
+    return {
+        "ipa": f"{ipa}\t{word}\t{ipa}\n",
+        "ipa_ending": f"{ipa[::-1]}\t{word}\t{ipa}\n",
+        "sound": f"{sound}\t{word}\t{ipa}\n",
+        "sound_ending": f"{sound[::-1]}\t{word}\t{ipa}\n",
+    }
+
+
+def _is_literal(token: str) -> bool:
+    return token not in ("*", "?") and not (len(token) > 1 and token[0] == "[")
+
+
+def _token_regex(token: str) -> str:
+    if token == "*":
+        return "[^\t\n]*"
+    if token == "?":
+        return "[^\t\n]"
+    if _is_literal(token):
+        return re.escape(token)
+    if token.startswith("[!"):
+        return f"[^\t\n{token[2:-1]}]"
+    return token
+
+
+def noun_words() -> list:
+    """
+    Returns every word of the bundled noun lists, capitalised.
+    """
+    from gender.get_genders import _read_lists
+
+    words = set()
+    for table in _read_lists().values():
+        words.update(w[0].upper() + w[1:] for w in table if len(w) > 0)
+    return sorted(words)
+
+
+def _transcribe(texts: list) -> list:
+    """
+    Returns the IPA of each text, or None for those that raise.
+    """
+    from ipa import german_to_ipa, german_to_ipa_batch
+
+    try:
+        return german_to_ipa_batch(texts)
+    except Exception:
+        ipas = []
+        for text in texts:
+            try:
+                ipas.append(german_to_ipa(text))
+            except Exception:
+                ipas.append(None)
+        return ipas
+
+
+def transcribe_words(words, chunk_size: int = 500):
+    """
+    Yields the (word, ipa) of every word, each transcribed on its own
+    (words that can't be transcribed are left out).
+    """
+    words = list(words)
+    for start in range(0, len(words), chunk_size):
+        chunk = words[start : start + chunk_size]
+        for word, ipa in zip(chunk, _transcribe(chunk)):
+            if ipa is not None:
+                yield (word, ipa)
+
+
+def transcribe_corpus(paths, chunk_size: int = 200):
+    """
+    Yields the (word, ipa) of every word of the (possibly compressed)
+    text files, transcribed in the context of their line. Lines that can't be
+    transcribed, or whose IPA doesn't have one word per word of the text
+    (e.g. because of numbers), are left out.
+    """
+    for path in paths:
+        with open_text(path) as file:
+            lines = [line.strip() for line in file if len(line.strip()) > 0]
+        for start in range(0, len(lines), chunk_size):
+            chunk = lines[start : start + chunk_size]
+            for line, ipa_line in zip(chunk, _transcribe(chunk)):
+                if ipa_line is None:
+                    continue
+                words = line.split()
+                ipas = ipa_line.split()
+                if len(words) != len(ipas):
+                    continue
+                for word, ipa in zip(words, ipas):
+                    word = word.strip(PUNCTUATION)
+                    ipa = ipa.strip(PUNCTUATION)
+                    if word.isalpha() and len(ipa) > 0:
+                        yield (word, ipa)
+
+
+def build_index(path, pairs) -> int:
+    """
+    Writes an index of the (word, ipa) pairs to `path`
+    and returns the number of distinct pairs.
+    """
+    tables = {name: set() for name in TABLES}
+    for word, ipa in pairs:
+        for name, entry in _entries(word, ipa).items():
+            tables[name].add(entry)
+
+    tables["version"] = [STORE_VERSION]
+    os.makedirs(Path(path).parent, exist_ok=True)
+    write_lexicon(path, tables)
+    return len(tables["ipa"])
+
+
+class RhymeIndex:
+    """
+    A memory-mapped index written by `build_index`.
+    Every query returns a list of (word, ipa) in the order of the table
+    it was answered from, at most `limit` of them if one is given.
+    Raises ValueError if the file isn't such an index,
+    or was built with IPA that has changed since.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.tables = open_lexicon(path)
+        if any(name not in self.tables for name in TABLES):
+            raise ValueError(f"{path} is not a rhyme index.")
+        if STORE_VERSION not in self.tables.get("version", ()):
+            raise ValueError(f"{path} was built with an older IPA.")
+
+    def __len__(self) -> int:
+        return len(self.tables["ipa"])
+
+    def _results(self, table_name: str, indices: range, limit: int = None) -> list:
+        if limit is not None:
+            indices = indices[:limit]
+        entries = self.tables[table_name].joined(indices).splitlines()
+        return [tuple(entry.split("\t")[1:]) for entry in entries]
+
+    def ending(self, suffix: str, fuzzy: bool = True, limit: int = None) -> list:
+        """
+        Returns the words whose IPA ends in `suffix`. If `fuzzy`,
+        stress, length and tie marks are ignored in both; otherwise the
+        suffix has to have them exactly where `german_to_ipa` puts them.
+        """
+        table_name = "sound_ending" if fuzzy else "ipa_ending"
+        if fuzzy:
+            suffix = sound_of(suffix)
+        indices = self.tables[table_name].prefix_range(suffix[::-1])
+        return self._results(table_name, indices, limit)
+
+    def matching(self, pattern: str, fuzzy: bool = True, limit: int = None) -> list:
+        """
+        Returns the words whose IPA matches the shell-style `pattern`
+        (* for any sounds, ? for one character, [...] for one of them).
+        If `fuzzy`, stress, length and tie marks are ignored in both
+        (see `ending`).
+        Only the keys starting with the pattern's fixed start,
+        or ending with its fixed end, are matched.
+        """
+        if fuzzy:
+            pattern = sound_of(pattern)
+        forward, backward = ("sound", "sound_ending") if fuzzy else TABLES[:2]
+
+        tokens = _PATTERN_TOKEN.findall(pattern)
+        num_start = next(
+            (i for i, token in enumerate(tokens) if not _is_literal(token)),
+            len(tokens),
+        )
+        num_end = next(
+            (i for i, token in enumerate(reversed(tokens)) if not _is_literal(token)),
+            len(tokens),
+        )
+        by_start = self.tables[forward].prefix_range("".join(tokens[:num_start]))
+        by_end = self.tables[backward].prefix_range(
+            "".join(tokens[len(tokens) - num_end :])[::-1]
+        )
+        if len(by_end) < len(by_start):
+            # The keys are reversed, so the pattern is matched reversed too.
+            table_name, indices, tokens = backward, by_end, tokens[::-1]
+        else:
+            table_name, indices = forward, by_start
+
+        key = "".join(_token_regex(token) for token in tokens)
+        regex = re.compile(f"^{key}\t([^\t\n]*)\t(.*)$", re.MULTILINE)
+        matches = regex.finditer(self.tables[table_name].joined(indices))
+        return [match.groups() for match in matches][:limit]
+
+    def rhymes(self, ipa: str, limit: int = None) -> list:
+        """
+        Returns the words that rhyme with a word of the given IPA:
+        those that sound the same from its stressed vowel on.
+        """
+        return self.ending(rhyme_part(ipa), fuzzy=True, limit=limit)
@@ -0,0 +1,162 @@
+"""
+File: _segment.py
+
+Description: Splits German text into sentences (and overly long sentences
+             into clauses), and packs them into batches of a bounded number
+             of tokens so that no single eSpeak call grows without limit.
+
+"""
+
+from _nums import is_ordinal_before
+from gender.get_genders import NOUN_JOINING_CHAR
+
+DEFAULT_BATCH_SIZE = 200  # tokens per eSpeak call.
+
+# Lowercase abbreviations after which a period doesn't end a sentence.
+ABBREVIATIONS = {
+    "abb.",
+    "abs.",
+    "bd.",
+    "bspw.",
+    "bzgl.",
+    "bzw.",
+    "ca.",
+    "chr.",
+    "d.h.",
+    "dr.",
+    "etc.",
+    "evtl.",
+    "fr.",
+    "ggf.",
+    "hr.",
+    "inkl.",
+    "jh.",
+    "jhd.",
+    "kap.",
+    "mio.",
+    "mrd.",
+    "nr.",
+    "o.ä.",
+    "prof.",
+    "s.",
+    "sog.",
+    "st.",
+    "str.",
+    "tel.",
+    "u.a.",
+    "u.ä.",
+    "usw.",
+    "vgl.",
+    "z.b.",
+    "z.t.",
+}
+
+SENTENCE_ENDS = ".!?…"
+CLAUSE_ENDS = ",;:"
+CLOSING_CHARS = "\"'“”»«)]"
+
+
+def _ends_sentence(token: str, next_token: str, prev_token: str = "") -> bool:
+    """
+    Returns True if the `token` ends a sentence,
+    given the token that follows it (or "" at the end of the text)
+    and the one before it (or "" at the start).
+    """
+    stripped = token.rstrip(CLOSING_CHARS)
+    if len(stripped) == 0 or stripped[-1] not in SENTENCE_ENDS:
+        return False
+    if stripped[-1] != ".":
+        return True
+
+    bare = stripped.lstrip("\"'„“»«([").lower()
+    if bare in ABBREVIATIONS:
+        return False
+    if len(bare) == 2 and bare[0].isalpha():  # an initial, like "A."
+        return False
+    # An ordinal, like "am 3. Mai" or "im 21. Jahrhundert".
+    if bare[:-1].isdigit() and is_ordinal_before(next_token, prev_token):
+        return False
+    if len(next_token) > 0 and next_token[0].islower():
+        return False
+
+    return True
+
+
+def _split_long(tokens: list, max_tokens: int) -> list:
+    """
+    Splits the tokens of one sentence into clauses of at most `max_tokens`
+    tokens, preferring to break after a comma, semicolon or colon.
+    """
+    segments = []
+    start = 0
+    last_clause_end = None
+    for i, token in enumerate(tokens):
+        if i - start >= max_tokens:
+            end = last_clause_end if last_clause_end is not None else i
+            segments.append(tokens[start:end])
+            start = end
+            last_clause_end = None
+        if token.rstrip(CLOSING_CHARS)[-1:] in CLAUSE_ENDS:
+            last_clause_end = i + 1
+
+    if start < len(tokens):
+        segments.append(tokens[start:])
+
+    return segments
+
+
+def split_sentences(text: str, max_tokens: int = DEFAULT_BATCH_SIZE) -> list:
+    """
+    Returns the sentences of the text, one string per sentence.
+    Line breaks always end a sentence, abbreviations (z.B., Dr., ...),
+    initials and ordinals (am 3. Mai) don't.
+    Sentences longer than `max_tokens` tokens are split into clauses.
+
+    Text is only ever split on whitespace,
+    so words joined with the NOUN_JOINING_CHAR stay whole.
+    """
+    sentences = []
+    for line in text.splitlines():
+        tokens = line.split()
+        start = 0
+        for i, token in enumerate(tokens):
+            next_token = tokens[i + 1] if i + 1 < len(tokens) else ""
+            prev_token = tokens[i - 1] if i > 0 else ""
+            if len(next_token) == 0 or _ends_sentence(token, next_token, prev_token):
+                for segment in _split_long(tokens[start : i + 1], max_tokens):
+                    sentences.append(" ".join(segment))
+                start = i + 1
+
+    return sentences
+
+
+def count_tokens(text: str) -> int:
+    # eSpeak sees joined nouns as separate words.
+    return len(text.replace(NOUN_JOINING_CHAR, " ").split())
+
+
+def batch_segments(items, max_tokens: int = DEFAULT_BATCH_SIZE, get_text=None):
+    """
+    Yields lists of consecutive items whose texts add up to at most
+    `max_tokens` tokens (a single longer item gets a batch of its own).
+    `max_tokens` can also be a function returning it, which is called once
+    at the start of every batch (see _batch_tuner.py).
+    `get_text` returns an item's text; by default the items are the texts.
+    """
+    batch = []
+    num_tokens = 0
+    limit = 0
+    for item in items:
+        text = item if get_text is None else get_text(item)
+        item_tokens = count_tokens(text)
+        if len(batch) > 0 and num_tokens + item_tokens > limit:
+            yield batch
+            batch = []
+            num_tokens = 0
+        if len(batch) == 0:
+            limit = max_tokens() if callable(max_tokens) else max_tokens
+        batch.append(item)
+        num_tokens += item_tokens
+
+    if len(batch) > 0:
+        yield batch
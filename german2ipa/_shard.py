@@ -0,0 +1,215 @@
+"""
+File: _shard.py
+
+Description: Splits one input file into N shards that can be converted
+             on different machines, and merges their outputs back together.
+
+    Shard i of N covers the bytes [size * i / N, size * (i + 1) / N) of the
+    input, with both ends moved forward to the next line break, so every line
+    belongs to exactly one shard. The file is memory-mapped, so finding the
+    boundaries only touches the pages around them.
+
+    Every shard writes its output part (mytext-ipa.part-0-of-4.txt)
+    and, once that's complete, a manifest next to it (...part-0-of-4.json)
+    with the byte range it covered and its number of lines.
+    `merge` checks that the manifests cover the whole input
+    and concatenates the parts in order.
+
+"""
+
+import json
+import mmap
+import os
+import shutil
+from pathlib import Path
+
+from _html_writer import HtmlDocumentWriter
+
+
+def parse_shard(value: str) -> tuple:
+    """
+    Returns (index, count) for a shard given as "i/N", with 0 <= i < N.
+    Raises ValueError if it isn't one.
+    """
+    index, _, count = value.partition("/")
+    try:
+        index = int(index)
+        count = int(count)
+    except ValueError:
+        raise ValueError(f"--shard needs i/N, like 0/4 (got {value!r}).") from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"--shard {value}: i must be between 0 and N - 1.")
+    return (index, count)
+
+
+def _next_line_start(mapped, offset: int) -> int:
+    """
+    Returns the offset of the start of the first line at or after `offset`.
+    """
+    if offset == 0:
+        return 0
+    newline = mapped.find(b"\n", offset - 1)
+    return len(mapped) if newline == -1 else newline + 1
+
+
+def shard_range(path, index: int, count: int) -> tuple:
+    """
+    Returns the (start, end) byte range of shard `index` of `count`,
+    aligned to line boundaries.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return (0, 0)
+
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = _next_line_start(mapped, size * index // count)
+            end = _next_line_start(mapped, size * (index + 1) // count)
+    return (start, end)
+
+
+def iter_range_lines(path, start: int, end: int):
+    """
+    Yields the stripped lines in the byte range [start, end) of the file.
+    """
+    if end == start:
+        return  # empty files can't be memory-mapped.
+
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            mapped.seek(start)
+            while mapped.tell() < end:
+                yield mapped.readline().decode("utf-8").strip()
+
+
+def part_paths(output_path, index: int, count: int) -> tuple:
+    """
+    Returns the paths of the output part and the manifest
+    of shard `index` of `count` (mytext-ipa.txt -> mytext-ipa.part-0-of-4.txt).
+    """
+    output_path = Path(output_path)
+    stem = f"{output_path.stem}.part-{index}-of-{count}"
+    return (
+        output_path.with_name(f"{stem}.txt"),
+        output_path.with_name(f"{stem}.json"),
+    )
+
+
+def write_shard(
+    results,
+    input_path,
+    output_path,
+    shard: tuple,
+    byte_range: tuple,
+    words_only: bool = False,
+) -> dict:
+    """
+    Writes the (word_line, ipa_line) results of one shard (index, count)
+    to its output part, then its manifest, and returns the manifest.
+    If `words_only`, only the word lines are written (like --gender-only does).
+    """
+    part_path, _ = part_paths(output_path, *shard)
+    num_lines = 0
+    with open(part_path, "w", encoding="utf-8", buffering=1 << 16) as file:
+        for word_line, ipa_line in results:
+            if words_only:
+                file.write(f"{word_line}\n")
+            else:
+                file.write(f"{word_line}\t{ipa_line}\n")
+            num_lines += 1
+
+    return write_manifest(input_path, output_path, shard, byte_range, num_lines)
+
+
+def write_manifest(
+    input_path, output_path, shard: tuple, byte_range: tuple, num_lines: int
+) -> dict:
+    """
+    Writes the manifest of one shard (index, count) whose complete output part
+    has `num_lines` lines, and returns it.
+    """
+    index, count = shard
+    start, end = byte_range
+    part_path, manifest_path = part_paths(output_path, index, count)
+    manifest = {
+        "input": str(Path(input_path).resolve()),
+        "input_size": os.path.getsize(input_path),
+        "shard": index,
+        "shards": count,
+        "start": start,
+        "end": end,
+        "lines": num_lines,
+        "part": part_path.name,
+        "part_size": part_path.stat().st_size,
+    }
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def _iter_part_lines(part_paths_in_order: list):
+    for part_path in part_paths_in_order:
+        with open(part_path, "r", encoding="utf-8") as part_file:
+            for line in part_file:
+                yield line.rstrip("\n")
+
+
+def merge(input_path, parts_path, output_path, html_document: bool = False) -> int:
+    """
+    Concatenates the output parts of every shard of `input_path`,
+    which were written for the output path `parts_path`,
+    into `output_path` (as a complete HTML document if `html_document`),
+    and returns the number of lines.
+    Raises ValueError if a shard is missing, incomplete or out of date.
+    """
+    parts_path = Path(parts_path)
+    pattern = f"{parts_path.stem}.part-*-of-*.json"
+    manifests = []
+    for manifest_path in parts_path.parent.glob(pattern):
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            manifests.append(json.load(file))
+    if len(manifests) == 0:
+        raise ValueError(f"No shard manifests found for {parts_path}.")
+
+    manifests.sort(key=lambda m: m["start"])
+    count = manifests[0]["shards"]
+    input_size = os.path.getsize(input_path)
+    shards = sorted(m["shard"] for m in manifests)
+    if shards != list(range(count)) or any(m["shards"] != count for m in manifests):
+        missing = sorted(set(range(count)) - set(shards))
+        raise ValueError(f"Shards {missing} of {count} are missing or don't match.")
+
+    expected_start = 0
+    part_paths_in_order = []
+    for manifest in manifests:
+        shard = manifest["shard"]
+        part_path = parts_path.with_name(manifest["part"])
+        if manifest["input_size"] != input_size:
+            raise ValueError(f"{input_path} changed since shard {shard} was run.")
+        if manifest["start"] != expected_start:
+            raise ValueError(f"Shard {shard} doesn't start where the one before ends.")
+        if part_path.stat().st_size != manifest["part_size"]:
+            raise ValueError(f"{part_path} doesn't match its manifest.")
+        expected_start = manifest["end"]
+        part_paths_in_order.append(part_path)
+    if expected_start != input_size:
+        raise ValueError(f"The shards end at byte {expected_start} of {input_size}.")
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", buffering=1 << 16) as out_file:
+        if html_document:
+            with HtmlDocumentWriter(out_file, flush_every=1 << 30) as writer:
+                for line in _iter_part_lines(part_paths_in_order):
+                    word_line, tab, ipa_line = line.rpartition("\t")
+                    if tab == "":  # written with --gender-only.
+                        writer.write_line(ipa_line)
+                    else:
+                        writer.write_line(word_line, ipa_line)
+        else:
+            for part_path in part_paths_in_order:
+                with open(part_path, "r", encoding="utf-8") as part_file:
+                    shutil.copyfileobj(part_file, out_file, 1 << 20)
+    os.replace(tmp_path, output_path)
+    return sum(manifest["lines"] for manifest in manifests)
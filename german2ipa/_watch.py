@@ -0,0 +1,132 @@
+"""
+File: _watch.py
+
+Description: Watches a text file and re-renders its IPA output
+             every time the file is saved.
+
+    The process (and with it the eSpeak backend) stays loaded between saves,
+    and the results of every line are kept in memory,
+    so after a save only the lines that changed are processed again.
+    With `gender_only`, the nouns are only styled by their gender
+    and eSpeak is never loaded (nor is ipa imported, see ipa.py).
+
+"""
+
+import os
+import sys
+import time
+
+from _html_writer import HtmlDocumentWriter
+from tagging import tag_genders
+
+POLL_INTERVAL = 0.02  # seconds between checks of the file.
+
+
+def write_atomically(output_path, results, html_document: bool) -> None:
+    """
+    Writes the results to a temporary file next to `output_path`
+    and then renames it, so readers only ever see a complete file.
+    Results without IPA (None) are written as their German line only.
+    """
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", buffering=1 << 16) as file:
+        if html_document:
+            with HtmlDocumentWriter(file, flush_every=1 << 30) as writer:
+                for word_line, ipa_line in results:
+                    writer.write_line(word_line, ipa_line)
+        else:
+            for word_line, ipa_line in results:
+                if ipa_line is None:
+                    file.write(f"{word_line}\n")
+                else:
+                    file.write(f"{word_line}\t{ipa_line}\n")
+    os.replace(tmp_path, output_path)
+
+
+def render(
+    path,
+    output_path,
+    cache: dict,
+    color_by_gender: bool,
+    html_document: bool,
+    batch_size: int,
+    profile: str = None,
+    gender_only: bool = False,
+) -> int:
+    """
+    Processes the lines of `path` that aren't in the `cache` yet,
+    writes the output and returns the number of lines that were processed.
+    The `cache` (line -> result) is updated to hold only the current lines.
+    The IPA is written in the given profile (None: ipa.DEFAULT_PROFILE).
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        lines = [line.strip() for line in file]
+
+    new_lines = list(dict.fromkeys(line for line in lines if line not in cache))
+    if gender_only:
+        results = ((tag_genders(line), None) for line in new_lines)
+    else:
+        from convert import convert_lines  # loads eSpeak on first use.
+        from ipa import DEFAULT_PROFILE
+
+        results = convert_lines(
+            new_lines, color_by_gender, batch_size, profile=profile or DEFAULT_PROFILE
+        )
+    for line, result in zip(new_lines, results):
+        cache[line] = result
+
+    current = set(lines)
+    for line in [line for line in cache if line not in current]:
+        del cache[line]
+
+    write_atomically(output_path, [cache[line] for line in lines], html_document)
+    return len(new_lines)
+
+
+def watch(
+    path,
+    output_path,
+    color_by_gender: bool,
+    html_document: bool,
+    batch_size: int,
+    profile: str = None,
+    gender_only: bool = False,
+) -> None:
+    """
+    Re-renders `path` into `output_path` whenever it changes,
+    until interrupted with Ctrl+C.
+    """
+    cache = {}
+    last_seen = None
+    print(f"Watching {path} (Ctrl+C to stop).", file=sys.stderr)
+    try:
+        while True:
+            try:
+                stat = os.stat(path)
+                seen = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:  # some editors replace the file on save.
+                seen = None
+
+            if seen is not None and seen != last_seen:
+                last_seen = seen
+                start = time.perf_counter()
+                num_processed = render(
+                    path,
+                    output_path,
+                    cache,
+                    color_by_gender,
+                    html_document,
+                    batch_size,
+                    profile,
+                    gender_only,
+                )
+                elapsed = (time.perf_counter() - start) * 1000
+                print(
+                    f"Updated {output_path} ({num_processed} changed lines, "
+                    f"{elapsed:.0f} ms).",
+                    file=sys.stderr,
+                )
+
+            time.sleep(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,823 @@
+#!/usr/bin/env python3
+"""
+File: benchmark.py
+
+Description: Benchmarks for german2ipa.
+             Each section can be run on its own by name, e.g.
+                 py german2ipa/benchmark.py memory
+             Running it without arguments runs every section.
+
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import get_context
+
+from gender import get_genders as genders_module
+
+
+def _private_memory_kb() -> int:
+    """
+    Returns the anonymous memory (in KiB) of this process,
+    i.e. heap pages that can't be shared through the page cache.
+    """
+    try:
+        with open("/proc/self/smaps_rollup", "r") as file:
+            for line in file:
+                if line.startswith("Anonymous:"):
+                    return int(line.split()[1])
+    except OSError:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _memory_worker(lexicon_path, words, queue) -> None:
+    before = _private_memory_kb()
+    if lexicon_path is not None:
+        genders_module.use_shared_lexicon(lexicon_path)
+
+    for word in words:
+        genders_module.get_genders(word)
+    queue.put(_private_memory_kb() - before)
+
+
+def bench_memory_per_worker(num_workers: int = 4) -> None:
+    """
+    Starts `num_workers` fresh worker processes that each look up every noun
+    once, and reports how much private memory each worker needed for it,
+    once with per-process sets and once with the shared memory-mapped lexicon.
+    """
+    words = sorted(
+        w[0].upper() + w[1:]
+        for name, words in genders_module._read_lists().items()
+        for w in words
+        if len(w) > 0
+    )
+    lexicon_path = os.path.join(tempfile.mkdtemp(), "nouns.lex")
+    genders_module.build_shared_lexicon(lexicon_path)
+
+    print(f"memory per worker ({num_workers} workers, {len(words)} lookups each):")
+    context = get_context("spawn")
+    for label, path in [("sets", None), ("shared lexicon", lexicon_path)]:
+        queue = context.Queue()
+        workers = [
+            context.Process(target=_memory_worker, args=(path, words, queue))
+            for _ in range(num_workers)
+        ]
+        for worker in workers:
+            worker.start()
+        used = [queue.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        print(f"\t{label:<16}{sum(used) / len(used) / 1024:8.2f} MiB private")
+
+    os.remove(lexicon_path)
+
+
+def bench_lexicon_lookups() -> None:
+    """
+    Reports the time of one membership test in the sets
+    and in the memory-mapped lexicon.
+    """
+    sets = genders_module._read_lists()
+    lexicon_path = os.path.join(tempfile.mkdtemp(), "nouns.lex")
+    genders_module.build_shared_lexicon(lexicon_path)
+
+    from gender._lexicon import open_lexicon
+
+    tables = open_lexicon(lexicon_path)
+    words = sorted(w for words in sets.values() for w in words)
+
+    print(f"lexicon lookups ({len(words)} words):")
+    for label, table in [
+        ("sets", sets["der_singulars"]),
+        ("shared lexicon", tables["der_singulars"]),
+    ]:
+        start = time.perf_counter()
+        for word in words:
+            word in table
+        elapsed = time.perf_counter() - start
+        print(f"\t{label:<16}{elapsed / len(words) * 1e9:8.0f} ns/lookup")
+
+    os.remove(lexicon_path)
+
+
+SENTENCE_TEMPLATES = [
+    "Der {} steht neben dem {}.",
+    "Wir haben die {} und das {} gesehen.",
+    "Ohne den {} kann sie die {} nicht finden.",
+    "Im {} wartet ein {} auf die {}.",
+    "Er erzählt von der {}, während die Kinder spielen.",
+]
+
+# Words whose stresses were put back in the wrong place before,
+# with the IPA they should get.
+STRESS_CHECKS = {
+    "Region": "ʁeːɡiːˈoːn",  # not between a lengthened vowel and its "ː".
+    "Religion": "ʁeːlɪɡiːˈoːn",
+}
+
+
+def sample_sentences(count: int = 500, seed: int = 0) -> list:
+    """
+    Returns a fixed list of German sentences built from the bundled noun lists,
+    so that every benchmark runs over the same text without network access.
+    """
+    import random
+
+    nouns = sorted(
+        w[0].upper() + w[1:]
+        for name in ["der_singulars", "die_singulars", "das_singulars"]
+        for w in genders_module._read_lists()[name]
+        if w.isalpha()
+    )
+    rng = random.Random(seed)
+    sentences = []
+    for i in range(count):
+        template = SENTENCE_TEMPLATES[i % len(SENTENCE_TEMPLATES)]
+        sentences.append(
+            template.format(*rng.sample(nouns, template.count("{}")))
+        )
+    return sentences
+
+
+def check_genders_batch(num_sentences: int = 10_000) -> None:
+    """
+    Looks up the genders of every capitalised word of the sample sentences
+    one at a time and with `get_genders_batch`, and checks that
+    the results are the same. Exits with an error if they aren't.
+    """
+    try:
+        import numpy  # noqa: F401
+
+        ending_rules = "numpy"
+    except ImportError:
+        ending_rules = "ending tables"
+
+    words = [
+        word.strip(".,")
+        for sentence in sample_sentences(num_sentences)
+        for word in sentence.split()
+        if word[0].isupper()
+    ]
+    genders_module._load_sets()
+
+    start = time.perf_counter()
+    scalar = [genders_module.get_genders(word) for word in words]
+    scalar_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = genders_module.get_genders_batch(words)
+    batch_elapsed = time.perf_counter() - start
+    mismatches = sum(a != b for a, b in zip(scalar, batch))
+
+    print(f"genders batch ({len(words)} words, {len(set(words))} distinct):")
+    print(f"\t{'one at a time':<16}{len(words) / scalar_elapsed:10.0f} words/s")
+    print(f"\t{'batch':<16}{len(words) / batch_elapsed:10.0f} words/s ({ending_rules})")
+    print(f"\t{'mismatches':<16}{mismatches:10}")
+    if mismatches > 0:
+        sys.exit(1)
+
+
+def bench_tagging() -> None:
+    """
+    Compares tagging genders only (no eSpeak) with a full conversion.
+    """
+    from tagging import tag_genders
+
+    sentences = sample_sentences()
+    start = time.perf_counter()
+    for sentence in sentences:
+        tag_genders(sentence)
+    elapsed = time.perf_counter() - start
+    print(f"tagging ({len(sentences)} sentences):")
+    print(f"\t{'gender only':<16}{len(sentences) / elapsed:10.0f} sentences/s")
+
+    try:
+        from convert import convert_lines
+    except ImportError as e:
+        print(f"\t{'full conversion':<16}skipped ({e})")
+        return
+
+    list(convert_lines(sentences[:5], True))  # loads eSpeak.
+    start = time.perf_counter()
+    for sentence in sentences:
+        list(convert_lines([sentence], True))
+    elapsed = time.perf_counter() - start
+    print(f"\t{'full conversion':<16}{len(sentences) / elapsed:10.0f} sentences/s")
+
+
+def bench_backends() -> None:
+    """
+    Reports the cost per word of each eSpeak backend on the same prepared text,
+    excluding the post-processing in `ipa.py`.
+    """
+    try:
+        import ipa
+        from _espeak_backend import load_library
+        from phonemizer.backend import EspeakBackend
+    except ImportError as e:
+        print(f"backends skipped ({e})")
+        return
+
+    texts = [ipa._prepare_german(sentence)[0] for sentence in sample_sentences()]
+    num_words = sum(len(text.split()) for text in texts)
+    phonemizer_backend = EspeakBackend(
+        "de", preserve_punctuation=True, with_stress=True
+    )
+    backends = [("phonemizer", phonemizer_backend), ("libespeak-ng", load_library())]
+
+    print(f"backends ({len(texts)} sentences, {num_words} words):")
+    for label, backend in backends:
+        if backend is None:
+            print(f"\t{label:<16}skipped (library not found)")
+            continue
+        backend.phonemize(texts[:5], strip=True)  # warms up.
+        start = time.perf_counter()
+        for text in texts:
+            backend.phonemize([text], strip=True)
+        per_call = (time.perf_counter() - start) / num_words
+        start = time.perf_counter()
+        backend.phonemize(texts, strip=True)
+        batched = (time.perf_counter() - start) / num_words
+        print(
+            f"\t{label:<16}{per_call * 1e6:8.1f} µs/word"
+            f"{batched * 1e6:8.1f} µs/word batched"
+        )
+
+
+def bench_profiles() -> None:
+    """
+    Reports the throughput of each IPA output profile, both for the
+    post-processing alone (on text eSpeak already phonemized)
+    and for whole conversions.
+    """
+    try:
+        import ipa
+    except ImportError as e:
+        print(f"profiles skipped ({e})")
+        return
+
+    sentences = sample_sentences()
+    prepared = [ipa._prepare_german(sentence) for sentence in sentences]
+    ipas = ipa._phonemize([german for german, _ in prepared])
+
+    print(f"profiles ({len(sentences)} sentences):")
+    for profile in ipa.PROFILES:
+        start = time.perf_counter()
+        for (german, hyphen_word_indices), raw in zip(prepared, ipas):
+            ipa._improve_ipa(german, raw, hyphen_word_indices, profile)
+        post_processing = len(sentences) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for sentence in sentences:
+            ipa.german_to_ipa(sentence, profile)
+        total = len(sentences) / (time.perf_counter() - start)
+        print(
+            f"\t{profile:<16}{post_processing:10.0f} sentences/s post-processing"
+            f"{total:10.0f} sentences/s in total"
+        )
+
+
+def bench_rule_groups() -> None:
+    """
+    Reports, per rule group of the IPA post-processing, how many words
+    ran it and how many skipped it because its trigger chars were absent.
+    """
+    try:
+        import ipa
+    except ImportError as e:
+        print(f"rule groups skipped ({e})")
+        return
+
+    sentences = sample_sentences()
+    prepared = [ipa._prepare_german(sentence) for sentence in sentences]
+    ipas = ipa._phonemize([german for german, _ in prepared])
+
+    for counts in ipa.rule_group_counts.values():
+        counts[:] = [0, 0]
+    ipa.count_rule_groups = True
+    for (german, hyphen_word_indices), raw in zip(prepared, ipas):
+        ipa._improve_ipa(german, raw, hyphen_word_indices)
+    ipa.count_rule_groups = False
+
+    print(f"rule groups ({len(sentences)} sentences):")
+    run_total = 0
+    skipped_total = 0
+    for group, (run, skipped) in ipa.rule_group_counts.items():
+        run_total += run
+        skipped_total += skipped
+        print(f"\t{group:<16}{run:8d} run{skipped:8d} skipped")
+    avoided = 100 * skipped_total / max(1, run_total + skipped_total)
+    print(f"\t{'all':<16}{avoided:8.0f}% of the evaluations avoided")
+
+
+def bench_stresses() -> None:
+    """
+    Reports how long putting eSpeak's stress marks back into a rewritten
+    word takes, and how many of the marks are kept (a lone stress on the
+    first syllable is left out on purpose).
+    """
+    try:
+        import ipa
+    except ImportError as e:
+        print(f"stresses skipped ({e})")
+        return
+
+    sentences = sample_sentences(300)
+    prepared = [ipa._prepare_german(sentence) for sentence in sentences]
+    ipas = ipa._phonemize([german for german, _ in prepared])
+
+    calls = []
+    put_stresses_back = ipa._put_stresses_back
+
+    def record(*args):
+        calls.append(args)
+        return put_stresses_back(*args)
+
+    ipa._put_stresses_back = record
+    try:
+        for (german, hyphen_word_indices), raw in zip(prepared, ipas):
+            ipa._improve_ipa(german, raw, hyphen_word_indices)
+    finally:
+        ipa._put_stresses_back = put_stresses_back
+
+    start = time.perf_counter()
+    results = [put_stresses_back(*args) for args in calls]
+    elapsed = (time.perf_counter() - start) / max(1, len(calls))
+    marks = sum(old_ipa.count("ˈ") + old_ipa.count("ˌ") for old_ipa, *_ in calls)
+    kept = sum(result.count("ˈ") + result.count("ˌ") for result in results)
+
+    wrong = [
+        word
+        for word, expected in STRESS_CHECKS.items()
+        if ipa.german_to_ipa(word) != expected
+    ]
+
+    print(f"stresses ({len(calls)} words):")
+    print(f"\t{'re-insertion':<16}{elapsed * 1e6:8.1f} µs/word")
+    print(f"\t{'marks kept':<16}{kept:8d} of {marks}")
+    print(f"\t{'wrong':<16}{len(wrong):8d} of {len(STRESS_CHECKS)} {' '.join(wrong)}")
+    if len(wrong) > 0:
+        sys.exit(1)
+
+
+def bench_overlap() -> None:
+    """
+    Reports the latency of a single `process_sentence` call with --html,
+    with the nouns tagged while eSpeak runs and one after the other.
+    """
+    try:
+        from convert import german_to_ipa, process_sentence
+    except ImportError as e:
+        print(f"overlap skipped ({e})")
+        return
+
+    sentences = sample_sentences(300)
+    for sentence in sentences[:5]:
+        process_sentence(sentence, True)  # starts the pool and loads the nouns.
+
+    print(f"overlap ({len(sentences)} single-sentence calls):")
+    for label, convert in [
+        ("overlapped", lambda s: process_sentence(s, True)),
+        ("serial", lambda s: process_sentence(s, True, german_to_ipa(s))),
+    ]:
+        start = time.perf_counter()
+        for sentence in sentences:
+            convert(sentence)
+        elapsed = (time.perf_counter() - start) / len(sentences)
+        print(f"\t{label:<16}{elapsed * 1e6:8.0f} µs/sentence")
+
+
+def bench_metrics() -> None:
+    """
+    Reports the time `convert_lines` takes with --html
+    with the metrics disabled and enabled.
+    """
+    try:
+        import _metrics
+        from convert import convert_lines
+    except ImportError as e:
+        print(f"metrics skipped ({e})")
+        return
+
+    sentences = sample_sentences(500)
+    list(convert_lines(sentences[:20], True))  # loads eSpeak and the nouns.
+
+    print(f"metrics ({len(sentences)} sentences, best of 3):")
+    for enabled in [False, True]:
+        _metrics.enabled = enabled
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            list(convert_lines(sentences, True))
+            timings.append(time.perf_counter() - start)
+        elapsed = min(timings) / len(sentences)
+        label = "enabled" if enabled else "disabled"
+        print(f"\t{label:<16}{elapsed * 1e6:8.0f} µs/sentence")
+    _metrics.enabled = False
+
+
+def check_threads(num_threads: int = 8) -> None:
+    """
+    Converts the sample sentences from `num_threads` threads at once,
+    starting with the noun lists unloaded, and checks that the lists were
+    loaded exactly once and that every result matches a serial run.
+    Exits with an error if they don't.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    try:
+        from convert import process_sentence
+    except ImportError as e:
+        print(f"threads skipped ({e})")
+        return
+
+    sentences = sample_sentences(200)
+    genders_module._sets_loaded = False
+    read_lists = genders_module._read_lists
+    num_loads = []
+    genders_module._read_lists = lambda: num_loads.append(1) or read_lists()
+    barrier = threading.Barrier(num_threads)
+
+    def convert(start: int) -> list:
+        barrier.wait()  # all threads hit the cold lists together.
+        return [
+            process_sentence(sentence, True)
+            for sentence in sentences[start:] + sentences[:start]
+        ]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(num_threads) as pool:
+        offsets = [i * len(sentences) // num_threads for i in range(num_threads)]
+        threaded = list(pool.map(convert, offsets))
+    elapsed = time.perf_counter() - start
+    genders_module._read_lists = read_lists
+
+    serial = [process_sentence(sentence, True) for sentence in sentences]
+    mismatches = 0
+    for offset, results in zip(offsets, threaded):
+        mismatches += sum(
+            result != serial[(offset + i) % len(sentences)]
+            for i, result in enumerate(results)
+        )
+
+    print(f"threads ({num_threads} threads x {len(sentences)} sentences):")
+    print(f"\t{'noun list loads':<16}{len(num_loads):10d}")
+    print(f"\t{'mismatches':<16}{mismatches:10d}")
+    throughput = num_threads * len(sentences) / elapsed
+    print(f"\t{'throughput':<16}{throughput:10.0f} sentences/s")
+    if mismatches > 0 or len(num_loads) != 1:
+        sys.exit(1)
+
+
+def bench_columnar(num_lines: int = 100_000) -> None:
+    """
+    Compares reading `num_lines` results back from a text output
+    into a list of (word_line, ipa_line) tuples with memory-mapping
+    a columnar file of them: time to load, private memory,
+    and the time to get the words and genders of 10000 random lines.
+    """
+    import random
+
+    try:
+        from convert import convert_lines
+    except ImportError as e:
+        print(f"columnar skipped ({e})")
+        return
+    from _columnar import ColumnarWriter, open_results, split_tagged
+
+    results = list(convert_lines(sample_sentences(), True))
+    directory = tempfile.mkdtemp()
+    text_path = os.path.join(directory, "results.txt")
+    columns_path = os.path.join(directory, "results.cols")
+    with open(text_path, "w", encoding="utf-8") as file:
+        with ColumnarWriter(columns_path) as writer:
+            for i in range(num_lines):
+                word_line, ipa_line = results[i % len(results)]
+                file.write(f"{word_line}\t{ipa_line}\n")
+                writer.write(word_line, ipa_line)
+    indices = random.Random(0).sample(range(num_lines), 10000)
+
+    print(f"columnar ({num_lines} lines):")
+    before = _private_memory_kb()
+    start = time.perf_counter()
+    with open(text_path, "r", encoding="utf-8") as file:
+        loaded = [tuple(line.rstrip("\n").split("\t")) for line in file]
+    load = time.perf_counter() - start
+    memory = _private_memory_kb() - before
+    start = time.perf_counter()
+    for i in indices:
+        split_tagged(loaded[i][0])
+    lookup = (time.perf_counter() - start) / len(indices)
+    size = os.path.getsize(text_path)
+    del loaded
+    rows = [("tuples", load, memory, lookup, size)]
+
+    before = _private_memory_kb()
+    start = time.perf_counter()
+    columns = open_results(columns_path)
+    load = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in indices:
+        columns.line(i)
+    lookup = (time.perf_counter() - start) / len(indices)
+    memory = _private_memory_kb() - before
+    rows.append(("columnar", load, memory, lookup, os.path.getsize(columns_path)))
+
+    for label, load, memory, lookup, size in rows:
+        print(
+            f"\t{label:<16}{load * 1000:8.1f} ms to load"
+            f"{memory / 1024:8.1f} MiB private{lookup * 1e6:8.1f} µs/line"
+            f"{size / 2**20:8.1f} MiB on disk"
+        )
+    os.remove(text_path)
+    os.remove(columns_path)
+
+
+def bench_compression(num_lines: int = 200_000) -> None:
+    """
+    Writes a corpus of `num_lines` sentences in every compression
+    and reports how long writing it and reading its lines back take,
+    and its size on disk.
+    """
+    from _compressed_io import COMPRESSIONS, open_text
+
+    lines = [f"{sentence}\n" for sentence in sample_sentences(num_lines)]
+    directory = tempfile.mkdtemp()
+
+    print(f"compression ({num_lines} lines):")
+    for extension in [""] + list(COMPRESSIONS):
+        label = COMPRESSIONS.get(extension, "none")
+        path = os.path.join(directory, f"corpus.txt{extension}")
+        try:
+            start = time.perf_counter()
+            with open_text(path, "w") as file:
+                file.writelines(lines)
+            write = time.perf_counter() - start
+        except ImportError as e:
+            print(f"\t{label:<16}skipped ({e})")
+            continue
+        start = time.perf_counter()
+        with open_text(path) as file:
+            num_read = sum(1 for _ in file)
+        read = time.perf_counter() - start
+        print(
+            f"\t{label:<16}{write:8.2f} s to write{read:8.2f} s to read"
+            f"{os.path.getsize(path) / 2**20:8.1f} MiB on disk"
+        )
+        os.remove(path)
+        if num_read != num_lines:
+            print(f"\t{label:<16}read {num_read} lines back")
+            sys.exit(1)
+
+
+def bench_rhymes() -> None:
+    """
+    Builds the pronunciation index of the noun lists and reports
+    how long rhyme and pattern queries take, against a linear scan.
+    """
+    try:
+        from _rhymes import (
+            RhymeIndex,
+            build_index,
+            noun_words,
+            sound_of,
+            transcribe_words,
+        )
+    except ImportError as e:
+        print(f"rhymes skipped ({e})")
+        return
+
+    pairs = list(transcribe_words(noun_words()))
+    index_path = os.path.join(tempfile.mkdtemp(), "rhymes.lex")
+    build_index(index_path, pairs)
+    index = RhymeIndex(index_path)
+
+    print(f"rhymes ({len(index)} words):")
+    queries = [
+        ("ending aɪtʊŋ", lambda: index.ending("aɪtʊŋ")),
+        ("match ʃt*ʊŋ", lambda: index.matching("ʃt*ʊŋ")),
+        ("match h?nt", lambda: index.matching("h?nt")),
+        ("rhymes hʊnt", lambda: index.rhymes("hʊnt")),
+    ]
+    for label, query in queries:
+        start = time.perf_counter()
+        for _ in range(100):
+            results = query()
+        elapsed = (time.perf_counter() - start) / 100
+        print(f"\t{label:<16}{elapsed * 1000:8.3f} ms{len(results):8d} words")
+
+    start = time.perf_counter()
+    [word for word, ipa in pairs if sound_of(ipa).endswith("aɪtʊŋ")]
+    elapsed = time.perf_counter() - start
+    print(f"\t{'scan ending':<16}{elapsed * 1000:8.3f} ms")
+    os.remove(index_path)
+
+
+def _scaling_worker(lines, num_threads, batch_size, barrier, results) -> None:
+    """
+    Converts `lines` in `num_threads` threads, each taking the next group
+    of lines of about `batch_size` words, once every worker has passed
+    the `barrier`, and puts what it measured into the `results` queue.
+    """
+    import queue
+    import resource
+
+    from convert import convert_lines
+    from _segment import batch_segments
+
+    list(convert_lines(lines[:5], True, batch_size))  # loads eSpeak and the nouns.
+    groups = queue.SimpleQueue()
+    for group in batch_segments(lines, batch_size):
+        groups.put(group)
+    latencies = []
+
+    def work() -> None:
+        while True:
+            try:
+                group = groups.get_nowait()
+            except queue.Empty:
+                return
+            start = time.monotonic()
+            list(convert_lines(group, True, batch_size))
+            # Every line of a group waits for the whole group.
+            latencies.extend([time.monotonic() - start] * len(group))
+
+    threads = [threading.Thread(target=work) for _ in range(num_threads)]
+    barrier.wait()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    end = time.monotonic()
+    cpu = resource.getrusage(resource.RUSAGE_SELF)
+    results.put(
+        {
+            "start": start,
+            "end": end,
+            "cpu": cpu.ru_utime + cpu.ru_stime - usage.ru_utime - usage.ru_stime,
+            "rss_kb": cpu.ru_maxrss,  # KiB on Linux.
+            "latencies": latencies,
+        }
+    )
+
+
+def _run_scaling_config(lines, processes, threads, batch_size) -> dict:
+    context = get_context("spawn")
+    # Every worker loads eSpeak first, then they all start converting together.
+    barrier = context.Barrier(processes)
+    results = context.Queue()
+    workers = [
+        context.Process(
+            target=_scaling_worker,
+            args=(lines[i::processes], threads, batch_size, barrier, results),
+        )
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    measured = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    wall = max(m["end"] for m in measured) - min(m["start"] for m in measured)
+    latencies = sorted(latency for m in measured for latency in m["latencies"])
+    cpu = sum(m["cpu"] for m in measured)
+    return {
+        "processes": processes,
+        "threads": threads,
+        "batch_size": batch_size,
+        "sentences_per_s": len(lines) / wall,
+        "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000,
+        "peak_rss_mib": sum(m["rss_kb"] for m in measured) / 1024,
+        "cpu_percent": 100 * cpu / wall,
+    }
+
+
+def find_knee(configs: list, share: float = 0.9) -> dict:
+    """
+    Returns the configuration with the fewest workers (processes x threads)
+    whose throughput is at least `share` of the best one,
+    i.e. the point after which more workers barely help.
+    """
+    best = max(config["sentences_per_s"] for config in configs)
+    return min(
+        (c for c in configs if c["sentences_per_s"] >= share * best),
+        key=lambda c: (c["processes"] * c["threads"], -c["sentences_per_s"]),
+    )
+
+
+def bench_scaling(
+    max_workers: int = None,
+    batch_sizes: tuple = (25, 100, 400),
+    num_sentences: int = 400,
+    json_path=None,
+) -> None:
+    """
+    Converts the same sample sentences with every combination of
+    1..`max_workers` processes (default: one per CPU), as many threads
+    per process and the `batch_sizes`, and reports the throughput,
+    p99 latency per sentence, summed peak RSS and CPU use of each,
+    and the knee point. The results are also written to `json_path`.
+    """
+    import json
+
+    try:
+        import convert  # only checks that eSpeak can be loaded.
+    except ImportError as e:
+        print(f"scaling skipped ({e})")
+        return
+
+    max_workers = max_workers or os.cpu_count() or 1
+    counts = sorted({2**i for i in range(max_workers.bit_length())} | {max_workers})
+    lines = sample_sentences(num_sentences)
+
+    print(
+        f"scaling ({len(lines)} sentences, {os.cpu_count()} CPUs):\n"
+        f"\t{'procs':>5}{'threads':>8}{'batch':>6}{'sent/s':>9}{'p99 ms':>9}"
+        f"{'RSS MiB':>9}{'CPU %':>7}"
+    )
+    configs = []
+    for processes in counts:
+        for threads in counts:
+            for batch_size in batch_sizes:
+                config = _run_scaling_config(lines, processes, threads, batch_size)
+                configs.append(config)
+                print(
+                    f"\t{processes:>5}{threads:>8}{batch_size:>6}"
+                    f"{config['sentences_per_s']:>9.0f}{config['p99_ms']:>9.1f}"
+                    f"{config['peak_rss_mib']:>9.1f}{config['cpu_percent']:>7.0f}"
+                )
+
+    knee = find_knee(configs)
+    print(
+        f"\tknee: {knee['processes']} processes x {knee['threads']} threads, "
+        f"batch size {knee['batch_size']} ({knee['sentences_per_s']:.0f} sent/s)"
+    )
+    if json_path is not None:
+        with open(json_path, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "sentences": len(lines),
+                    "cpus": os.cpu_count(),
+                    "configs": configs,
+                    "knee": knee,
+                },
+                file,
+                indent=2,
+            )
+        print(f"\twrote {json_path}")
+
+
+SECTIONS = {
+    "memory": bench_memory_per_worker,
+    "lookups": bench_lexicon_lookups,
+    "genders": check_genders_batch,
+    "tagging": bench_tagging,
+    "backends": bench_backends,
+    "profiles": bench_profiles,
+    "rules": bench_rule_groups,
+    "stresses": bench_stresses,
+    "overlap": bench_overlap,
+    "metrics": bench_metrics,
+    "threads": check_threads,
+    "columnar": bench_columnar,
+    "compression": bench_compression,
+    "rhymes": bench_rhymes,
+    "scaling": bench_scaling,
+}
+
+
+def main():
+    args = sys.argv[1:]
+    scaling_options = {}
+    for option, key, convert in [
+        ("--json", "json_path", str),
+        ("--max-workers", "max_workers", int),
+    ]:
+        if option in args:
+            i = args.index(option)
+            scaling_options[key] = convert(args[i + 1])
+            del args[i : i + 2]
+
+    names = args if len(args) > 0 else list(SECTIONS)
+    for name in names:
+        if name not in SECTIONS:
+            print(f"Unknown section {name}. Choose from: {', '.join(SECTIONS)}.")
+            sys.exit(1)
+        if name == "scaling":
+            bench_scaling(**scaling_options)
+        else:
+            SECTIONS[name]()
+        print()
+
+
+if __name__ == "__main__":
+    main()
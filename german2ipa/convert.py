@@ -0,0 +1,270 @@
+"""
+File: convert.py
+
+Description: Converts lines of German text into IPA,
+             optionally styling nouns by their grammatical gender.
+
+"""
+
+import html
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import _metrics
+from ipa import DEFAULT_PROFILE, german_to_ipa, german_to_ipa_batch
+from _punctuation import PUNCTUATION
+from _remove_joining_chars import remove_joining_chars
+from tagging import tag_words, wrap_in_span
+from _segment import DEFAULT_BATCH_SIZE, split_sentences, batch_segments, count_tokens
+
+# Tags the nouns of sentences by gender while eSpeak transcribes them
+# (the eSpeak call releases the GIL). Started on first use.
+GENDER_WORKERS = min(4, os.cpu_count() or 1)
+_gender_pool = None
+_gender_pool_lock = threading.Lock()
+
+
+def _get_gender_pool() -> ThreadPoolExecutor:
+    global _gender_pool
+    with _gender_pool_lock:
+        if _gender_pool is None:
+            _gender_pool = ThreadPoolExecutor(
+                GENDER_WORKERS, thread_name_prefix="german2ipa-gender"
+            )
+    return _gender_pool
+
+
+def process_sentence(
+    german_text: str,
+    color_by_gender: bool,
+    full_ipa: str = None,
+    profile: str = DEFAULT_PROFILE,
+    spans: list = None,
+):
+    """
+    Returns a tuple of the German text and its IPA transcription
+    in the given output profile (see ipa.PROFILES).
+    If `color_by_gender` is True, both are escaped for HTML and their nouns
+    are wrapped in HTML spans with a class for their grammatical gender.
+    `full_ipa` can be given if the text has already been transcribed;
+    if it isn't, the nouns are tagged while the text is transcribed.
+    `spans` can be given if the nouns have already been tagged (see tag_words).
+    """
+    german_text = german_text.strip()
+    if len(german_text) == 0:
+        return ("", "")
+
+    words = german_text.split()
+    if full_ipa is None:
+        if color_by_gender and spans is None:
+            spans = _get_gender_pool().submit(tag_words, words)
+        full_ipa = german_to_ipa(german_text, profile)
+    transcriptions = full_ipa.split()
+
+    if color_by_gender and len(words) == len(transcriptions):
+        if spans is None:
+            spans = tag_words(words)
+        elif not isinstance(spans, list):  # still being tagged.
+            spans = spans.result()
+        word_results = []
+        ipa_results = []
+        for word, ipa, span in zip(words, transcriptions, spans):
+            if span is None:
+                word_results.append(html.escape(word, quote=False))
+                ipa_results.append(html.escape(ipa, quote=False))
+            else:
+                puncts = word[len(word.rstrip(PUNCTUATION)) :]
+                word_results.append(wrap_in_span(word, span))
+                ipa_results.append(wrap_in_span(ipa, span, puncts))
+
+        words_str = " ".join(word_results)
+        ipa_str = " ".join(ipa_results)
+        words_str, _ = remove_joining_chars(words_str, "")
+        return (words_str, ipa_str)
+
+    """ Get rid of hyphens. """
+
+    german_text, _ = remove_joining_chars(german_text, "")
+    if color_by_gender:
+        german_text = html.escape(german_text, quote=False)
+        full_ipa = html.escape(full_ipa, quote=False)
+
+    return (german_text, full_ipa)
+
+
+def process_sentences(
+    sentences: list, color_by_gender: bool, profile: str = DEFAULT_PROFILE
+) -> list:
+    """
+    Returns the results of `process_sentence` for each of the sentences,
+    transcribing all of them with a single call to the eSpeak backend.
+    The nouns are tagged while they're transcribed.
+    """
+    sentences = [sentence.strip() for sentence in sentences]
+    to_transcribe = [sentence for sentence in sentences if len(sentence) > 0]
+    tagged = None
+    if color_by_gender and len(to_transcribe) > 0:
+        tagged = _get_gender_pool().submit(_tag_sentences, to_transcribe)
+    ipas = iter(german_to_ipa_batch(to_transcribe, profile) if to_transcribe else [])
+    spans = iter(tagged.result() if tagged is not None else [])
+    return [
+        process_sentence(
+            sentence,
+            color_by_gender,
+            full_ipa=next(ipas) if len(sentence) > 0 else None,
+            spans=next(spans, None) if len(sentence) > 0 else None,
+        )
+        for sentence in sentences
+    ]
+
+
+def _tag_sentences(sentences: list) -> list:
+    return [tag_words(sentence.split()) for sentence in sentences]
+
+
+def _iter_segments(lines, max_tokens: int, store=None):
+    """
+    Yields [segment, ends_line, result] for every sentence or clause
+    of the lines, where `result` is the segment's result if it's already
+    in the `store`, or None if it still has to be processed.
+    An empty line yields a single empty segment.
+    """
+    for line in lines:
+        segments = split_sentences(line, max_tokens) or [""]
+        for i, segment in enumerate(segments):
+            result = ("", "") if len(segment) == 0 else None
+            if result is None and store is not None:
+                result = store.get(segment)
+            yield [segment, i == len(segments) - 1, result]
+
+
+def _text_to_process(item) -> str:
+    # Segments that are already done only count as one token towards a batch.
+    return item[0] if item[2] is None else "-"
+
+
+def quarantine(
+    item: list, error: Exception, on_error, color_by_gender: bool = False
+) -> None:
+    """
+    Gives a segment that couldn't be processed its text without any IPA
+    as its result (escaped for HTML if `color_by_gender`)
+    and reports it with `on_error(segment, error)`.
+    Raises the `error` instead if there's no `on_error`.
+    """
+    if on_error is None:
+        raise error
+    on_error(item[0], error)
+    if _metrics.enabled:
+        _metrics.QUARANTINED.inc()
+    text, _ = remove_joining_chars(item[0], "")
+    if color_by_gender:
+        text = html.escape(text, quote=False)
+    item[2] = (text, "")
+
+
+def _process_batch(
+    batch: list,
+    color_by_gender: bool,
+    store=None,
+    profile: str = DEFAULT_PROFILE,
+    on_error=None,
+    tuner=None,
+) -> list:
+    """
+    Fills in the result of every item of the batch that doesn't have one yet
+    (adding the new results to the `store`, if any) and returns the batch.
+    If processing the batch raises and `on_error` is given, its segments
+    are processed one by one and those that still raise are quarantined.
+    The time it took is recorded with the `tuner`, if any.
+    """
+    to_process = [item for item in batch if item[2] is None]
+    if tuner is not None and len(to_process) == 0:
+        tuner.record(0, 0.0)
+    if len(to_process) > 0:
+        start = time.perf_counter()
+        sentences = [segment for segment, _, _ in to_process]
+        try:
+            results = process_sentences(sentences, color_by_gender, profile)
+        except Exception:
+            if on_error is None:
+                raise
+            results = []
+            for item in to_process:
+                try:
+                    results.append(
+                        process_sentence(item[0], color_by_gender, profile=profile)
+                    )
+                except Exception as e:
+                    quarantine(item, e, on_error, color_by_gender)
+                    results.append(None)
+
+        stored = []
+        for item, result in zip(to_process, results):
+            if result is not None:
+                item[2] = result
+                stored.append((item[0], result))
+        if store is not None and len(stored) > 0:
+            store.put_many(stored)
+        if tuner is not None:
+            num_tokens = sum(count_tokens(sentence) for sentence in sentences)
+            tuner.record(num_tokens, time.perf_counter() - start)
+        if _metrics.enabled:
+            _metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="batch")
+    return batch
+
+
+def _join_lines(batches):
+    """
+    Yields a (word_line, ipa_line) tuple for every line
+    from the processed batches of its segments, in order.
+    """
+    word_parts = []
+    ipa_parts = []
+    for batch in batches:
+        for _, ends_line, (word_str, ipa_str) in batch:
+            if len(word_str) > 0:
+                word_parts.append(word_str)
+                ipa_parts.append(ipa_str)
+            if ends_line:
+                if _metrics.enabled:
+                    _metrics.LINES.inc()
+                yield (" ".join(word_parts), " ".join(ipa_parts))
+                word_parts = []
+                ipa_parts = []
+
+
+def convert_lines(
+    lines,
+    color_by_gender: bool,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    store=None,
+    profile: str = DEFAULT_PROFILE,
+    on_error=None,
+    tuner=None,
+):
+    """
+    Yields a (word_line, ipa_line) tuple for every line, in order.
+    Lines are split into sentences and clauses, which are sent to eSpeak
+    in batches of at most `batch_size` tokens, so long paragraphs
+    don't turn into one giant call and short lines don't each pay for a call.
+    `lines` can be any iterable; it's consumed lazily.
+
+    If a ResultStore is given, only sentences that aren't in it
+    are processed (and then added to it); the rest are taken from the store.
+    The IPA is written in the given output profile (see ipa.PROFILES).
+
+    If `on_error` is given, a sentence that raises is quarantined instead:
+    it's reported with `on_error(sentence, error)` and gets no IPA.
+
+    If a BatchSizeTuner is given (see _batch_tuner.py), it picks the tokens
+    of every batch instead, from how long the batches before took.
+    """
+    items = _iter_segments(lines, batch_size, store)
+    batches = batch_segments(items, tuner or batch_size, get_text=_text_to_process)
+    yield from _join_lines(
+        _process_batch(batch, color_by_gender, store, profile, on_error, tuner)
+        for batch in batches
+    )
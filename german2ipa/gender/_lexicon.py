@@ -0,0 +1,188 @@
+"""
+Filename: _lexicon.py
+---
+Description: A read-only string lexicon stored in a single file
+             that is memory-mapped instead of loaded into Python objects.
+
+    Every worker process that opens the same file shares the same pages
+    of the OS page cache, so the noun lists cost nothing per process
+    beyond a handful of small view objects.
+
+    Layout (native byte order, recorded in the header):
+        header:     magic (8 bytes), byte order (1 byte), padding,
+                    u32 table count.
+        directory:  one entry per table: name (32 bytes), u32 count,
+                    u32 hash slots, u64 offsets of the string data,
+                    the offset array and the hash index.
+        per table:  the sorted UTF-8 strings concatenated,
+                    a u32 offset array with (count + 1) entries,
+                    a u32 open-addressing hash index of (string index + 1),
+                    where 0 marks an empty slot.
+
+"""
+
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+
+MAGIC = b"G2ILEX01"
+_HEADER = struct.Struct("<8sc3xI")
+_ENTRY = struct.Struct("<32sIIQQQ")
+_BYTE_ORDER = b"L" if sys.byteorder == "little" else b"B"
+
+
+def _hash_slots(count: int) -> int:
+    slots = 8
+    while slots < count * 2:
+        slots *= 2
+    return slots
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def write_lexicon(path, tables: dict) -> None:
+    """
+    Writes the given tables (name -> iterable of str) to `path`.
+    The file is written to a temporary path first and then renamed,
+    so concurrent readers never see a half-written lexicon.
+    """
+    encoded_tables = []
+    for name, strings in tables.items():
+        encoded = sorted({s.encode("utf-8") for s in strings})
+        encoded_tables.append((name.encode("utf-8"), encoded))
+
+    offset = _HEADER.size + _ENTRY.size * len(encoded_tables)
+    entries = []
+    blobs = []
+    for name, encoded in encoded_tables:
+        strings = b"".join(encoded)
+        offsets = array("I", [0])
+        for s in encoded:
+            offsets.append(offsets[-1] + len(s))
+
+        slots = _hash_slots(len(encoded))
+        index = array("I", bytes(4 * slots))
+        for i, s in enumerate(encoded):
+            slot = zlib.crc32(s) & (slots - 1)
+            while index[slot] != 0:
+                slot = (slot + 1) & (slots - 1)
+            index[slot] = i + 1
+
+        strings_off = _align(offset)
+        offsets_off = _align(strings_off + len(strings))
+        hash_off = _align(offsets_off + len(offsets) * offsets.itemsize)
+        offset = hash_off + len(index) * index.itemsize
+
+        entries.append(
+            _ENTRY.pack(name, len(encoded), slots, strings_off, offsets_off, hash_off)
+        )
+        blobs.append((strings_off, strings))
+        blobs.append((offsets_off, offsets.tobytes()))
+        blobs.append((hash_off, index.tobytes()))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(_HEADER.pack(MAGIC, _BYTE_ORDER, len(entries)))
+        for entry in entries:
+            file.write(entry)
+        for blob_off, blob in blobs:
+            file.write(bytes(blob_off - file.tell()))
+            file.write(blob)
+    os.replace(tmp_path, path)
+
+
+class StringTable:
+    """
+    A read-only, set-like view of one table inside a memory-mapped lexicon.
+    Supports `in`, `len()` and iteration (in sorted order),
+    just like the sets of strings it replaces.
+    """
+
+    def __init__(
+        self, buffer: memoryview, count, slots, strings_off, offsets_off, hash_off
+    ):
+        self._count = count
+        self._mask = slots - 1
+        self._strings = buffer[strings_off:offsets_off]
+        self._offsets = buffer[offsets_off : offsets_off + 4 * (count + 1)].cast("I")
+        self._hash = buffer[hash_off : hash_off + 4 * slots].cast("I")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, word) -> bool:
+        if not isinstance(word, str):
+            return False
+        key = word.encode("utf-8")
+        slot = zlib.crc32(key) & self._mask
+        while True:
+            index = self._hash[slot]
+            if index == 0:
+                return False
+            if self._strings[self._offsets[index - 1] : self._offsets[index]] == key:
+                return True
+            slot = (slot + 1) & self._mask
+
+    def __getitem__(self, i: int) -> str:
+        return bytes(self._strings[self._offsets[i] : self._offsets[i + 1]]).decode(
+            "utf-8"
+        )
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def joined(self, indices: range) -> str:
+        """
+        Returns the strings of a (step 1) range of indices,
+        decoded in one go and concatenated.
+        """
+        if len(indices) == 0:
+            return ""
+        start = self._offsets[indices.start]
+        return str(self._strings[start : self._offsets[indices.stop]], "utf-8")
+
+    def prefix_range(self, prefix: str) -> range:
+        """
+        Returns the range of indices of the strings starting with `prefix`,
+        found by binary search over the sorted table.
+        """
+        key = prefix.encode("utf-8")
+
+        def encoded(i: int) -> bytes:
+            return bytes(self._strings[self._offsets[i] : self._offsets[i + 1]])
+
+        # 0xFF never occurs in UTF-8, so it sorts after every continuation.
+        indices = range(self._count)
+        start = bisect_left(indices, key, key=encoded)
+        end = bisect_left(indices, key + b"\xff", lo=start, key=encoded)
+        return range(start, end)
+
+
+def open_lexicon(path) -> dict:
+    """
+    Memory-maps the lexicon at `path` and returns a dict
+    of table name -> StringTable.
+    Raises ValueError if the file isn't a lexicon for this machine.
+    """
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    buffer = memoryview(mapped)
+    magic, byte_order, table_count = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or byte_order != _BYTE_ORDER:
+        raise ValueError(f"{path} is not a lexicon file for this machine.")
+
+    tables = {}
+    for i in range(table_count):
+        name, *fields = _ENTRY.unpack_from(buffer, _HEADER.size + i * _ENTRY.size)
+        name = name.rstrip(b"\0").decode("utf-8")
+        tables[name] = StringTable(buffer, *fields)
+
+    return tables
@@ -24,7 +24,10 @@ Description: This contains the function to return
 
 """
 
+import os
 import sys
+import threading
+from functools import partial
 from pathlib import Path
 
 NOUN_JOINING_CHAR = "+"
@@ -32,6 +35,11 @@ NOUN_JOINING_CHAR = "+"
 USE_V_PLUS_FOR_INFINITIVES = True
 LISTS_DIR = Path(__file__).parent / "nouns"
 
+# If this environment variable is set, the noun lists are read
+# from a memory-mapped lexicon file at the given path instead of into sets,
+# so that many worker processes can share one copy. See `use_shared_lexicon`.
+SHARED_LEXICON_ENV = "GERMAN2IPA_LEXICON"
+
 
 def _load_words(article: str, singulars: list, plurals: list) -> None:
     file_path = LISTS_DIR / f"{article}.txt"
@@ -62,6 +70,46 @@ _weak_der_singulars = []
 _weak_der_declinations = []
 _plural_onlys = []
 
+# The sets are loaded once, by whichever thread first needs them.
+# `_sets_loaded` is only set after every set has been assigned,
+# so no thread can see some sets loaded and others still empty.
+_sets_lock = threading.RLock()
+_sets_loaded = False
+
+# The names of the sets above, as stored in a shared lexicon file.
+_LEXICON_TABLES = [
+    "der_singulars",
+    "der_plurals",
+    "die_singulars",
+    "die_plurals",
+    "das_singulars",
+    "das_plurals",
+    "verbs_das",
+    "weak_der_singulars",
+    "weak_der_declinations",
+    "plural_onlys",
+]
+
+
+def _read_lists() -> dict:
+    """
+    Reads every noun list from disk
+    and returns a dict of set name -> set of lowercase words.
+    """
+    lists = {name: [] for name in _LEXICON_TABLES}
+    _load_words("der", lists["der_singulars"], lists["der_plurals"])
+    _load_words("die", lists["die_singulars"], lists["die_plurals"])
+    _load_words("das", lists["das_singulars"], lists["das_plurals"])
+    _load_words("verbs-no-plural", lists["verbs_das"], [])
+    _load_words(
+        "der-special-declinations",
+        lists["weak_der_singulars"],
+        lists["weak_der_declinations"],
+    )
+    _load_words("plural-only", [], lists["plural_onlys"])
+
+    return {name: set(words) for name, words in lists.items()}
+
 
 def _load_sets():
     global _der_singulars, _der_plurals
@@ -70,30 +118,66 @@ def _load_sets():
     global _verbs_das
     global _weak_der_singulars, _weak_der_declinations
     global _plural_onlys
-    if len(_der_singulars) == 0:
-        _load_words("der", _der_singulars, _der_plurals)
-        _load_words("die", _die_singulars, _die_plurals)
-        _load_words("das", _das_singulars, _das_plurals)
-        _load_words("verbs-no-plural", _verbs_das, [])
-        _load_words(
-            "der-special-declinations",
-            _weak_der_singulars,
-            _weak_der_declinations,
-        )
-        _load_words("plural-only", [], _plural_onlys)
-
-        _der_singulars = set(_der_singulars)
-        _der_plurals = set(_der_plurals)
-
-        _die_singulars = set(_die_singulars)
-        _die_plurals = set(_die_plurals)
-
-        _das_singulars = set(_das_singulars)
-        _das_plurals = set(_das_plurals)
-        _verbs_das = set(_verbs_das)
-        _weak_der_singulars = set(_weak_der_singulars)
-        _weak_der_declinations = set(_weak_der_declinations)
-        _plural_onlys = set(_plural_onlys)
+    global _sets_loaded
+    if _sets_loaded:
+        return
+
+    with _sets_lock:
+        if _sets_loaded:  # loaded by another thread while this one waited.
+            return
+
+        if os.environ.get(SHARED_LEXICON_ENV):
+            use_shared_lexicon(os.environ[SHARED_LEXICON_ENV])
+            return
+
+        sets = _read_lists()
+        _der_singulars = sets["der_singulars"]
+        _der_plurals = sets["der_plurals"]
+
+        _die_singulars = sets["die_singulars"]
+        _die_plurals = sets["die_plurals"]
+
+        _das_singulars = sets["das_singulars"]
+        _das_plurals = sets["das_plurals"]
+        _verbs_das = sets["verbs_das"]
+        _weak_der_singulars = sets["weak_der_singulars"]
+        _weak_der_declinations = sets["weak_der_declinations"]
+        _plural_onlys = sets["plural_onlys"]
+        _sets_loaded = True
+
+
+def build_shared_lexicon(path) -> None:
+    """
+    Writes every noun list to a single lexicon file at `path`,
+    which can then be memory-mapped by `use_shared_lexicon`.
+    """
+    from ._lexicon import write_lexicon
+
+    write_lexicon(path, _read_lists())
+
+
+def use_shared_lexicon(path) -> None:
+    """
+    Replaces the noun sets with read-only tables
+    backed by the memory-mapped lexicon file at `path`.
+    The file is (re)built first if it's missing or older than the noun lists.
+    Membership tests behave exactly as they do with the sets,
+    and every process mapping the same file shares one copy of it.
+    """
+    global _sets_loaded
+    from ._lexicon import open_lexicon
+
+    with _sets_lock:
+        path = Path(path)
+        newest_list = max(p.stat().st_mtime for p in LISTS_DIR.glob("*.txt"))
+        if not path.exists() or path.stat().st_mtime < newest_list:
+            build_shared_lexicon(path)
+
+        tables = open_lexicon(path)
+        module_globals = globals()
+        for name in _LEXICON_TABLES:
+            module_globals[f"_{name}"] = tables[name]
+        _sets_loaded = True
 
 
 def _find_results(
@@ -123,54 +207,148 @@ def _find_results(
     return results
 
 
+_ABSOLUTE_RULES = dict(
+    grade="A",  # absolute
+    s_der=["ant", "ast", "eich", "ismus", "wert"],
+    s_die=[
+        "enz",
+        "heit",
+        "keit",
+        "schaft",
+        "sion",
+        "tion",
+        "tät",
+        "ung",
+        "macht",
+        "firma",
+    ],
+    s_das=["lein", "ing", "ment", "tum", "thema", "schema"],
+    prior_chen="dfghkmptvwxzß",
+    p_der=["eiche", "ismen", "werte"],
+    p_die=[
+        "enzen",
+        "heiten",
+        "keiten",
+        "schaften",
+        "sionen",
+        "tionen",
+        "täten",
+        "ungen",
+        "mächte",
+        "firmen",
+    ],
+    p_das=["inge", "mente", "tümer", "themen", "schemen"],
+)
+
+_GUESSING_RULES = dict(
+    grade="G",  # guessing
+    s_der=["ich", "eig", "or"],
+    s_die=["anz", "ur"],
+    s_das=["il", "ma", "nis"],
+    prior_chen="n",
+    p_der=["oren"],
+    p_die=["anzen", "uren"],
+    p_das=["nisse"],
+)
+
+
 def _get_gender_by_absolutes(word: str) -> list:
-    return _find_results(
-        word=word,
-        grade="A",  # absolute
-        s_der=["ant", "ast", "eich", "ismus", "wert"],
-        s_die=[
-            "enz",
-            "heit",
-            "keit",
-            "schaft",
-            "sion",
-            "tion",
-            "tät",
-            "ung",
-            "macht",
-            "firma",
-        ],
-        s_das=["lein", "ing", "ment", "tum", "thema", "schema"],
-        prior_chen="dfghkmptvwxzß",
-        p_der=["eiche", "ismen", "werte"],
-        p_die=[
-            "enzen",
-            "heiten",
-            "keiten",
-            "schaften",
-            "sionen",
-            "tionen",
-            "täten",
-            "ungen",
-            "mächte",
-            "firmen",
-        ],
-        p_das=["inge", "mente", "tümer", "themen", "schemen"],
-    )
+    return _find_results(word=word, **_ABSOLUTE_RULES)
 
 
 def _get_gender_by_guessing(word: str) -> list:
-    return _find_results(
-        word=word,
-        grade="G",  # guessing
-        s_der=["ich", "eig", "or"],
-        s_die=["anz", "ur"],
-        s_das=["il", "ma", "nis"],
-        prior_chen="n",
-        p_der=["oren"],
-        p_die=["anzen", "uren"],
-        p_das=["nisse"],
-    )
+    return _find_results(word=word, **_GUESSING_RULES)
+
+
+# Contextual articles. Each maps to the genders a following noun can have.
+CONTEXT_WINDOW = 5  # the number of previous words that are looked at.
+_ACCUSATIVE_PREPOSITIONS = ["bis", "durch", "gegen", "ohne", "um", "für"]
+_MASC_DETERMINERS = [
+    "den",
+    "einen",
+    "seinen",
+    "ihren",
+    "unseren",
+    "euren",
+    "deinen",
+    "meinen",
+    "jeden",
+    "eigenen",
+]
+_FEM_DETERMINERS = ["eine", "jede", "jene"]
+_FEM_OR_PLURAL_DETERMINERS = [
+    "die",
+    "seine",
+    "ihre",
+    "unsere",
+    "eure",
+    "deine",
+    "meine",
+    "eigene",
+]
+_PLURALS = ("pm", "pf", "pn", "po")
+
+
+def _build_context_index() -> tuple:
+    """
+    Returns the (bigram -> genders, determiner -> genders) lookup tables,
+    which are built once when the module is imported.
+    """
+    bigrams = {}
+    for prep in _ACCUSATIVE_PREPOSITIONS:
+        for determiner in _MASC_DETERMINERS:
+            bigrams[(prep, determiner)] = frozenset(["sm"])
+        for determiner in _FEM_DETERMINERS:
+            bigrams[(prep, determiner)] = frozenset(["sf"])
+        for determiner in _FEM_OR_PLURAL_DETERMINERS:
+            bigrams[(prep, determiner)] = frozenset(("sf",) + _PLURALS)
+
+    determiners = {
+        "das": frozenset(["sn", "v+"]),
+        "dem": frozenset(["sm", "sn", "v+"]),
+        "einem": frozenset(["sm", "sn", "v+"]),
+    }
+    return bigrams, determiners
+
+
+_CONTEXT_BIGRAMS, _CONTEXT_DETERMINERS = _build_context_index()
+_CONTEXT_WORDS = frozenset(
+    [w for bigram in _CONTEXT_BIGRAMS for w in bigram] + list(_CONTEXT_DETERMINERS)
+)
+
+
+def _refine_by_context(results: list, prev_words, word: str) -> list:
+    """
+    Returns only those `results` whose gender agrees with the nearest
+    contextual article before the noun (e.g. "für den", "dem"),
+    looking back at most CONTEXT_WINDOW words and never past another noun.
+    The `results` are returned unchanged if there's no such article
+    or if it contradicts all of them.
+    """
+    end = len(prev_words)
+    if end > 0 and prev_words[end - 1].lower() == word:
+        end -= 1
+
+    allowed = None
+    prev_lower = None
+    for i in range(end - 1, max(0, end - CONTEXT_WINDOW) - 1, -1):
+        lower = prev_words[i].lower() if prev_lower is None else prev_lower
+        prev_lower = prev_words[i - 1].lower() if i > 0 else ""
+        allowed = _CONTEXT_BIGRAMS.get((prev_lower, lower))
+        if allowed is None:
+            allowed = _CONTEXT_DETERMINERS.get(lower)
+        if allowed is not None:
+            break
+
+        w = prev_words[i]
+        if w[:1].isalpha() and w[0].isupper() and lower not in _CONTEXT_WORDS:
+            break  # reached the previous noun.
+
+    if allowed is None:
+        return results
+
+    refined = [r for r in results if r[:2] in allowed]
+    return refined if len(refined) > 0 else results
 
 
 def _syllabify(word: str):
@@ -364,8 +542,10 @@ def get_genders(word: str, sentence: str = "", can_be_inf_verb: bool = True) ->
     along with a grade of certainty from the program itself.
 
     word (str): The noun to get the genders for.
-    sentence (str): Optional. You can give the function the last ~5 words
-                    and have it better infer what the noun's gender should be.
+    sentence (str or list): Optional. You can give the function the last ~5 words
+                            (as a string or as a sequence of words)
+                            and have it better infer what the noun's gender
+                            should be from the articles before it.
     can_be_inf_verb (bool): If True, a word can be identified as "v+".
                             This is set to False when recursing.
 
@@ -390,16 +570,34 @@ def get_genders(word: str, sentence: str = "", can_be_inf_verb: bool = True) ->
     word = word.lower()
 
     _load_sets()
-    results = []
-
     flag = "L" if can_be_inf_verb else "C"
 
+    results = _get_genders_by_form(word, flag)
+    if results is not None:
+        return results
+
+    results = _get_genders_by_rules(word, flag, can_be_inf_verb)
+    if len(results) <= 1:
+        return results
+
+    if isinstance(sentence, str):
+        if len(sentence) < len(word):
+            return results
+        sentence = sentence.split()
+
+    return _refine_by_context(results, sentence, word)
+
+
+def _get_genders_by_form(word: str, flag: str):
+    """
+    Returns the genders of a lowercase word that has a plural-only ending
+    or is one of a few special forms, or None if it's neither.
+    """
     if any(word.endswith(plural) for plural in _plural_onlys):
         return [
             f"po({flag})",
         ]
 
-    is_infinitive = False
     if word in ["grunde"]:  # DATIV
         return [
             f"sm({flag})",
@@ -413,7 +611,32 @@ def get_genders(word: str, sentence: str = "", can_be_inf_verb: bool = True) ->
         return [
             f"sn({flag})",
         ]
+    return None
+
 
+def _get_genders_by_rules(
+    word: str, flag: str, can_be_inf_verb: bool, lookup=None
+) -> list:
+    """
+    Returns the genders of the lowercase word from the noun lists,
+    or else from its ending, or else from its parts (see `_get_gender_by_parts`).
+    """
+    results = _get_listed_genders(word, flag, can_be_inf_verb)
+    if len(results) == 0:
+        results = _get_gender_by_absolutes(word)
+        if len(results) == 0:
+            results = _get_gender_by_guessing(word)
+
+    if len(results) == 0:
+        results = _get_gender_by_parts(word, lookup)
+    return results
+
+
+def _get_listed_genders(word: str, flag: str, can_be_inf_verb: bool) -> list:
+    """
+    Returns the genders the noun lists give the lowercase word.
+    """
+    results = []
     if word in _der_singulars:
         results.append(f"sm({flag})")
     if word in _die_singulars:
@@ -441,95 +664,203 @@ def get_genders(word: str, sentence: str = "", can_be_inf_verb: bool = True) ->
     elif can_be_inf_verb:  # is infinitive.
         results.append(f"v+({flag})" if USE_V_PLUS_FOR_INFINITIVES else f"sn({flag})")
 
-    if len(results) == 0:
-        results = _get_gender_by_absolutes(word)
-        if len(results) == 0:
-            results = _get_gender_by_guessing(word)
+    return results
 
-    if len(results) == 0:
-        # If there are still no results, chop away one character
-        # at a time on the left side until results are met.
-        # Stop doing this around 1 syllables left.
-        subwords = word.split(NOUN_JOINING_CHAR)
-        syllables = [s for w in subwords for s in _syllabify(w)]
-        while len(syllables) > 1 and len(results) == 0:
-            syllables = syllables[1:]
-            search_term = "".join(syllables)
-            search_term = search_term[0].upper() + search_term[1:]
-            if len(search_term) <= 3:
-                break
-            results = get_genders(search_term, can_be_inf_verb=False)
 
-    if len(sentence) < len(word) or len(results) <= 1:
-        return results
+def _get_gender_by_parts(word: str, lookup=None) -> list:
+    """
+    Returns the genders of the first ending of the lowercase word
+    (its syllables, dropped one at a time from the left) that has any,
+    as given by `lookup(ending)` (by default `get_genders` of the ending).
+    """
+    if lookup is None:
+        lookup = partial(get_genders, can_be_inf_verb=False)
 
-    prev_words = sentence.split()
-    if prev_words[-1] == word:
-        prev_words = prev_words[:-1]
-
-    first_noun_i = next(
-        (
-            len(prev_words) - i - 1
-            for i, w in enumerate(reversed(prev_words))
-            if w[0].isupper() and w[0].isalpha
-        ),
-        -1,
-    )
-    if first_noun_i >= 0:
-        prev_words = prev_words[first_noun_i + 1 :]
-
-    # TODO: use contextual words to refine results.
-    # Looks for contextual articles.
-    MASC_TERMS = [
-        f"{prep} {word}"
-        for prep in ["bis", "durch", "gegen", "ohne", "um", "für"]
-        for word in [
-            "den",
-            "einen",
-            "seinen",
-            "ihren",
-            "Ihren",
-            "unseren",
-            "euren",
-            "deinen",
-            "meinen",
-            "jeden",
-            "eigenen",
-        ]
-    ]
-
-    FEM_TERMS = [
-        f"{prep} {word}"
-        for prep in ["bis", "durch", "gegen", "ohne", "um", "für"]
-        for word in ["eine", "jede", "jene"]
-    ]
-
-    FEM_OR_PLURAL_TERMS = [
-        f"{prep} {word}"
-        for prep in ["bis", "durch", "gegen", "ohne", "um", "für"]
-        for word in [
-            "die",
-            "seine",
-            "ihre",
-            "Ihre",
-            "unsere",
-            "eure",
-            "deine",
-            "meine",
-            "jede",
-            "eigene",
-        ]
-    ]
+    # Chop away one syllable at a time on the left side
+    # until results are met. Stop doing this around 1 syllables left.
+    results = []
+    subwords = word.split(NOUN_JOINING_CHAR)
+    syllables = [s for w in subwords for s in _syllabify(w)]
+    while len(syllables) > 1 and len(results) == 0:
+        syllables = syllables[1:]
+        search_term = "".join(syllables)
+        search_term = search_term[0].upper() + search_term[1:]
+        if len(search_term) <= 3:
+            break
+        results = lookup(search_term)
+    return results
 
-    NEUTRAL_TERMS = [
-        "das",
-    ]
-    MASC_OR_NEUTRAL_TERMS = [
-        "dem",
-        "einem",
-    ]
 
-    return results
+# The gender each category of `_find_results` stands for, and _NO_ENDING
+# for a word without any of its endings.
+_SINGULAR_CATEGORIES = ["sn", "sm", "sf", "sn"]  # -chen, der, die, das.
+_PLURAL_CATEGORIES = ["pn", "pm", "pf", "pn"]
+_NO_ENDING = 4
+
+# Below this many words, the ending tables are about as fast as NumPy,
+# which then isn't even imported.
+_NUMPY_MIN_WORDS = 1000
+
+
+def _ending_categories_numpy(numpy, words: list, rules: dict) -> tuple:
+    """
+    Returns the singular and the plural category of every word
+    (see `_ending_categories`), compared all at once: the reversed words
+    are code points in a matrix, one row per word, so a word ending in
+    an ending is a row starting with the reversed ending.
+    """
+    endings = [rules[name] for name in ["s_der", "s_die", "s_das"]]
+    endings += [rules[name] for name in ["p_der", "p_die", "p_das"]]
+    width = max(5, max(len(ending) for group in endings for ending in group))
+    padded = "".join(word[::-1][:width].ljust(width, "\0") for word in words)
+    codes = numpy.frombuffer(padded.encode("utf-32-le"), dtype=numpy.uint32)
+    codes = codes.reshape(len(words), width)
+
+    def ends_with_any(group: list):
+        found = numpy.zeros(len(words), dtype=bool)
+        for ending in group:
+            reversed_ending = [ord(c) for c in reversed(ending)]
+            found |= (codes[:, : len(ending)] == reversed_ending).all(axis=1)
+        return found
+
+    prior_chen = [ord(c) for c in rules["prior_chen"]]
+    chen = ends_with_any(["chen"]) & numpy.isin(codes[:, 4], prior_chen)
+    found = [ends_with_any(group) for group in endings]
+    singulars = numpy.select([chen] + found[:3], [0, 1, 2, 3], _NO_ENDING)
+    plurals = numpy.select([chen] + found[3:], [0, 1, 2, 3], _NO_ENDING)
+    return (singulars.tolist(), plurals.tolist())
+
+
+def _ending_categories(words: list, rules: dict) -> tuple:
+    """
+    Returns the singular and the plural category of every lowercase word
+    under the ending `rules` of `_find_results`: 0 for a -chen word,
+    1, 2 or 3 for a der, die or das ending, or _NO_ENDING.
+    Uses NumPy for many words if it's installed, and otherwise looks up
+    each of the word's endings in a table of every ending's category.
+    """
+    if len(words) >= _NUMPY_MIN_WORDS:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        if numpy is not None:
+            return _ending_categories_numpy(numpy, words, rules)
+
+    tables = []
+    for groups in [["s_der", "s_die", "s_das"], ["p_der", "p_die", "p_das"]]:
+        table = {}
+        for category, name in enumerate(groups, start=1):
+            for ending in rules[name]:
+                table.setdefault(ending, category)  # the first group wins.
+        tables.append(table)
+    lengths = sorted({len(ending) for table in tables for ending in table})
+
+    prior_chen = rules["prior_chen"]
+    categories = ([], [])
+    for word in words:
+        if len(word) >= 5 and word.endswith("chen") and word[-5] in prior_chen:
+            categories[0].append(0)
+            categories[1].append(0)
+            continue
+        endings = [word[-length:] for length in lengths if length <= len(word)]
+        for table, found in zip(tables, categories):
+            in_table = [table[ending] for ending in endings if ending in table]
+            found.append(min(in_table, default=_NO_ENDING))
+    return categories
+
+
+def _find_results_batch(words: list, rules: dict) -> list:
+    """
+    Returns `_find_results(word, **rules)` for every lowercase word.
+    """
+    grade = rules["grade"]
+    singular_results = [f"{g}({grade})" for g in _SINGULAR_CATEGORIES]
+    plural_results = [f"{g}({grade})" for g in _PLURAL_CATEGORIES]
+    batch_results = []
+    for singular, plural in zip(*_ending_categories(words, rules)):
+        results = []
+        if singular != _NO_ENDING:
+            results.append(singular_results[singular])
+        if plural != _NO_ENDING:
+            results.append(plural_results[plural])
+        batch_results.append(results)
+    return batch_results
+
+
+def _listed_words(words: set) -> set:
+    """
+    Returns those of the lowercase words that are in any noun list.
+    """
+    listed = set()
+    for name in _LEXICON_TABLES:
+        table = globals()[f"_{name}"]
+        if isinstance(table, (set, frozenset)):
+            listed |= words & table
+        else:  # a shared lexicon's table.
+            listed.update(word for word in words if word in table)
+    return listed
+
+
+def get_genders_batch(words, can_be_inf_verb: bool = True) -> list:
+    """
+    Returns `get_genders(word, can_be_inf_verb=can_be_inf_verb)`
+    for every word, much faster than calling it for each one.
+    Every distinct word is looked up once: the words in the noun lists
+    are found with set operations, the ending rules are applied to
+    all of the rest at once, and only words with none of those endings
+    are split into their syllables.
+    """
+    _load_sets()
+    flag = "L" if can_be_inf_verb else "C"
+
+    words = list(words)
+    lowers = {}  # word -> lowercase word, for every noun.
+    for word in dict.fromkeys(words):
+        if word[0].isalpha() and word[0].isupper():
+            lowers[word] = word.lower()
+
+    genders = {}
+    unknowns = []
+    unique_lowers = set(lowers.values())
+    listed = _listed_words(unique_lowers)
+    for word in unique_lowers:
+        results = _get_genders_by_form(word, flag)
+        if results is None and word in listed:
+            results = _get_listed_genders(word, flag, can_be_inf_verb)
+        if results is None or len(results) == 0:
+            unknowns.append(word)
+        else:
+            genders[word] = results
+
+    for rules in [_ABSOLUTE_RULES, _GUESSING_RULES]:
+        still_unknown = []
+        for word, results in zip(unknowns, _find_results_batch(unknowns, rules)):
+            if len(results) == 0:
+                still_unknown.append(word)
+            else:
+                genders[word] = results
+        unknowns = still_unknown
+
+    # The endings of compounds (and their endings) repeat a lot,
+    # so each gets the genders `get_genders` would give it only once.
+    ending_genders = {}
+
+    def lookup(ending: str) -> list:
+        if ending not in ending_genders:
+            results = []
+            if ending[0].isalpha() and ending[0].isupper():
+                lower = ending.lower()
+                results = _get_genders_by_form(lower, "C")
+                if results is None:
+                    results = _get_genders_by_rules(lower, "C", False, lookup)
+            ending_genders[ending] = results
+        return ending_genders[ending]
+
+    for word in unknowns:
+        genders[word] = _get_gender_by_parts(word, lookup)
+
+    return [list(genders[lowers[word]]) if word in lowers else [] for word in words]
 
 
 def main():
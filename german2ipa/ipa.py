@@ -13,9 +13,15 @@ pip install phonemizer regex espeakng
 """
 
 import os
+import threading
+import time
+from bisect import bisect_right
+from difflib import SequenceMatcher
 import regex as re
+import _metrics
 from _remove_joining_chars import remove_joining_chars
 from _nums import replace_nums_with_german
+from _punctuation import PUNCTUATION, remove_punctuation
 
 if os.name == "nt":  # on Windows.
     # Put this before importing phonemize or before the first phonemize() call
@@ -30,10 +36,18 @@ else:
     # os.environ["PHONEMIZER_ESPEAK_LIBRARY"] = "/usr/lib/x86_64-linux-gnu/libespeak-ng.so.1"
     pass
 
-from phonemizer import phonemize
+from _espeak_backend import load_library
 
+# How much of the output is refined, from slowest to fastest:
+#     full:            Wiktionary-style IPA with primary and secondary stresses.
+#     no-stress:       the same IPA without stress marks, which skips putting
+#                      eSpeak's stresses back into the rewritten words.
+#     raw-normalised:  eSpeak's own IPA with the language flags, punctuation
+#                      and stress marks removed; none of the rewriting rules run.
+# The last two are meant for search indexing and fuzzy matching.
+PROFILES = ("full", "no-stress", "raw-normalised")
+DEFAULT_PROFILE = "full"
 
-PUNCTUATION = ".,,:?;!\"'-[]‘„“«»…"
 
 # matches Latin letters (any accents) OR characters from common IPA blocks/diacritics
 PAT = re.compile(
@@ -60,12 +74,6 @@ def remove_parentheses(text: str) -> str:
     return re.sub(r"\([^()]*\)", "", text)
 
 
-def remove_punctuation(s: str) -> str:
-    for c in PUNCTUATION:
-        s = s.replace(c, "")
-    return s
-
-
 def break_ipa_by_r(ipa: str) -> list:
     results = [e for e in re.split(r"([Rɐʁɾrɜ])", ipa) if len(e) > 0]
 
@@ -93,8 +101,384 @@ def break_word_by_r(word: str) -> list:
     return combined
 
 
-def german_to_ipa(german: str) -> str:
+def _prepare_german(german: str):
+    """
+    Returns the German text made ready for eSpeak
+    along with the indices of the words that had joining chars.
+    """
+    # Convert any numbers into German words.
+    german = replace_nums_with_german(german)
+
+    return remove_joining_chars(german, " ")
+
+
+_backend = None
+
+# libespeak-ng keeps its state in globals (and phonemizer's backend isn't
+# thread-safe either), so only one thread at a time may create or call it.
+# Everything else in `german_to_ipa` works on local data and runs in parallel.
+_backend_lock = threading.Lock()
+
+
+def _get_backend():
+    """
+    Returns the eSpeak backend, creating it on first use.
+    It's kept for the life of the process, since loading it is expensive.
+    Must be called with `_backend_lock` held.
+
+    libespeak-ng is called directly when it can be found (see _espeak_backend.py),
+    otherwise phonemizer's EspeakBackend is used.
+    """
+    global _backend
+    if _backend is None:
+        _backend = load_library("de")
+    if _backend is None:
+        from phonemizer.backend import EspeakBackend
+
+        _backend = EspeakBackend(
+            "de",
+            preserve_punctuation=True,
+            with_stress=True,
+        )
+    return _backend
+
+
+def _phonemize(texts: list) -> list:
+    """
+    Returns eSpeak's IPA for each of the given texts, using one backend call.
+    """
+    to_phonemize = [text for text in texts if len(text.strip()) > 0]
+    ipas = []
+    if len(to_phonemize) > 0:
+        start = time.perf_counter() if _metrics.enabled else 0.0
+        with _backend_lock:
+            ipas = _get_backend().phonemize(to_phonemize, strip=True)
+        if _metrics.enabled:
+            _metrics.ESPEAK_SECONDS.observe(time.perf_counter() - start)
+            _metrics.ESPEAK_CALLS.inc()
+            _metrics.WORDS.inc(sum(len(text.split()) for text in to_phonemize))
+    ipas = iter(ipas)
+    return [next(ipas) if len(text.strip()) > 0 else "" for text in texts]
+
+
+def check_profile(profile: str) -> str:
+    """
+    Returns the `profile` if it's one of PROFILES, otherwise raises ValueError.
+    """
+    if profile not in PROFILES:
+        raise ValueError(
+            f"Unknown IPA profile {profile!r}. Choose from: {', '.join(PROFILES)}."
+        )
+    return profile
+
+
+def german_to_ipa(german: str, profile: str = DEFAULT_PROFILE) -> str:
+    """
+    Returns the IPA of the German text in the given output profile
+    (see PROFILES).
+    """
+    check_profile(profile)
+    german, hyphen_word_indices = _prepare_german(german)
+    ipa = _phonemize([german])[0]
+    return _improve_ipa(german, ipa, hyphen_word_indices, profile)
+
+
+def german_to_ipa_batch(texts: list, profile: str = DEFAULT_PROFILE) -> list:
+    """
+    Returns the IPA for each of the given texts,
+    phonemizing all of them in a single call to the eSpeak backend.
+    """
+    check_profile(profile)
+    prepared = [_prepare_german(german) for german in texts]
+    ipas = _phonemize([german for german, _ in prepared])
+    return [
+        _improve_ipa(german, ipa, hyphen_word_indices, profile)
+        for (german, hyphen_word_indices), ipa in zip(prepared, ipas)
+    ]
+
+
+# R and Y are placeholders.
+CONSONANTS = "Rbxçdfɡjkll̩mm̩nn̩ŋpzsʃtvʔʒ"
+VOWELS = "Yaɛeɪiɔoœøʊuʏyə"
+R_CHARS = "Rɐʁɾrɜ"
+
+# Start patterns of the IPA of a word (term/replacement), grouped by their
+# first char so a word only checks the ones that can match.
+# Every replacement starts with the same char as its term.
+START_TERMS = [
+    ("aʊfɛʁ", "aʊfʔɛɐ"),
+    ("apɛʁ", "aːbɐ"),
+    ("anɛʁ", "anʔɛɐ"),
+    ("aneːɐ", "anʔɛɐ"),
+    ("ʊnɛʁ", "ʊnʔɛɐ"),
+    ("aʊsɛʁ", "aʊsʔɛɐ"),
+    ("mɪtɛʁ", "mɪtʔɛɐ"),
+    ("foːʁɛʁ", "foːɐʔɛɐ"),
+    ("ɛʁoːb", "ɛɐʔoːb"),
+    ("bəaɪ", "bəʔaɪ"),
+]
+_START_TERMS_BY_CHAR = {}
+for _term, _replacement in START_TERMS:
+    _START_TERMS_BY_CHAR.setdefault(_term[0], []).append((_term, _replacement))
+
+# The bits of a word's trigger mask (see `_word_triggers`).
+# A rule group only runs for words whose mask has its bit set.
+TRIGGER_R = 1  # an "r" in the word or an R sound in its IPA.
+TRIGGER_START = 2  # the word or its IPA starts like a start pattern.
+TRIGGER_SUFFIX = 4  # the word or its IPA can end like an ending pattern.
+TRIGGER_SCHWA = 8  # a schwa in the IPA.
+TRIGGER_STRESS = 16  # stress marks in eSpeak's IPA.
+RULE_GROUPS = {
+    "r": TRIGGER_R,
+    "start": TRIGGER_START,
+    "suffix": TRIGGER_SUFFIX,
+    "schwa": TRIGGER_SCHWA,
+    "stress": TRIGGER_STRESS,
+}
+_START_IPA_CHARS = frozenset(_START_TERMS_BY_CHAR) | frozenset("fɛyʊY")
+_START_WORD_CHARS = frozenset("zhdef")
+_SUFFIX_WORD_CHARS = frozenset("hnrt")
+_SUFFIX_IPA_CHARS = frozenset("ɡkx")
+
+# Set `count_rule_groups` to True to count, per rule group,
+# how many words ran it and how many skipped it: {group: [run, skipped]}.
+count_rule_groups = False
+rule_group_counts = {group: [0, 0] for group in RULE_GROUPS}
+
+
+def _word_triggers(orig: str, ipa: str, old_ipa: str) -> int:
+    """
+    Returns the trigger mask of a word from its lowercase spelling,
+    its IPA without stress marks and eSpeak's original IPA.
+    """
+    chars = frozenset(ipa)
+    triggers = 0
+    if "r" in orig or not chars.isdisjoint(R_CHARS):
+        triggers |= TRIGGER_R
+    if orig[0] in _START_WORD_CHARS or ipa[:1] in _START_IPA_CHARS:
+        triggers |= TRIGGER_START
+    if orig[-1] in _SUFFIX_WORD_CHARS or not chars.isdisjoint(_SUFFIX_IPA_CHARS):
+        triggers |= TRIGGER_SUFFIX
+    if "ə" in chars:
+        triggers |= TRIGGER_SCHWA
+    if "ˈ" in old_ipa or "ˌ" in old_ipa:
+        triggers |= TRIGGER_STRESS
+    return triggers
+
+
+def _count_rule_groups(triggers: int, with_stresses: bool) -> None:
+    for group, bit in RULE_GROUPS.items():
+        if group != "stress" or with_stresses:
+            rule_group_counts[group][0 if triggers & bit else 1] += 1
+
+
+_ONSET_CLUSTERS = ["tʁ", "pl", "pʁ"]  # after "ʃ".
+_AFFRICATES = ["ts", "pf", "dʒ"]
+_LENGTH_MARKS = "ːˑ"
+
+
+def _nuclei(ipa: str) -> list:
+    """
+    Returns the (start, end) of every run of vowels (a syllable's vowels)
+    of IPA without stress marks.
+    """
+    nuclei = []
+    start = -1
+    for i, c in enumerate(ipa):
+        if c in VOWELS:
+            if start < 0:
+                start = i
+        elif start >= 0 and c != "ː":
+            nuclei.append((start, i))
+            start = -1
+    if start >= 0:
+        nuclei.append((start, len(ipa)))
+    return nuclei
+
+
+def _align_nuclei(old_nuclei: list, new_nuclei: list) -> list:
+    """
+    Returns the index of the matching vowels in `new_nuclei`
+    for each of the `old_nuclei` (or None if they were dropped),
+    when the rewrite changed how many syllables there are.
+    """
+    matches = [None] * len(old_nuclei)
+    matcher = SequenceMatcher(None, old_nuclei, new_nuclei, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "insert":
+            continue
+        for offset in range(i2 - i1):
+            # Vowels without a counterpart go to the next ones that are left.
+            j = j1 + min(offset, j2 - j1)
+            matches[i1 + offset] = j if j < len(new_nuclei) else None
+    return matches
+
+
+def _stress_positions(old_ipa: str, ipa: str) -> list:
+    """
+    Returns the (index, mark) of every stress mark of eSpeak's `old_ipa`
+    in the rewritten `ipa` (without any stress marks), each placed
+    in front of the vowels of its syllable. The syllables of the two are
+    aligned by their vowels, so rewrites of any length around them
+    don't move the stresses.
+    """
+    marks = []
+    for i, c in enumerate(old_ipa):
+        if c == "ˈ" or c == "ˌ":
+            marks.append((i - len(marks), c))
+    raw = old_ipa.replace("ˈ", "").replace("ˌ", "")
+    if raw == ipa:  # nothing was rewritten.
+        return marks
+
+    old_nuclei = _nuclei(raw)
+    new_nuclei = _nuclei(ipa)
+    if len(old_nuclei) == len(new_nuclei):
+        matches = range(len(old_nuclei))
+    else:
+        matches = _align_nuclei(
+            [raw[start:end] for start, end in old_nuclei],
+            [ipa[start:end] for start, end in new_nuclei],
+        )
+    old_starts = [start for start, _ in old_nuclei]
+
+    positions = []
+    for index, mark in marks:
+        # eSpeak puts a mark in front of vowels, or between two of them.
+        nucleus = bisect_right(old_starts, index) - 1
+        if nucleus < 0 or index >= old_nuclei[nucleus][1]:
+            nucleus += 1
+            offset = 0
+        else:
+            # Counted in vowels, since the rewrite may lengthen them (io -> iːoː).
+            old_start = old_starts[nucleus]
+            offset = sum(c not in _LENGTH_MARKS for c in raw[old_start:index])
+        j = matches[nucleus] if nucleus < len(matches) else None
+        if j is not None:
+            start, end = new_nuclei[j]
+            positions.append((_nth_vowel(ipa, start, end, offset), mark))
+    return positions
+
+
+def _nth_vowel(ipa: str, start: int, end: int, n: int) -> int:
+    """
+    Returns the index of the `n`-th vowel (from 0, not counting length marks)
+    of the nucleus ipa[start:end], or of its last character if it has fewer.
+    """
+    i = start
+    while i < end and (n > 0 or ipa[i] in _LENGTH_MARKS):
+        if ipa[i] not in _LENGTH_MARKS:
+            n -= 1
+        i += 1
+    return min(i, end - 1)
+
+
+def _move_before_onset(ipa: str, index: int, first_vowel: int) -> int:
+    """
+    Returns where a stress mark in front of `index` goes once it's moved
+    in front of the consonants its syllable starts with.
+    """
+    while index > 0 and (
+        index <= first_vowel
+        or (ipa[index - 1] == "ʃ" and ipa[index : index + 1] in "ʁtvlp")
+        or (
+            index > 1
+            and ipa[index - 2] == "ʃ"
+            and ipa[index - 1 : index + 1] in _ONSET_CLUSTERS
+        )
+        or ipa[index - 1 : index + 1] in _AFFRICATES
+        or (
+            ipa[index : index + 1] not in CONSONANTS + "h"
+            and ipa[index - 1] in CONSONANTS + "ʁh"
+        )
+    ):
+        index -= 1
+    return index
+
+
+def _unique_marks(positions: list) -> list:
+    """
+    Returns the (index, mark) positions sorted, without duplicates
+    and without a secondary stress where there's a primary one.
+    """
+    positions = sorted(set(positions))  # "ˈ" sorts before "ˌ".
+    return [
+        position
+        for i, position in enumerate(positions)
+        if i == 0 or position[0] != positions[i - 1][0]
+    ]
+
+
+def _remove_excessive_stresses(positions: list, stress_at: int) -> list:
+    """
+    Returns the sorted positions without a lone primary stress
+    if it's at `stress_at`, and without a secondary stress at the very start.
+    """
+    if len(positions) == 1 and positions[0] == (stress_at, "ˈ"):
+        return []
+    if len(positions) > 0 and positions[0] == (0, "ˌ"):
+        return positions[1:]
+    return positions
+
+
+def _put_stresses_back(
+    old_ipa: str,
+    ipa: str,
+    remove_excessive_stresses: bool = True,
+    move_stresses_before_consonants: bool = True,
+) -> str:
+    """
+    Returns the improved `ipa` of a word with the primary and secondary stresses
+    of eSpeak's original `old_ipa` put back in the matching places.
+    """
+    positions = _unique_marks(_stress_positions(old_ipa, ipa))
+    first_vowel = next((i for i, c in enumerate(ipa) if c in VOWELS), -1)
+
+    if remove_excessive_stresses:
+        # A lone stress on the first syllable goes without saying.
+        positions = _remove_excessive_stresses(positions, first_vowel)
+
+    if move_stresses_before_consonants and len(positions) > 0:
+        positions = _unique_marks(
+            [
+                (_move_before_onset(ipa, index, first_vowel), mark)
+                for index, mark in positions
+            ]
+        )
+        if remove_excessive_stresses:
+            positions = _remove_excessive_stresses(positions, 0)
+
+    if len(positions) == 0:
+        return ipa
+
+    parts = []
+    last = 0
+    for index, mark in positions:
+        parts.append(ipa[last:index])
+        parts.append(mark)
+        last = index
+    parts.append(ipa[last:])
+    return "".join(parts)
+
+
+def _normalise_raw_word(ipa: str) -> str:
+    """
+    Returns eSpeak's IPA of a word without language flags,
+    punctuation or stress marks.
+    """
+    ipa = remove_punctuation(remove_parentheses(ipa))
+    return keep_latin_and_ipa(ipa.replace("ˈ", "").replace("ˌ", ""))
+
+
+def _improve_ipa(
+    german: str, ipa: str, hyphen_word_indices: list, profile: str = DEFAULT_PROFILE
+) -> str:
+    """
+    Returns eSpeak's IPA for the prepared `german` text
+    rewritten to more closely resemble Wiktionary's transcriptions,
+    as far as the `profile` asks for (see PROFILES).
+    """
     # R and Y are placeholders.
+    with_stresses = profile == "full"
     REMOVE_EXCESSIVE_STRESSES = True
     COLLAPSE_SCHWAS = True  # IPA wise: Rasen -> Ras'n
     MOVE_STRESSES_BEFORE_CONSONANTS = True
@@ -103,25 +487,9 @@ def german_to_ipa(german: str) -> str:
     SILENT_LETTER_L = "ḷ"
     SILENT_LETTER_N = "ṇ"
     SILENCING_CONSONANTS = "bçdfɡkpsʃtvxz"
-    CONSONANTS = "Rbxçdfɡjkll̩mm̩nn̩ŋpzsʃtvʔʒ"
-    VOWELS = "Yaɛeɪiɔoœøʊuʏyə"
     MAYBE_LONG_IPA = "Yaɛ"
     ALWAYS_LONG_IPA = "eioøuy"
 
-    # Convert any numbers into German words.
-    german = replace_nums_with_german(german)
-
-    german, hyphen_word_indices = remove_joining_chars(german, " ")
-
-    ipa = phonemize(
-        german,
-        language="de",
-        backend="espeak",  # uses espeak backend
-        strip=True,
-        preserve_punctuation=True,
-        with_stress=True,
-    )
-
     ipa = ipa.replace("ɛsɪst", "ɛs ɪst")
     ipa = ipa.replace("ɑ", "a")
 
@@ -131,11 +499,21 @@ def german_to_ipa(german: str) -> str:
     ipa_words = ipa.split(" ")
 
     if len(orig_words) != len(ipa_words):
+        if _metrics.enabled:
+            _metrics.ALIGNMENT_FAILURES.inc(kind="words")
         print("ERROR: `orig_words` and `ipa_words` have mismatching lengths.")
         print(orig_words)
         print(ipa_words)
         return ""
 
+    if profile == "raw-normalised":
+        results = [
+            _normalise_raw_word(ipa)
+            for orig, ipa in zip(orig_words, ipa_words)
+            if len(keep_latin_and_ipa(remove_punctuation(orig))) > 0
+        ]
+        return _join_words(results, archived_ipa, hyphen_word_indices)
+
     results = []
     for orig, ipa in zip(orig_words, ipa_words):
         orig = remove_punctuation(orig)
@@ -174,24 +552,32 @@ def german_to_ipa(german: str) -> str:
         if len(orig) == 0:
             continue
 
+        # Rule groups whose trigger chars are absent from the word are skipped.
+        triggers = _word_triggers(orig, ipa, old_ipa)
+        if count_rule_groups:
+            _count_rule_groups(triggers, with_stresses)
+
         # Do baseline replacements.
-        if ipa.endswith("ɾ"):
-            ipa = ipa[:-1] + "ɐ"
+        if triggers & TRIGGER_R:
+            if ipa.endswith("ɾ"):
+                ipa = ipa[:-1] + "ɐ"
+
+            ipa = ipa.replace("ɜ", "ɐ")
 
-        ipa = ipa.replace("ɜ", "ɐ")
         ipa = ipa.replace("ɔø", "ɔɪ")
 
-        pattern = rf"(?<=[{CONSONANTS}])([ɐʁɾrɜ])(?=[{CONSONANTS}])"
-        ipa = re.sub(pattern, "ɐ", ipa)
+        if triggers & TRIGGER_R:
+            pattern = rf"(?<=[{CONSONANTS}])([ɐʁɾrɜ])(?=[{CONSONANTS}])"
+            ipa = re.sub(pattern, "ɐ", ipa)
 
-        pattern = rf"(?<=[{CONSONANTS}])([ɐʁɾrɜ])(?![{CONSONANTS}])"
-        ipa = re.sub(pattern, "ʁ", ipa)
+            pattern = rf"(?<=[{CONSONANTS}])([ɐʁɾrɜ])(?![{CONSONANTS}])"
+            ipa = re.sub(pattern, "ʁ", ipa)
 
-        pattern = rf"(?<=[{VOWELS}])([ɐʁɾrɜ])(?=[{CONSONANTS}])"
-        ipa = re.sub(pattern, "ʁ", ipa)
+            pattern = rf"(?<=[{VOWELS}])([ɐʁɾrɜ])(?=[{CONSONANTS}])"
+            ipa = re.sub(pattern, "ʁ", ipa)
 
-        if ipa.endswith("ʁ"):
-            ipa = ipa[:-1] + "ɐ"
+            if ipa.endswith("ʁ"):
+                ipa = ipa[:-1] + "ɐ"
 
         if word_is_capitalized:
             if orig.endswith("ende") and ipa.endswith("əndə"):
@@ -199,55 +585,58 @@ def german_to_ipa(german: str) -> str:
             elif orig.endswith("endes") and ipa.endswith("əndəs"):
                 ipa = ipa[:-4] + "ʔɛndəs"
 
-        if len(ipa) >= 5:
-            if any(ipa.startswith(l) for l in ["fɛʁ", "fYR"]):
-                ipa = "fɛɐ" + ipa[3:]
-            elif any(ipa.startswith(l) for l in ["ɛʁ", "YR"]):
-                ipa = "ɛɐ" + ipa[2:]
-
-        # Break the word apart by any R characters.
-        words_parts = break_word_by_r(orig)
-        ipa_parts = break_ipa_by_r(ipa)
-        if len(words_parts) == len(ipa_parts):
-            if words_parts[-1].endswith("er") and ipa_parts[-1].endswith("YR"):
-                ipa_parts[-1] = ipa_parts[-1][:-2] + "eɐ"
-
-            for i, (word_part, ipa_part) in enumerate(zip(words_parts, ipa_parts)):
-                # Check for various ways a word piece ending with R
-                # can specifically end.
-                if "är" in word_part:
-                    for key in ["er", "YR", "ɛr"]:
-                        ipa_parts[i] = ipa_parts[i].replace(key, "ɛɐ")
-
-                elif word_part.endswith("ver") and i < len(words_parts):
-                    matched = False
-                    for key in ["fer", "fYR", "fɛr"]:
-                        if key in ipa_parts[i]:
-                            ipa_parts[i] = ipa_parts[i].replace(key, "fɛɐ")
-                            matched = True
-                    if matched and i > 0:
-                        prev_part = ipa_parts[i - 1]
-                        if any(prev_part.endswith(l) for l in ["ɛʁ", "YR"]):
-                            ipa_parts[i - 1] = prev_part[:-2] + "ɐ"
-
-                elif word_part.endswith("vor") and i < len(words_parts):
-                    matched = False
-                    for key in ["fɔɐ", "foʁ"]:
-                        if key in ipa_parts[i]:
-                            ipa_parts[i] = ipa_parts[i].replace(key, "foɐ")
-                            matched = True
-                    if matched and i > 0:
-                        prev_part = ipa_parts[i - 1]
-                        if any(prev_part.endswith(l) for l in ["ɛʁ", "YR"]):
-                            ipa_parts[i - 1] = prev_part[:-2] + "ɐ"
-
-            orig = "".join(words_parts)
-            ipa = "".join(ipa_parts)
-        else:
-            print("ERROR: `orig_parts` and `ipa_parts` have mismatching lengths.")
-            print(words_parts)
-            print(ipa_parts)
-            return ""
+        if triggers & TRIGGER_R:
+            if len(ipa) >= 5:
+                if any(ipa.startswith(l) for l in ["fɛʁ", "fYR"]):
+                    ipa = "fɛɐ" + ipa[3:]
+                elif any(ipa.startswith(l) for l in ["ɛʁ", "YR"]):
+                    ipa = "ɛɐ" + ipa[2:]
+
+            # Break the word apart by any R characters.
+            words_parts = break_word_by_r(orig)
+            ipa_parts = break_ipa_by_r(ipa)
+            if len(words_parts) == len(ipa_parts):
+                if words_parts[-1].endswith("er") and ipa_parts[-1].endswith("YR"):
+                    ipa_parts[-1] = ipa_parts[-1][:-2] + "eɐ"
+
+                for i, (word_part, ipa_part) in enumerate(zip(words_parts, ipa_parts)):
+                    # Check for various ways a word piece ending with R
+                    # can specifically end.
+                    if "är" in word_part:
+                        for key in ["er", "YR", "ɛr"]:
+                            ipa_parts[i] = ipa_parts[i].replace(key, "ɛɐ")
+
+                    elif word_part.endswith("ver") and i < len(words_parts):
+                        matched = False
+                        for key in ["fer", "fYR", "fɛr"]:
+                            if key in ipa_parts[i]:
+                                ipa_parts[i] = ipa_parts[i].replace(key, "fɛɐ")
+                                matched = True
+                        if matched and i > 0:
+                            prev_part = ipa_parts[i - 1]
+                            if any(prev_part.endswith(l) for l in ["ɛʁ", "YR"]):
+                                ipa_parts[i - 1] = prev_part[:-2] + "ɐ"
+
+                    elif word_part.endswith("vor") and i < len(words_parts):
+                        matched = False
+                        for key in ["fɔɐ", "foʁ"]:
+                            if key in ipa_parts[i]:
+                                ipa_parts[i] = ipa_parts[i].replace(key, "foɐ")
+                                matched = True
+                        if matched and i > 0:
+                            prev_part = ipa_parts[i - 1]
+                            if any(prev_part.endswith(l) for l in ["ɛʁ", "YR"]):
+                                ipa_parts[i - 1] = prev_part[:-2] + "ɐ"
+
+                orig = "".join(words_parts)
+                ipa = "".join(ipa_parts)
+            else:
+                if _metrics.enabled:
+                    _metrics.ALIGNMENT_FAILURES.inc(kind="parts")
+                print("ERROR: `orig_parts` and `ipa_parts` have mismatching lengths.")
+                print(words_parts)
+                print(ipa_parts)
+                return ""
 
         ipa = ipa.replace("hɪŋ", "hɪnɡ")
         ipa = ipa.replace("aʊsç", "aʊsʃ")
@@ -289,7 +678,7 @@ def german_to_ipa(german: str) -> str:
             maybe_i = 0
             for i, c in enumerate(ipa):
                 if c in MAYBE_LONG_IPA:
-                    if maybe_is_long[maybe_i]:
+                    if maybe_i < len(maybe_is_long) and maybe_is_long[maybe_i]:
                         parts.append(ipa[last_i : i + 1] + "ː")
                     else:
                         parts.append(ipa[last_i : i + 1])
@@ -304,234 +693,98 @@ def german_to_ipa(german: str) -> str:
 
         Starting patterns. (term/replacement)
         """
-        terms = [
-            ("aʊfɛʁ", "aʊfʔɛɐ"),
-            ("apɛʁ", "aːbɐ"),
-            ("anɛʁ", "anʔɛɐ"),
-            ("aneːɐ", "anʔɛɐ"),
-            ("ʊnɛʁ", "ʊnʔɛɐ"),
-            ("aʊsɛʁ", "aʊsʔɛɐ"),
-            ("mɪtɛʁ", "mɪtʔɛɐ"),
-            ("foːʁɛʁ", "foːɐʔɛɐ"),
-            ("ɛʁoːb", "ɛɐʔoːb"),
-            ("bəaɪ", "bəʔaɪ"),
-        ]
-        for term, replacement in terms:
-            if ipa.startswith(term):
-                ipa = replacement + ipa[len(term) :]
-
-        def replace_start(
-            txt: str,
-            term: str,
-            replacement: str,
-            next_chars: list,
-        ) -> str:
-            """
-            Returns the `txt with the `term` replaced with the `replacement`,
-            but the original `term` is only replaced
-            if the following char in the `txt` is in the given `next_chars`.
-            """
+        if triggers & TRIGGER_START:
+            for term, replacement in _START_TERMS_BY_CHAR.get(ipa[:1], []):
+                if ipa.startswith(term):
+                    ipa = replacement + ipa[len(term) :]
+
+            def replace_start(
+                txt: str,
+                term: str,
+                replacement: str,
+                next_chars: list,
+            ) -> str:
+                """
+                Returns the `txt with the `term` replaced with the `replacement`,
+                but the original `term` is only replaced
+                if the following char in the `txt` is in the given `next_chars`.
+                """
+                if (
+                    len(txt) > len(term)
+                    and txt.startswith(term)
+                    and txt[len(term)] in next_chars
+                ):
+                    txt = replacement + txt[len(term) :]
+                return txt
+
+            ipa = replace_start(ipa, "foːʁ", "foːɐ", next_chars=CONSONANTS + "ʁ")
+            ipa = replace_start(
+                ipa, "ɛmpɔʁ", "ɛmpoːɐ", next_chars=CONSONANTS + "ʁ"
+            )
+            ipa = replace_start(ipa, "yːbʁ", "yːbɐ", next_chars=CONSONANTS + "ʁ")
+            ipa = replace_start(ipa, "yːbʁ", "yːbɐʔ", next_chars=VOWELS)
+            ipa = replace_start(ipa, "ʊntʁ", "ʊntɐ", next_chars=CONSONANTS + "ʁ")
+            ipa = replace_start(ipa, "ʊntʁ", "ʊntɐʔ", next_chars=VOWELS)
+
+            if orig.startswith("zer"):
+                if ipa.startswith("tseːɐtiːfi"):
+                    ipa = "tsɛʁtifi" + ipa[10:]
+                elif ipa.startswith("tsɛʁ"):
+                    ipa = "tsɛɐ" + ipa[4:]
+            elif orig.startswith("hervor") and ipa.startswith("hɐfoːɐ"):
+                ipa = "hɛɐfoːɐ" + ipa[6:]
+            elif orig.startswith("der"):
+                for key in ["deːʁ", "dɛːʁ", "dɛʁ"]:
+                    if ipa.startswith(key):
+                        ipa = "deːɐ" + ipa[len(key) :]
+                        break
+            elif orig.startswith("ernst") and ipa.startswith("ɛɐnst"):
+                ipa = "ɛʁnst" + ipa[5:]
+            elif orig.startswith("fuß") and ipa.startswith("fʊs"):
+                ipa = "fuːs" + ipa[3:]
+
+        if triggers & TRIGGER_SUFFIX:
             if (
-                len(txt) > len(term)
-                and txt.startswith(term)
-                and txt[len(term)] in next_chars
+                len(orig) > 5
+                and orig.endswith("haft")
+                and orig[-5] != "c"
+                and ipa[-4] != "h"
+                and ipa.endswith("aft")
             ):
-                txt = replacement + txt[len(term) :]
-            return txt
-
-        ipa = replace_start(ipa, "foːʁ", "foːɐ", next_chars=CONSONANTS + "ʁ")
-        ipa = replace_start(ipa, "ɛmpɔʁ", "ɛmpoːɐ", next_chars=CONSONANTS + "ʁ")
-        ipa = replace_start(ipa, "yːbʁ", "yːbɐ", next_chars=CONSONANTS + "ʁ")
-        ipa = replace_start(ipa, "yːbʁ", "yːbɐʔ", next_chars=VOWELS)
-        ipa = replace_start(ipa, "ʊntʁ", "ʊntɐ", next_chars=CONSONANTS + "ʁ")
-        ipa = replace_start(ipa, "ʊntʁ", "ʊntɐʔ", next_chars=VOWELS)
-
-        if orig.startswith("zer"):
-            if ipa.startswith("tseːɐtiːfi"):
-                ipa = "tsɛʁtifi" + ipa[10:]
-            elif ipa.startswith("tsɛʁ"):
-                ipa = "tsɛɐ" + ipa[4:]
-        elif orig.startswith("hervor") and any(ipa.startswith(l) for l in ["hɐfoːɐ"]):
-            ipa = "hɛɐfoːɐ" + ipa[6:]
-        elif orig.startswith("der"):
-            for key in ["deːʁ", "dɛːʁ", "dɛʁ"]:
-                if ipa.startswith(key):
-                    ipa = "deːɐ" + ipa[len(key) :]
-                    break
-        elif orig.startswith("ernst") and ipa.startswith("ɛɐnst"):
-            ipa = "ɛʁnst" + ipa[5:]
-        elif orig.startswith("fuß") and ipa.startswith("fʊs"):
-            ipa = "fuːs" + ipa[3:]
-
-        if (
-            len(orig) > 5
-            and orig.endswith("haft")
-            and orig[-5] != "c"
-            and ipa[-4] != "h"
-            and ipa.endswith("aft")
-        ):
-            ipa = ipa[:-3] + "haft"
-        elif orig.endswith("tuch") and ipa.endswith("tʊx"):
-            ipa = ipa[:-3] + "tuːx"
-        elif orig.endswith("tücher") and ipa.endswith("tʏçɐ"):
-            ipa = ipa[:-4] + "tyçɐ"
-        elif orig.endswith("tüchern") and ipa.endswith("tʏçɐn"):
-            ipa = ipa[:-5] + "tyçɐn"
-        elif ipa[:-1].endswith("ɛɐk"):
-            ipa = ipa[:-4] + "ɛʁk" + ipa[-1]
-        elif ipa.endswith("ɪɡtən"):
-            ipa = ipa[:-5] + "ɪçtən"
-        elif ipa[:-1].endswith("ɪɡt"):
-            ipa = ipa[:-4] + "ɪçt" + ipa[-1]
-        elif ipa.endswith("ɪɡt"):
-            ipa = ipa[:-3] + "ɪçt"
+                ipa = ipa[:-3] + "haft"
+            elif orig.endswith("tuch") and ipa.endswith("tʊx"):
+                ipa = ipa[:-3] + "tuːx"
+            elif orig.endswith("tücher") and ipa.endswith("tʏçɐ"):
+                ipa = ipa[:-4] + "tyçɐ"
+            elif orig.endswith("tüchern") and ipa.endswith("tʏçɐn"):
+                ipa = ipa[:-5] + "tyçɐn"
+            elif ipa[:-1].endswith("ɛɐk"):
+                ipa = ipa[:-4] + "ɛʁk" + ipa[-1]
+            elif ipa.endswith("ɪɡtən"):
+                ipa = ipa[:-5] + "ɪçtən"
+            elif ipa[:-1].endswith("ɪɡt"):
+                ipa = ipa[:-4] + "ɪçt" + ipa[-1]
+            elif ipa.endswith("ɪɡt"):
+                ipa = ipa[:-3] + "ɪçt"
         """
 
 
         Put the primary and secondary stresses back.
         """
-        primary_indices = []
-        secondary_indices = []
-
-        for i, c in enumerate(old_ipa):
-            if c == "ˈ":
-                primary_indices.append(i)
-            elif c == "ˌ":
-                secondary_indices.append(i)
-
-        def find_before(indices: list) -> list:
-            """
-            Returns a list of indices
-            where a stress char should be added before.
-            """
-            add_before = []
-            for i in indices:
-                before = old_ipa[i - 1] if i - 1 >= 0 else None
-                after = old_ipa[i + 1] if i + 1 < len(old_ipa) else None
-
-                start_j = max(0, i - 1)
-                end_j = min(len(ipa) - 1, i + 1)
-                for j in range(start_j, end_j + 1):
-                    if ipa[j] == "ː":
-                        continue
-
-                    c_before_j = ipa[j - 1] if j >= 0 else None
-                    c_after_j = ipa[j] if j < len(ipa) else None
-                    offset = 0
-
-                    if c_before_j == "ː":
-                        c_before_j = ipa[j - 2] if j - 2 >= 0 else None
-
-                    elif c_after_j == "ː":
-                        if j + 1 < len(ipa):
-                            c_after_j = ipa[j + 1]
-                            offset = 1
-                        else:
-                            c_after_j = None
-
-                    if (before == c_before_j and before is not None) or (
-                        after == c_after_j and after is not None
-                    ):
-                        add_before.append(j + offset)
-                        break
-
-            return add_before
-
-        add_primary_before = find_before(primary_indices)
-        add_secondary_before = find_before(secondary_indices)
-        for i in sorted(add_primary_before, reverse=True):
-            ipa = ipa[:i] + "ˈ" + ipa[i:]
-
-        add_secondary_before = [
-            i + len([p_i for p_i in add_primary_before if p_i <= i])
-            for i in add_secondary_before
-        ]
-
-        for i in sorted(add_secondary_before, reverse=True):
-            ipa = ipa[:i] + "ˌ" + ipa[i:]
-
-        if REMOVE_EXCESSIVE_STRESSES:
-            if ipa.startswith("ˌ"):
-                ipa = ipa[1:]
-            if len(add_primary_before) == 1 and len(add_secondary_before) == 0:
-                first_vowel_indices = []
-                in_vowels = False
-                for i, c in enumerate(ipa):
-                    if c in VOWELS:
-                        if not in_vowels:
-                            in_vowels = True
-                            first_vowel_indices.append(i)
-                    else:
-                        in_vowels = False
-
-                if len(first_vowel_indices) > 0:
-                    primary_index = ipa.find("ˈ")
-                    if primary_index == first_vowel_indices[0] - 1:
-                        ipa = ipa[:primary_index] + ipa[primary_index + 1 :]
-
-        if MOVE_STRESSES_BEFORE_CONSONANTS:
-            primary_indices = [i for i, c in enumerate(ipa) if c == "ˈ"]
-            secondary_indices = [i for i, c in enumerate(ipa) if c == "ˌ"]
-            if len(primary_indices) > 0 or len(secondary_indices) > 0:
-                primary_indices.reverse()
-                secondary_indices.reverse()
-
-                def move_indices_back(indices: list) -> list:
-                    results = indices[:]
-                    first_vowel_index = next(
-                        (i for i, c in enumerate(ipa) if c in VOWELS), -1
-                    )
-                    for i in range(len(results)):
-                        while results[i] > 0 and (
-                            results[i] < first_vowel_index
-                            or (
-                                ipa[results[i] - 1] == "ʃ"
-                                and ipa[results[i]] in "ʁtvlp"
-                            )
-                            or (
-                                results[i] > 1
-                                and ipa[results[i] - 2] == "ʃ"
-                                and ipa[results[i] - 1 : results[i] + 1]
-                                in ["tʁ", "pl", "pʁ"]
-                            )
-                            or (
-                                ipa[results[i] - 1 : results[i] + 1]
-                                in ["ts", "pf", "dʒ"]
-                            )
-                            or (
-                                ipa[results[i]] not in CONSONANTS + "h"
-                                and ipa[results[i] - 1] in CONSONANTS + "ʁh"
-                            )
-                        ):
-                            results[i] -= 1
-
-                    return sorted(list(set(results)), reverse=True)
-
-                primary_indices_to = move_indices_back(primary_indices)
-                secondary_indices_to = move_indices_back(secondary_indices)
-
-                for start, end in zip(primary_indices, primary_indices_to):
-                    ipa = ipa[:start] + ipa[start + 1 :]
-                    ipa = ipa[:end] + "ˈ" + ipa[end:]
-
-                for start, end in zip(secondary_indices, secondary_indices_to):
-                    ipa = ipa[:start] + ipa[start + 1 :]
-                    ipa = ipa[:end] + "ˌ" + ipa[end:]
-
-                if REMOVE_EXCESSIVE_STRESSES:
-                    if ipa.startswith("ˌ") or (
-                        len(primary_indices_to) == 1
-                        and len(secondary_indices_to) == 0
-                        and ipa.startswith("ˈ")
-                    ):
-                        ipa = ipa[1:]
+        if with_stresses and triggers & TRIGGER_STRESS:
+            ipa = _put_stresses_back(
+                old_ipa,
+                ipa,
+                REMOVE_EXCESSIVE_STRESSES,
+                MOVE_STRESSES_BEFORE_CONSONANTS,
+            )
 
         ipa = ipa.replace("ˈviːdeːˌɔ", "ˈviːdeoːˌ")
         ipa = ipa.replace("viːdeːoː", "viːdeoː")
         ipa = ipa.replace("taʊzʔɛnd", f"taʊz{VOICELESS_SCHWA}{SILENT_LETTER_N}d")
         ipa = ipa.replace("vɛɐm", "vɛʁm")
 
-        if COLLAPSE_SCHWAS:
+        if COLLAPSE_SCHWAS and triggers & TRIGGER_SCHWA:
             if len(ipa) >= 3 and ipa[-2:] == "ən" and ipa[-3] in SILENCING_CONSONANTS:
                 ipa = ipa[:-2] + VOICELESS_SCHWA + SILENT_LETTER_N
             elif len(ipa) >= 3 and ipa[-2:] == "əl" and ipa[-3] in SILENCING_CONSONANTS:
@@ -581,6 +834,14 @@ def german_to_ipa(german: str) -> str:
                         break
         results.append(ipa)
 
+    return _join_words(results, archived_ipa, hyphen_word_indices)
+
+
+def _join_words(results: list, archived_ipa: str, hyphen_word_indices: list) -> str:
+    """
+    Returns the IPA of the words joined back into one string,
+    with eSpeak's punctuation restored and joined nouns written as one word.
+    """
     # Restore punctuation.
     old_results = archived_ipa.split(" ")
     if len(results) == len(old_results):
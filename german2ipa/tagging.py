@@ -0,0 +1,221 @@
+"""
+File: tagging.py
+
+Description: Finds the nouns in German text and styles them
+             with HTML spans depending on their grammatical gender.
+             This needs nothing but the German text,
+             so it doesn't load eSpeak (or phonemizer) at all.
+
+"""
+
+import html
+from collections import deque
+
+import _metrics
+from _punctuation import PUNCTUATION, remove_punctuation
+from _remove_joining_chars import remove_joining_chars
+from gender.gender import get_gender_of_word
+from gender.get_genders import CONTEXT_WINDOW
+
+DER_SPAN = '<span class="der-noun">'
+DIE_SPAN = '<span class="die-noun">'
+DAS_SPAN = '<span class="das-noun">'
+PLURAL_DER_SPAN = '<span class="plural-der-noun">'
+PLURAL_DIE_SPAN = '<span class="plural-die-noun">'
+PLURAL_DAS_SPAN = '<span class="plural-das-noun">'
+PLURAL_ONLY_SPAN = '<span class="plural-only-noun">'
+SINGULAR_INFINITIVE_SPAN = '<span class="verb-no-plural-noun">'
+
+# Capitalized words that are never treated as nouns.
+SKIPPED_TERMS = {
+    "ich",
+    "du",
+    "er",
+    "wir",
+    "sie",
+    "ihr",
+    "ihm",
+    "ihn",
+    "ihnen",
+    "ihren",
+    "sein",
+    "seinen",
+    "seine",
+    "ihre",
+    "es",
+    "das",
+    "der",
+    "die",
+    "und",
+    "aber",
+    "noch",
+    "ein",
+    "eine",
+    "eines",
+    "einer",
+    "einen",
+    "einem",
+}
+
+
+def get_noun_genders(no_punctuation: str, last_words) -> tuple:
+    """
+    Returns the (genders, confidence) of the noun,
+    falling back to declined forms of it (-n, -es, -s, -en)
+    if the noun itself can't be found.
+    `last_words` are the words before it in the sentence.
+    """
+    genders, confidence = get_gender_of_word(
+        no_punctuation,
+        last_words,
+        can_be_inf_verb=True,
+    )
+    is_infinitive = len(genders) > 0 and genders[0] == "v+"
+    if len(genders) == 0 or (len(genders) == 1 and is_infinitive):
+        changed_end_n = False
+        if (
+            len(no_punctuation) > 1
+            and no_punctuation.endswith("n")
+            and no_punctuation[-2] in "ehlr"
+        ):
+            new_genders, new_confidence = get_gender_of_word(
+                no_punctuation[:-1],
+                last_words,
+                can_be_inf_verb=False,  # b/c shortened
+            )
+            if new_confidence >= 80 and new_confidence >= confidence:
+                genders, confidence = new_genders, new_confidence
+                changed_end_n = True
+
+        elif no_punctuation.endswith("es"):
+            new_genders, new_confidence = get_gender_of_word(
+                no_punctuation[:-2],
+                last_words,
+                can_be_inf_verb=False,  # b/c shortened
+            )
+            if (
+                new_confidence >= 80
+                and new_confidence >= confidence
+                and any(g[:2] in ["sm", "sn"] for g in new_genders)
+            ):
+                genders, confidence = (
+                    new_genders,
+                    new_confidence,
+                )  # assumed genitiv.
+
+        if no_punctuation.endswith("s") and len(genders) == 0:
+            new_genders, new_confidence = get_gender_of_word(
+                no_punctuation[:-1],
+                last_words,
+                can_be_inf_verb=(
+                    len(no_punctuation) > 1 and no_punctuation[-2] == "n"
+                ),
+            )
+            if (
+                new_confidence >= 80
+                and new_confidence >= confidence
+                and any(g[:2] in ["sm", "sn", "v+"] for g in new_genders)
+            ):
+                genders, confidence = (
+                    new_genders,
+                    new_confidence,
+                )  # assumed genitiv.
+
+        if confidence < 90 and no_punctuation.endswith("en"):
+            new_genders, new_confidence = get_gender_of_word(
+                no_punctuation[:-2],
+                last_words,
+                can_be_inf_verb=False,
+            )
+            if new_confidence >= 80 and new_confidence >= confidence:
+                genders, confidence = new_genders, new_confidence
+                changed_end_n = True
+
+        if changed_end_n and is_infinitive and "v+" not in genders:
+            genders.append("v+")
+
+    return genders, confidence
+
+
+def get_span(genders: list, confidence: int):
+    """
+    Returns the opening HTML span tag for a noun with the given genders,
+    or None if the noun shouldn't be styled.
+    """
+    is_plural = len(genders) > 0 and genders[0].startswith("p")
+
+    if len(genders) == 0:
+        return None
+    elif not is_plural and confidence < 80:
+        return None
+    elif genders[0] == "v+":
+        return SINGULAR_INFINITIVE_SPAN
+    elif genders[0][1] == "m":
+        return PLURAL_DER_SPAN if is_plural else DER_SPAN
+    elif genders[0][1] == "f":
+        return PLURAL_DIE_SPAN if is_plural else DIE_SPAN
+    elif genders[0][1] == "n":
+        return PLURAL_DAS_SPAN if is_plural else DAS_SPAN
+    elif genders[0][1] == "o":
+        return PLURAL_ONLY_SPAN
+
+    return None
+
+
+def tag_words(words: list) -> list:
+    """
+    Returns the span for every word of a sentence (None if it isn't styled).
+    """
+    spans = []
+    last_stripped_words = deque(maxlen=CONTEXT_WINDOW)
+    for word in words:
+        no_punctuation = remove_punctuation(word).strip()
+        span = None
+        if (
+            word[0].isalpha()
+            and word[0].isupper()
+            and not no_punctuation.lower() in SKIPPED_TERMS
+        ):  # noun.
+            genders, confidence = get_noun_genders(no_punctuation, last_stripped_words)
+            span = get_span(genders, confidence)
+            if _metrics.enabled:
+                found = "found" if len(genders) > 0 else "not_found"
+                _metrics.NOUN_LOOKUPS.inc(result=found)
+        spans.append(span)
+
+        if word[-1] in PUNCTUATION:
+            last_stripped_words.clear()
+        else:
+            last_stripped_words.append(no_punctuation)
+
+    return spans
+
+
+def wrap_in_span(text: str, span: str, puncts: str = None) -> str:
+    """
+    Returns the `text` wrapped in the `span`, with its trailing punctuation
+    moved after the span. If `puncts` is given, it's used as that punctuation.
+    The text and the punctuation are escaped for HTML.
+    """
+    core = text.rstrip(PUNCTUATION)
+    if puncts is None:
+        puncts = text[len(core) :]
+    core = html.escape(core, quote=False)
+    return f"{span}{core}</span>{html.escape(puncts, quote=False)}"
+
+
+def tag_genders(german_text: str) -> str:
+    """
+    Returns the German text, escaped for HTML, with its nouns wrapped
+    in HTML spans with a class for their grammatical gender,
+    like `process_sentence` does with `color_by_gender`,
+    but without transcribing anything.
+    """
+    words = german_text.split()
+    spans = tag_words(words)
+    tagged = " ".join(
+        html.escape(word, quote=False) if span is None else wrap_in_span(word, span)
+        for word, span in zip(words, spans)
+    )
+    tagged, _ = remove_joining_chars(tagged, "")
+    return tagged
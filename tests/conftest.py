@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The modules import each other by their own names,
+# like they do when run with `py german2ipa`.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "german2ipa"))
@@ -0,0 +1,32 @@
+from _columnar import ColumnarWriter, open_results
+
+RESULTS = [
+    (
+        'Der <span class="der-noun">Hund</span> schläft.',
+        'deːɐ <span class="der-noun">hʊnt</span> ʃlɛft.',
+    ),
+    ("", ""),
+    (
+        'Die <span class="plural-die-noun">Katzen</span>, &amp; 3 &lt;Mäuse&gt;.',
+        "diː katsn̩, ʊnt dʁaɪ mɔɪzə.",
+    ),
+]
+
+
+def test_columnar_round_trip(tmp_path):
+    path = tmp_path / "mytext-ipa.cols"
+    with ColumnarWriter(path) as writer:
+        writer.write_many(RESULTS)
+
+    results = open_results(path)
+    assert len(results) == len(RESULTS)
+    assert list(results) == [
+        ("Der Hund schläft.", "deːɐ hʊnt ʃlɛft."),
+        ("", ""),
+        ("Die Katzen, & 3 <Mäuse>.", "diː katsn̩, ʊnt dʁaɪ mɔɪzə."),
+    ]
+    words, ipa_words, genders = results.line(2)
+    assert words == ["Die", "Katzen,", "&", "3", "<Mäuse>."]
+    assert ipa_words == ["diː", "katsn̩,", "ʊnt", "dʁaɪ", "mɔɪzə."]
+    assert genders == [None, "plural-die-noun", None, None, None]
+    assert results.line_of_token(3) == 2
@@ -0,0 +1,50 @@
+import pytest
+
+from _nums import num_to_german_ordinal, replace_nums_with_german
+from _segment import split_sentences
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Es waren 1.000 Leute.", "Es waren eintausend Leute."),
+        ("Er trank 3,5 Liter.", "Er trank dreikommafünf Liter."),
+        ("Ein 3er Pack.", "Ein dreier Pack."),
+        ("Am 3. Mai kam er.", "Am dritten Mai kam er."),
+        ("im 21. Jahrhundert", "im einundzwanzigsten Jahrhundert"),
+        ("der 2. Platz", "der zweite Platz"),
+        ("(der 2. Platz)", "(der zweite Platz)"),
+        ("am 3. großen Tag", "am dritten großen Tag"),
+        ("3. Mai", "dritten Mai"),
+        ("Ich bin 30. Dann ging ich.", "Ich bin dreißig. Dann ging ich."),
+    ],
+)
+def test_replace_nums_with_german(text, expected):
+    assert replace_nums_with_german(text) == expected
+
+
+@pytest.mark.parametrize(
+    "number, expected",
+    [
+        (1, "erste"),
+        (20, "zwanzigste"),
+        (101, "einhunderterste"),
+        (1000, "eintausendste"),
+        (10**6, "einmillionste"),
+        (2 * 10**6, "zweimillionste"),
+        (10**9, "einmilliardste"),
+        (2_500_000, "zweimillionenfünfhunderttausendste"),
+    ],
+)
+def test_num_to_german_ordinal(number, expected):
+    assert num_to_german_ordinal(number) == expected
+
+
+def test_split_sentences_shares_the_ordinal_rule():
+    assert split_sentences("Ich bin 30. Dann ging ich.") == [
+        "Ich bin 30.",
+        "Dann ging ich.",
+    ]
+    assert split_sentences("Im 21. Jahrhundert am 3. Mai.") == [
+        "Im 21. Jahrhundert am 3. Mai."
+    ]
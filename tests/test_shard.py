@@ -0,0 +1,52 @@
+import pytest
+
+from _shard import iter_range_lines, merge, shard_range, write_shard
+
+LINES = [f"Zeile {i} mit {'ä' * (i % 7)} Text." for i in range(100)]
+
+
+@pytest.fixture
+def input_path(tmp_path):
+    path = tmp_path / "mytext.txt"
+    path.write_text("".join(f"{line}\n" for line in LINES), encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("count", [1, 3, 7, 150])
+def test_shard_ranges_cover_every_line_once(input_path, count):
+    ranges = [shard_range(input_path, i, count) for i in range(count)]
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == input_path.stat().st_size
+    assert all(ranges[i][1] == ranges[i + 1][0] for i in range(count - 1))
+
+    lines = []
+    for start, end in ranges:
+        lines.extend(iter_range_lines(input_path, start, end))
+    assert lines == LINES
+
+
+def run_shards(input_path, output_path, count, order):
+    for index in order:
+        byte_range = shard_range(input_path, index, count)
+        results = [
+            (line, line.upper()) for line in iter_range_lines(input_path, *byte_range)
+        ]
+        write_shard(results, input_path, output_path, (index, count), byte_range)
+
+
+def test_merge_joins_the_parts_in_order(input_path, tmp_path):
+    output_path = tmp_path / "mytext-ipa.txt"
+    run_shards(input_path, output_path, 4, [2, 0, 3, 1])
+
+    assert merge(input_path, output_path, output_path) == len(LINES)
+    expected = "".join(f"{line}\t{line.upper()}\n" for line in LINES)
+    assert output_path.read_text(encoding="utf-8") == expected
+
+
+def test_merge_refuses_missing_shards(input_path, tmp_path):
+    output_path = tmp_path / "mytext-ipa.txt"
+    run_shards(input_path, output_path, 4, [0, 1, 3])
+
+    with pytest.raises(ValueError):
+        merge(input_path, output_path, output_path)
+    assert not output_path.exists()
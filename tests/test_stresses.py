@@ -0,0 +1,22 @@
+import pytest
+
+from ipa import _put_stresses_back, _stress_positions
+
+
+def test_stress_positions_count_vowels_not_length_marks():
+    # The rewrite lengthened the "i" in front of the stressed "o".
+    assert _stress_positions("rˌeːɡiˈoːn", "ʁeːɡiːoːn") == [(1, "ˌ"), (6, "ˈ")]
+
+
+@pytest.mark.parametrize(
+    "old_ipa, ipa, expected",
+    [
+        ("rˌeːɡiˈoːn", "ʁeːɡiːoːn", "ʁeːɡiːˈoːn"),
+        ("rˌeːlɪɡiˈoːn", "ʁeːlɪɡiːoːn", "ʁeːlɪɡiːˈoːn"),
+        ("tsˈaɪtˌʊŋ", "tsaɪtʊŋ", "ˈtsaɪˌtʊŋ"),
+        ("iːdˈeː", "iːdeː", "iːˈdeː"),
+        ("hˈʊnt", "hʊnt", "hʊnt"),  # a lone stress on the first syllable.
+    ],
+)
+def test_put_stresses_back(old_ipa, ipa, expected):
+    assert _put_stresses_back(old_ipa, ipa) == expected